@@ -1,14 +1,14 @@
 """__init__.py docstring
 
-This method serves as a constructor for the prototype which initializes the database, as well as the CSS and HTML-based design templates, and defines the Flask variables for the test server. 
+This module holds create_app(), the constructor for the prototype which builds the Flask app for a config, initializes the database, as well as the CSS and HTML-based design templates, and registers the pages. website.py, server.py, worker.py, benchmark.py and unit_test.py each create their app with it.
 
 Notes
 -----
     For the sake of convention, database initiallization and user-data/client-side based retrievals have been coded in seperate files.
 
-    config.py initializes the database by creating a client-side directory, followed by setting up the SECRET_KEY Flask variable and the SQLALCHEMY_DATABASE_URI database variable.
+    config.py initializes the database by creating a client-side directory, followed by setting up the SECRET_KEY Flask variable and the SQLALCHEMY_DATABASE_URI database variable. The APP_CONFIG environment variable selects the config.
 
-    loaders.py stores the method that allows for user data to be retrieved from the database by cross-checking user identification numbers with those cached within the database.
+    create_app() sets up the database extension of database.py and the compiled template cache of templating.py, then has each of metrics.py, nplusone.py, profiler.py, loaders.py, fragments.py, live.py, staticfiles.py, assets.py, avatars.py and commands.py add its hooks, routes or commands to the app through its init_app(). The pages, the blueprints of the views package, are registered last, unless the app serves none, as for the worker. What each module does is described in its own docstring.
 
 Flask
 -----
@@ -24,16 +24,48 @@ HTML Templates
 
 """
 
+import os
 from flask import Flask
-from app.config import Config
-from flask_sqlalchemy import SQLAlchemy
-from flask_bootstrap import Bootstrap
-
-app = Flask(__name__)
-app.config.from_object(Config)
-app.static_folder = 'static'
-db = SQLAlchemy(app)
-Bootstrap(app)
-
-# must come after app declaration
-from app import routes, models
+from app.config import CONFIGS
+from app.database import Database
+
+db = Database()
+
+
+def create_app(config=None, views=True):
+    """
+    Builds the Flask app of the website
+
+    Parameters
+    ----------
+    config : String or class
+        The name of a config in CONFIGS or a config class, by default the one named by the APP_CONFIG environment
+        variable, or 'default'
+    views : Boolean
+        Whether to register the pages, which processes that serve no pages, such as the worker, can leave out
+
+    Returns
+    -------
+    Flask
+        The app, with the database, user loader, template helpers, static files and commands set up
+    """
+
+    if config is None:
+        config = os.environ.get('APP_CONFIG', 'default')
+    app = Flask(__name__)
+    app.config.from_object(CONFIGS[config] if isinstance(config, str) else config)
+    # must come before the first use of app.jinja_env, which is created with these options
+    from app.templating import bytecode_cache
+    app.jinja_options = dict(app.jinja_options, bytecode_cache=bytecode_cache(app.config))
+    db.init_app(app)
+    # the models and tasks modules register the tables and background jobs when they are imported
+    from app import models, tasks, migrations, metrics, nplusone, profiler, loaders, fragments, live, staticfiles, \
+        assets, avatars, commands
+    for module in (metrics, nplusone, profiler, loaders, fragments, live, staticfiles, assets, avatars, commands):
+        module.init_app(app)
+    if views:
+        from flask_bootstrap import Bootstrap
+        from app.views import register_blueprints
+        Bootstrap(app)
+        register_blueprints(app)
+    return app
@@ -0,0 +1,250 @@
+"""
+assets.py holds the build step that bundles and minifies the stylesheets and scripts of the templates, and the
+template helper that links them.
+
+Notes
+-----
+    Each bundle in BUNDLES lists the files under app/static it is built from, in the order the templates linked them.
+    Only the files the templates actually need are listed: the login and signup pages linked every vendor library of
+    the theme they were taken from, but only use bootstrap, the iconic font, jQuery and the theme's own files.
+    `flask build-assets` writes each bundle to ASSETS_FOLDER under a name containing a hash of its contents, eg.
+    auth.3f2a1b9c0d.css, and its gzip copy (see staticfiles.py), along with manifest.json mapping bundle names to
+    these files. As a bundle's URL changes
+    whenever its contents do, the files are served from /assets with ASSETS_MAX_AGE and 'immutable' in Cache-Control,
+    so browsers never revalidate them.
+    Until the bundles are built, asset_urls() links each source file from /static instead, as the templates used to.
+    Building a stylesheet:
+        rewrites its relative url()s, eg. to fonts and images, so they still point at the same files from /assets
+        drops the rules of icons no template uses from the icon font stylesheets in ICON_SETS
+        removes comments and whitespace, leaving strings alone
+    Scripts already minified (*.min.js) are copied as they are; others have comments, indentation and blank lines
+    removed, leaving strings alone and keeping line breaks so that statements without semicolons still end where they
+    did.
+
+Methods
+-------
+init_app(app)
+    Adds the asset_urls template global and the /assets route to an app
+build_assets(folder) : dict
+    Builds every bundle into a folder, returning the manifest
+asset_urls(bundle) : list
+    Template global returning the URLs to link for a bundle
+"""
+
+import hashlib
+import json
+import os
+import posixpath
+import re
+from flask import current_app, url_for
+from app.staticfiles import compress, send_precompressed
+
+# bundle name: files under app/static, in the order they are concatenated
+BUNDLES = {
+    'auth.css': ['vendor/bootstrap/css/bootstrap.min.css',
+                 'fonts/iconic/css/material-design-iconic-font.css',
+                 'css/util.css',
+                 'css/main.css'],
+    'auth.js': ['vendor/jquery/jquery-3.2.1.min.js',
+                'js/main.js'],
+    'site.css': ['css/main.css'],
+}
+
+# icon font stylesheets: the prefix of their icon classes, eg. <i class="zmdi zmdi-accounts">
+ICON_SETS = {
+    'fonts/iconic/css/material-design-iconic-font.css': 'zmdi',
+}
+
+MANIFEST = 'manifest.json'
+# the name of a built bundle, eg. auth.3f2a1b9c0d.css
+BUILT = re.compile(r'^[\w-]+\.[0-9a-f]{10}\.(css|js)(\.gz)?$')
+
+CSS_TOKENS = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*.*?\*/)', re.S)
+# strings, including template literals, and comments; a line comment must start a line or follow whitespace, so the
+# slashes of a regular expression such as /a\// are not taken for one
+JS_TOKENS = re.compile(r'("(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`|/\*.*?\*/|(?:^|(?<=\s))//[^\n]*)',
+                       re.S | re.M)
+# the whitespace around a line break, including blank lines
+JS_BLANKS = re.compile(r'[ \t]*\n\s*')
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+_manifest = {'mtime': None, 'files': {}}
+
+
+# region Minification
+
+def minify_css(css):
+    """Removes the comments and unneeded whitespace of a stylesheet, leaving its strings as they are"""
+    parts = []
+    code = ''
+    for index, part in enumerate(CSS_TOKENS.split(css)):
+        if not index % 2:
+            code += part
+        elif not part.startswith('/*'):
+            # the code on either side of a comment is minified as one, and strings are kept as they are
+            parts.extend((minify_css_code(code), part))
+            code = ''
+    parts.append(minify_css_code(code))
+    return ''.join(parts).strip()
+
+
+def minify_css_code(code):
+    """removes the unneeded whitespace of a stretch of a stylesheet without strings or comments"""
+    code = re.sub(r'\s+', ' ', code)
+    code = re.sub(r' ?([{};,>]) ?', r'\1', code)
+    return code.replace(': ', ':').replace(';}', '}')
+
+
+def minify_js(script):
+    """Removes the comments, indentation and blank lines of a script, keeping its strings and line breaks"""
+
+    def drop_comment(match):
+        token = match.group(0)
+        if token.startswith('/*'):
+            # a comment over several lines ends a statement, as a line break does
+            return '\n' if '\n' in token else ' '
+        return '' if token.startswith('//') else token
+
+    script = JS_TOKENS.sub(drop_comment, script)
+    parts = JS_TOKENS.split(script)
+    for index in range(0, len(parts), 2):
+        parts[index] = JS_BLANKS.sub('\n', parts[index])
+    return ''.join(parts).strip()
+
+
+# endregion
+
+# region Building
+
+def used_icons(prefix):
+    """returns the icon classes with the given prefix that appear in the templates"""
+    pattern = re.compile(r'\b{}-[\w-]+'.format(re.escape(prefix)))
+    icons = set()
+    for root, dirs, files in os.walk(current_app.jinja_loader.searchpath[0]):
+        for name in files:
+            if not name.endswith('.html'):
+                continue
+            with open(os.path.join(root, name), encoding='utf-8') as template:
+                icons.update(pattern.findall(template.read()))
+    return icons
+
+
+def drop_unused_icons(css, prefix):
+    """drops the rules of an icon font stylesheet that only style icons no template uses"""
+    icons = used_icons(prefix)
+    rule = re.compile(r'\.({}-[\w-]+):before\s*\{{[^}}]*\}}\s*'.format(re.escape(prefix)))
+    return rule.sub(lambda match: match.group(0) if match.group(1) in icons else '', css)
+
+
+def rebase_urls(css, source, target):
+    """rewrites the relative url()s of a stylesheet under app/static so they work from the target directory"""
+
+    def rebase(match):
+        url = match.group(2)
+        if url.startswith(('/', '#', 'data:')) or '://' in url:
+            return match.group(0)
+        path = posixpath.normpath(posixpath.join(posixpath.dirname(source), url))
+        return 'url({0}{1}{0})'.format(match.group(1), posixpath.relpath(path, target))
+
+    return CSS_URL.sub(rebase, css)
+
+
+def build_bundle(name, sources):
+    """returns the minified contents of a bundle"""
+    contents = []
+    for source in sources:
+        with open(os.path.join(current_app.static_folder, source), encoding='utf-8') as file:
+            text = file.read()
+        if name.endswith('.css'):
+            if source in ICON_SETS:
+                text = drop_unused_icons(text, ICON_SETS[source])
+            # bundles are served from /assets, which is a sibling of /static
+            text = minify_css(rebase_urls(text, posixpath.join('static', source), 'assets'))
+        elif not source.endswith('.min.js'):
+            text = minify_js(text)
+        contents.append(text)
+    # a newline between scripts ends a last statement without a semicolon
+    return '\n'.join(contents) + '\n'
+
+
+def build_assets(folder=None):
+    """
+    Builds every bundle into a folder under a name containing a hash of its contents, and writes the manifest
+
+    Parameters
+    ----------
+    folder : String
+        The directory to write to, ASSETS_FOLDER by default. Bundles left over from earlier builds are removed.
+
+    Returns
+    -------
+    dict
+        The manifest, mapping each bundle name to the name of its built file
+    """
+
+    folder = folder or current_app.config['ASSETS_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    manifest = {}
+    for name, sources in sorted(BUNDLES.items()):
+        contents = build_bundle(name, sources).encode('utf-8')
+        stem, extension = os.path.splitext(name)
+        manifest[name] = '{}.{}{}'.format(stem, hashlib.sha256(contents).hexdigest()[:10], extension)
+        with open(os.path.join(folder, manifest[name]), 'wb') as file:
+            file.write(contents)
+        compress(os.path.join(folder, manifest[name]))
+    kept = set(manifest.values()) | {built + '.gz' for built in manifest.values()}
+    for name in os.listdir(folder):
+        if BUILT.match(name) and name not in kept:
+            os.remove(os.path.join(folder, name))
+    # the manifest is replaced in one step, so running processes never read half of it
+    path = os.path.join(folder, MANIFEST)
+    with open(path + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=2, sort_keys=True)
+    os.replace(path + '.tmp', path)
+    return manifest
+
+
+# endregion
+
+def load_manifest():
+    """returns the manifest of the built bundles, read again whenever the file changes, or {} if there is none"""
+    path = os.path.join(current_app.config['ASSETS_FOLDER'], MANIFEST)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return {}
+    if (path, mtime) != _manifest['mtime']:
+        with open(path) as file:
+            _manifest['files'] = json.load(file)
+        _manifest['mtime'] = (path, mtime)
+    return _manifest['files']
+
+
+def asset_urls(bundle):
+    """
+    Returns the URLs to link for a bundle: its built file once `flask build-assets` has run, otherwise its sources
+
+    Parameters
+    ----------
+    bundle : String
+        The name of a bundle in BUNDLES, eg. 'auth.css'
+    """
+
+    built = load_manifest().get(bundle)
+    if built is not None:
+        return [url_for('asset', filename=built)]
+    return [url_for('static', filename=source) for source in BUNDLES[bundle]]
+
+
+def asset(filename):
+    """Serves a built bundle, which never changes as its name holds a hash of its contents"""
+    max_age = current_app.config['ASSETS_MAX_AGE']
+    response = send_precompressed(current_app.config['ASSETS_FOLDER'], filename, cache_timeout=max_age)
+    response.headers['Cache-Control'] = 'public, max-age={}, immutable'.format(max_age)
+    return response
+
+
+def init_app(app):
+    """Adds the asset_urls template global and the route serving the built bundles to the app"""
+    app.add_template_global(asset_urls)
+    app.add_url_rule('/assets/<path:filename>', 'asset', asset)
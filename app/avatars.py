@@ -0,0 +1,124 @@
+"""
+avatars.py draws the users' identicon avatars, so pages no longer link to an avatar host the deployment can not reach.
+
+Notes
+-----
+    An avatar is addressed by the md5 digest of its user's email address, which is stored as User.avatar_digest when the
+    email is set, and by its size in pixels: /avatar/<digest>/<size>. User.avatar(size) returns this URL. Only the
+    SIZES the templates show are drawn, and any other size is not found.
+    An identicon is a 5 by 5 grid of cells mirrored about its middle column, the cells that are filled and their colour
+    being taken from the digest, so that each user keeps the same picture.
+    The image of a user's digest is drawn once, written to AVATAR_FOLDER as <digest>-<size>.png and sent from there
+    from then on, with a Cache-Control max-age of AVATAR_MAX_AGE as the image for a digest and size never changes. The
+    route is open to everyone, so a digest that is no user's is drawn on each request and never written, keeping the
+    folder to a few images per user.
+    PNGs are encoded with zlib, so drawing avatars needs no imaging library.
+
+Methods
+-------
+init_app(app)
+    Adds the /avatar route to an app
+identicon(digest, size) : bytes
+    Draws the identicon of a digest as a PNG image
+avatar(digest, size) : Response
+    Route sending the identicon of a digest, drawing it on first use
+cached(response) : Response
+    Marks an avatar response as never changing
+"""
+
+import os
+import re
+import struct
+import tempfile
+import zlib
+from io import BytesIO
+from flask import abort, current_app, send_file
+from app import db
+from app.models import User
+
+DIGEST = re.compile(r'^[0-9a-f]{32}$')
+# the sizes in pixels the templates show avatars at
+SIZES = (64, 128, 256)
+GRID = 5
+BACKGROUND = (240, 240, 240)
+
+
+def png(width, height, rows):
+    """encodes rows of RGB bytes as a PNG image"""
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+    # each row starts with filter type 0, ie. its bytes are stored as they are
+    pixels = b''.join(b'\x00' + row for row in rows)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)) \
+        + chunk(b'IDAT', zlib.compress(pixels, 9)) + chunk(b'IEND', b'')
+
+
+def identicon(digest, size):
+    """
+    Draws the identicon of a digest
+
+    Parameters
+    ----------
+    digest : String
+        32 hexadecimal digits, the md5 digest of a user's email address
+    size : Integer
+        Width and height of the image in pixels
+
+    Returns
+    -------
+    bytes
+        The image, as a PNG
+    """
+
+    values = bytes.fromhex(digest)
+    # the colour comes from the last three bytes, kept away from white so it stands out from the background
+    colour = bytes(64 + value * 3 // 4 for value in values[-3:])
+    half = (GRID + 1) // 2
+    cells = [[values[row * half + column] % 2 == 0 for column in range(half)] for row in range(GRID)]
+    cells = [row + row[:GRID - half][::-1] for row in cells]
+    cell = size // (GRID + 1)
+    margin = (size - cell * GRID) // 2
+    background = bytes(BACKGROUND)
+    rows = []
+    for y in range(size):
+        row = y - margin
+        if 0 <= row < cell * GRID:
+            filled = cells[row // cell]
+            line = background * margin + b''.join((colour if fill else background) * cell for fill in filled)
+            rows.append(line + background * (size - len(line) // 3))
+        else:
+            rows.append(background * size)
+    return png(size, size, rows)
+
+
+def avatar(digest, size):
+    """Sends the identicon of a digest at a size, drawing a user's once and caching it on disk"""
+    if not DIGEST.match(digest) or size not in SIZES:
+        abort(404)
+    folder = current_app.config['AVATAR_FOLDER']
+    path = os.path.join(folder, '{}-{}.png'.format(digest, size))
+    if not os.path.exists(path):
+        if db.session.query(User.id).filter_by(avatar_digest=digest).first() is None:
+            return cached(send_file(BytesIO(identicon(digest, size)), mimetype='image/png',
+                                    cache_timeout=current_app.config['AVATAR_MAX_AGE']))
+        os.makedirs(folder, exist_ok=True)
+        # written to a temporary file first, so a concurrent request never sends half an image
+        handle, temporary = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as file:
+            file.write(identicon(digest, size))
+        os.replace(temporary, path)
+    return cached(send_file(path, mimetype='image/png', cache_timeout=current_app.config['AVATAR_MAX_AGE'],
+                            conditional=True))
+
+
+def cached(response):
+    """lets browsers and proxies keep an avatar for AVATAR_MAX_AGE seconds without asking again"""
+    response.headers['Cache-Control'] = 'public, max-age={}, immutable'.format(current_app.config['AVATAR_MAX_AGE'])
+    return response
+
+
+def init_app(app):
+    """Adds the avatar route to the app"""
+    app.add_url_rule('/avatar/<digest>/<int:size>', 'avatar', avatar)
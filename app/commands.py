@@ -0,0 +1,151 @@
+"""
+commands.py holds the command line tools used to maintain the prototype's database.
+Commands are registered on the Flask CLI by create_app() and are run with the flask executable, eg. `flask rebuild-feed`
+
+Commands
+--------
+rebuild-feed
+    Backfills the precomputed home feed of every user (or a single user) from their subscriptions
+reindex-search
+    Rebuilds the full-text search index of posts and threads
+copy-database
+    Copies every table from the SQLite data.db (or another database) into the configured database
+upgrade-database
+    Applies the schema migrations the configured database has not had yet
+build-assets
+    Bundles and minifies the stylesheets and scripts of the templates into content-hashed files
+compress-static
+    Writes gzip copies of the static files that compress well
+compile-templates
+    Compiles every template into the bytecode cache
+generate-data
+    Fills an empty database with synthetic users, groups, topics, threads, posts and subscriptions
+"""
+
+import os
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from app import db, search
+from app.assets import build_assets
+from app.staticfiles import compress_folder
+from app.templating import compile_templates
+from app.config import dbPath
+from app.migrations import upgrade
+from app.transfer import copy_database
+from app.generate import generate_data
+from app.models import User, FeedEntry
+
+
+@click.command('rebuild-feed')
+@click.option('--username', default=None, help='Only rebuild the feed of this user.')
+@with_appcontext
+def rebuild_feed(username):
+    """Recomputes the stored home feed from thread and topic subscriptions"""
+    FeedEntry.__table__.create(db.engine, checkfirst=True)
+    query = db.session.query(User.id)
+    if username is not None:
+        query = query.filter_by(username=username)
+    user_ids = [user_id for user_id, in query]
+    for user_id in user_ids:
+        FeedEntry.rebuild(User.query.get(user_id))
+        db.session.commit()
+    click.echo('Rebuilt the feed of {} user(s)'.format(len(user_ids)))
+
+
+@click.command('reindex-search')
+@with_appcontext
+def reindex_search():
+    """Rebuilds the full-text search index from every post and thread"""
+    count = search.reindex()
+    db.session.commit()
+    click.echo('Indexed {} post(s)'.format(count))
+
+
+@click.command('copy-database')
+@click.option('--source', default='sqlite:///' + dbPath, help='URI of the database to copy, data.db by default.')
+@click.option('--target', default=None, help='URI of the database to copy to, the configured database by default.')
+@click.option('--batch-size', default=1000, help='Number of rows copied at a time.')
+@with_appcontext
+def copy_database_command(source, target, batch_size):
+    """Copies every table into an empty database, eg. when moving from data.db to a database server"""
+    target = target or current_app.config['SQLALCHEMY_DATABASE_URI']
+    if target == source:
+        raise click.UsageError('The source and target databases are the same')
+    counts = copy_database(source, target, batch_size=batch_size, echo=click.echo)
+    click.echo('Copied {} row(s) from {} table(s)'.format(sum(counts.values()), len(counts)))
+
+
+@click.command('upgrade-database')
+@with_appcontext
+def upgrade_database():
+    """Brings the schema of the configured database up to date, see migrations.py"""
+    if not upgrade(echo=click.echo):
+        click.echo('The database is up to date')
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """Bundles and minifies the stylesheets and scripts linked by the templates, see assets.py"""
+    for name, built in sorted(build_assets().items()):
+        size = os.path.getsize(os.path.join(current_app.config['ASSETS_FOLDER'], built))
+        click.echo('{:<10} {:<24} {:9} bytes'.format(name, built, size))
+
+
+@click.command('compress-static')
+@with_appcontext
+def compress_static():
+    """Writes gzip copies of the static files and built bundles that compress well, see staticfiles.py"""
+    static_folder, assets_folder = current_app.static_folder, current_app.config['ASSETS_FOLDER']
+    folders = [static_folder]
+    if not os.path.abspath(assets_folder).startswith(os.path.abspath(static_folder) + os.sep):
+        folders.append(assets_folder)
+    for folder in folders:
+        count, compressed_size, original_size = compress_folder(folder)
+        click.echo('{:<40} {:5} file(s) {:10} bytes, {:10} compressed'.format(
+            os.path.relpath(folder, current_app.root_path), count, original_size, compressed_size))
+
+
+@click.command('compile-templates')
+@with_appcontext
+def compile_templates_command():
+    """Compiles every template ahead of time into TEMPLATE_CACHE_FOLDER, see templating.py"""
+    if current_app.jinja_env.bytecode_cache is None:
+        raise click.UsageError('TEMPLATE_CACHE_FOLDER is not set')
+    click.echo('Compiled {} template(s)'.format(len(compile_templates())))
+
+
+@click.command('generate-data')
+@click.option('--target', default=None, help='URI of the database to fill, the configured database by default.')
+@click.option('--users', default=1000, help='Number of users.')
+@click.option('--groups', default=20, help='Number of discussion groups.')
+@click.option('--topics', default=50, help='Number of topics.')
+@click.option('--threads', default=10000, help='Number of threads.')
+@click.option('--posts', default=200000, help='Number of posts, at least one per thread.')
+@click.option('--topic-subscriptions', default=None, type=int, help='Number of topic subscriptions, a tenth of the '
+                                                                    'users by default.')
+@click.option('--days', default=365, help='Number of days the threads are spread over.')
+@click.option('--seed', default=0, help='Seed of the random numbers.')
+@click.option('--feeds/--no-feeds', default=True, help='Whether to fill the home feeds, which grow far faster than '
+                                                       'the posts.')
+@click.option('--batch-size', default=10000, help='Number of rows inserted at a time.')
+@with_appcontext
+def generate_data_command(target, batch_size, **sizes):
+    """Fills an empty database with synthetic data at a realistic skew, see generate.py"""
+    target = target or current_app.config['SQLALCHEMY_DATABASE_URI']
+    try:
+        counts = generate_data(target, batch_size=batch_size, echo=click.echo, **sizes)
+    except ValueError as error:
+        raise click.UsageError(str(error))
+    click.echo('Wrote {} row(s) to {} table(s)'.format(sum(counts.values()), len(counts)))
+
+
+COMMANDS = [rebuild_feed, reindex_search, copy_database_command, upgrade_database, build_assets_command,
+            compress_static, compile_templates_command, generate_data_command]
+
+
+def init_app(app):
+    """Adds the commands to the app's `flask` command line"""
+    for command in COMMANDS:
+        app.cli.add_command(command)
@@ -0,0 +1,66 @@
+"""
+conditional.py holds the conditional responses of the thread, topic and group pages, so a client polling a page for
+new replies is answered with an empty 304 Not Modified response until something on it changes.
+
+Notes
+-----
+    A page's ETag is a hash of the validators the route passes (eg. the thread's id and change time, and whether the
+    viewer is subscribed to it) along with the viewer's id and the URL, including the page of results requested.
+    The validators are cheap to query, and the page's posts are only queried and rendered when the client's ETag no
+    longer matches, which is why routes pass a function that renders the page rather than the page itself.
+    The ETag also changes every VALIDATOR_LIFETIME seconds, so the relative times shown on a page and the CSRF token
+    of its form are refreshed before they become wrong or expire.
+    Last-Modified is sent for information only; If-Modified-Since alone can not tell that a viewer has subscribed to
+    a thread since, so only If-None-Match can lead to a 304 response.
+
+Methods
+-------
+make_etag(*validators) : String
+    The strong ETag of the requested page for the current user
+conditional(render, *validators, last_modified) : Response
+    A 304 response if the client's copy of the page is current, otherwise the rendered page
+"""
+
+import hashlib
+import time
+from flask import current_app, make_response, request
+from flask_login import current_user
+
+
+def make_etag(*validators):
+    """Returns the strong ETag of the requested page for the current user, given the values the page depends on"""
+    lifetime = int(time.time() // current_app.config['VALIDATOR_LIFETIME'])
+    key = repr((request.full_path, current_user.get_id(), lifetime) + validators)
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def conditional(render, *validators, last_modified=None):
+    """
+    Responds to a GET request with 304 Not Modified if the client's copy of the page is current
+
+    Parameters
+    ----------
+    render : function
+        Called without arguments to render the page when the client's copy is out of date
+    *validators
+        Values that change whenever the page does, such as the time a thread was last changed
+    last_modified : DateTime
+        UTC time the page last changed, sent in the Last-Modified header
+
+    Returns
+    -------
+    Response
+        An empty 304 response, or the rendered page, with an ETag header
+    """
+
+    etag = make_etag(*validators)
+    if request.method in ('GET', 'HEAD') and request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = make_response(render())
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    # the page depends on the viewer, so only the viewer's browser may keep it, and must revalidate it
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
@@ -1,17 +1,69 @@
 """
 config.py
 Config is a convenience file used to initialize certain aspects of the Flask config dictionary
-Two configurations are presented here, one for production and one for unit testing
+Five configurations are presented here: the default, one for development, two for production servers and one for unit
+testing
+The APP_CONFIG environment variable chooses between the default, development, production, server and test configs
+(see CONFIGS), unless create_app() is given a config
 
 Config:
     The main config file sets the SECRET_KEY variable which is used by flask for encryption and should not be made
     publicly available.
     SQLALCHEMY variables are also set here, giving a path to the main data.db file, as well as turning off logging
+    PAGE_SIZE is the number of rows shown on each page of the thread, topic and feed listings
+    JOBS variables configure the background job queue (see jobs.py): the size of the worker's thread pool, how often
+    an idle worker polls, how long a claimed job stays hidden from other workers, and how failed jobs are retried
+    USER_CACHE variables size the per-process cache of logged in users (see loaders.py): the number of users kept and
+    the seconds an entry is trusted before the user is loaded from the database again
+    FRAGMENT_CACHE variables size the per-process cache of rendered thread listing rows (see fragments.py): the
+    number of rows kept and the seconds a row is used for, which bounds how stale its relative times can be
+    VALIDATOR_LIFETIME is the number of seconds after which the ETags of the thread, topic and group pages change even
+    though the pages have not (see conditional.py); it must be less than the CSRF token lifetime of their forms
+    ASSETS_FOLDER is where `flask build-assets` writes the bundled stylesheets and scripts (see assets.py), which are
+    served with a Cache-Control max-age of ASSETS_MAX_AGE seconds (a year) as their names change with their contents
+    STATIC_PRECOMPRESSED sends the gzip copies of static files made by `flask compress-static` (see staticfiles.py)
+    TEMPLATE_CACHE_FOLDER is where the compiled templates are kept between processes (see templating.py); set it to
+    None to compile them in every process
+    AVATAR_FOLDER is where the identicon avatars are cached once drawn (see avatars.py), and they are served with a
+    Cache-Control max-age of AVATAR_MAX_AGE seconds, as the image for a digest and size never changes
+    METRICS_ENABLED records the SQL statements, SQL and template time, duration and response size of every request
+    by endpoint, and serves them at /metrics (see metrics.py)
+    QUERY_REPEAT_THRESHOLD is the number of times a request may run the same SQL statement before a warning is logged
+    (see nplusone.py); None leaves statements uncounted
+    PROFILE variables configure the profiling of single requests (see profiler.py): the usernames allowed to profile
+    a request by adding ?profile to its URL, which no one is by default, the folder the profiles are written to, how
+    many requests a process may profile every PROFILE_PERIOD seconds, how many profiles are kept, and the seconds
+    between the samples of a request's stack
+    LIVE variables configure the streams of new posts sent to the readers of a thread (see live.py): the streams a
+    process keeps open at most, the seconds between its checks for posts written by other processes, the seconds
+    between keepalive comments, and the seconds after which a stream is closed for the browser to reconnect
+    WEB variables are the defaults of server.py (see prefork.py): the address it listens on, the number of worker
+    processes (one per CPU when None) and of threads in each, the MiB of memory past which a worker is replaced, and
+    the seconds a stopping worker has to finish its requests and a new one has to warm up
+    SQLITE variables tune the SQLite database (see database.py), and are left off here
+DevelopmentConfig:
+    The development config extends the main config to warn about requests that run the same statement more than
+    QUERY_REPEAT_THRESHOLD times, which is usually a relationship lazily loaded for every row of a listing
+ProductionConfig:
+    The production config extends the main config for serving concurrent requests from the SQLite database.
+    SQLITE_PRAGMAS turns on write-ahead logging, so readers are not blocked by a writer, makes a writer wait up to
+    busy_timeout milliseconds for a locked database, only syncs to disk at WAL checkpoints, and enlarges the memory map
+    and page cache (a negative cache_size is in KiB)
+    SQLITE_SPLIT_POOLS sends the reads of GET requests to a pool of SQLITE_READ_POOL_SIZE read-only connections, while
+    every write goes through a single writer connection, which requests wait up to SQLITE_WRITE_TIMEOUT seconds for
+ServerConfig:
+    The server config extends the main config for a client/server database shared by several hosts, whose URI is read
+    from the DATABASE_URL environment variable. The data in data.db is copied over with `flask copy-database`.
+    Each process keeps SQLALCHEMY_POOL_SIZE connections open, and opens up to SQLALCHEMY_MAX_OVERFLOW more under load,
+    waiting up to SQLALCHEMY_POOL_TIMEOUT seconds for one to be free. Connections are replaced after
+    SQLALCHEMY_POOL_RECYCLE seconds, before the server closes them as idle, and SQLALCHEMY_POOL_PRE_PING tests each
+    connection as it is taken from the pool, so a dropped connection is replaced rather than failing the request
 TestConfig:
-    The test config differs from the main config in two ways.
+    The test config extends the main config, and differs from it in three ways.
     It sets the variable TESTING to true, which flask uses internally to expose more elements to unit testing
     It sets the location of the SQLALCHEMY database to a separate test.db, located in the same directory
     This allows unit tests to be conducted without modifying the production database
+    It runs background jobs immediately, so tests can assert on their results without a worker
 
 The os module is imported to create the path to the database files
 """
@@ -26,16 +78,105 @@ test_path = basedir + "/data/test.db"
 class Config:
     # Flask
     SECRET_KEY = "super_secret_key"
+    # Listings
+    PAGE_SIZE = 20
     # Database
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + dbPath
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Background jobs
+    JOBS_INLINE = False
+    JOBS_WORKERS = 4
+    JOBS_POLL_INTERVAL = 1.0
+    JOBS_VISIBILITY_TIMEOUT = 60
+    JOBS_MAX_ATTEMPTS = 5
+    JOBS_RETRY_DELAY = 5
+    # Logged in user cache
+    USER_CACHE_SIZE = 1024
+    USER_CACHE_TTL = 300
+    # Rendered thread listing rows
+    FRAGMENT_CACHE_SIZE = 4096
+    FRAGMENT_CACHE_TTL = 60
+    # Conditional responses
+    VALIDATOR_LIFETIME = 1800
+    # Built stylesheets and scripts
+    ASSETS_FOLDER = basedir + "/static/dist"
+    ASSETS_MAX_AGE = 31536000
+    STATIC_PRECOMPRESSED = True
+    # Compiled templates
+    TEMPLATE_CACHE_FOLDER = basedir + "/data/template_cache"
+    # Identicon avatars
+    AVATAR_FOLDER = basedir + "/data/avatars"
+    AVATAR_MAX_AGE = 31536000
+    # Request metrics
+    METRICS_ENABLED = True
+    # Repeated statement warnings
+    QUERY_REPEAT_THRESHOLD = None
+    # Request profiling
+    PROFILE_USERS = ()
+    PROFILE_FOLDER = basedir + "/data/profiles"
+    PROFILE_LIMIT = 10
+    PROFILE_PERIOD = 60
+    PROFILE_KEEP = 50
+    PROFILE_SAMPLE_INTERVAL = 0.001
+    # Live thread updates
+    LIVE_MAX_CONNECTIONS = 100
+    LIVE_POLL_INTERVAL = 1.0
+    LIVE_KEEPALIVE = 15
+    LIVE_MAX_AGE = 300
+    # Production server
+    WEB_BIND = '127.0.0.1:8000'
+    WEB_WORKERS = None
+    WEB_THREADS = 8
+    WEB_MAX_MEMORY = 512
+    WEB_GRACEFUL_TIMEOUT = 30
+    WEB_WARMUP_TIMEOUT = 60
+    # SQLite tuning
+    SQLITE_PRAGMAS = None
+    SQLITE_SPLIT_POOLS = False
+    SQLITE_READ_POOL_SIZE = 8
+    SQLITE_WRITE_TIMEOUT = 30
+
+
+class DevelopmentConfig(Config):
+    # Repeated statement warnings
+    QUERY_REPEAT_THRESHOLD = 5
+
+
+class ProductionConfig(Config):
+    # SQLite tuning
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,
+        'synchronous': 'NORMAL',
+        'mmap_size': 268435456,
+        'cache_size': -65536,
+    }
+    SQLITE_SPLIT_POOLS = True
+
+
+class ServerConfig(Config):
+    # Database
+    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'postgresql://cs2005@localhost/cs2005')
+    SQLALCHEMY_POOL_SIZE = 10
+    SQLALCHEMY_MAX_OVERFLOW = 20
+    SQLALCHEMY_POOL_TIMEOUT = 30
+    SQLALCHEMY_POOL_RECYCLE = 1800
+    SQLALCHEMY_POOL_PRE_PING = True
 
 
 # meant for unittest testing purposes
-class TestConfig:
+class TestConfig(Config):
     TESTING = True
-    # Flask
-    SECRET_KEY = "super_secret_key"
     # Database
     SQLALCHEMY_DATABASE_URI = 'sqlite:///' + test_path
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Background jobs
+    JOBS_INLINE = True
+
+
+CONFIGS = {
+    'default': Config,
+    'development': DevelopmentConfig,
+    'production': ProductionConfig,
+    'server': ServerConfig,
+    'test': TestConfig,
+}
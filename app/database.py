@@ -0,0 +1,215 @@
+"""
+database.py holds the website's Flask-SQLAlchemy extension, which can tune SQLite for a production server.
+
+Notes
+-----
+    When SQLITE_PRAGMAS is set, the pragmas are run on every new SQLite connection, eg. to turn on write-ahead logging
+    (WAL) so that readers no longer block behind a writer, and to set a busy timeout so that a writer waits for the
+    database instead of failing with "database is locked".
+    When SQLITE_SPLIT_POOLS is also set, each session chooses between two connection pools:
+        a pool of read-only connections, used for the queries of GET requests
+        a pool holding a single writer connection, used for every write and for all statements outside of GET requests
+    Once a session has written, it keeps the writer for the rest of its transaction so that it reads its own writes.
+    As the writer pool has one connection, the requests of a process queue for it rather than retrying on a locked
+    database, and the busy timeout only comes into play between processes.
+    For other databases, SQLALCHEMY_POOL_PRE_PING adds SQLAlchemy's pool_pre_ping option to Flask-SQLAlchemy's own
+    pool settings.
+    The model constructors save their object with db.commit(), which commits straight away unless a db.batch() is open.
+    Inside a batch their commits are put off until the batch ends, so creating many objects, or the several objects
+    of a request, takes a single transaction (and a single fsync) rather than one each. The objects are flushed every
+    chunk_size of those commits, so memory use does not grow with the batch, and the constructors still query and
+    flush as they did, so their checks hold as before. A batch inside another joins it.
+
+Classes
+-------
+Database : SQLAlchemy
+    The Flask-SQLAlchemy extension with SQLite pragmas, read/write connection pools, connection pre-ping and batches
+RoutingSession : SignallingSession
+    A session that sends the reads of GET requests to the read-only pool
+
+Methods
+-------
+set_pragmas(connection, pragmas)
+    Runs PRAGMA statements on a new SQLite connection
+connect(path, pragmas, read_only) : sqlite3.Connection
+    Opens a connection to an SQLite database file
+"""
+
+import os
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+from functools import partial
+from urllib.request import pathname2url
+from flask import has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, event, orm
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql.expression import SelectBase, TextClause
+
+# pragmas that change the database file rather than the connection, which read-only connections can not run
+WRITE_PRAGMAS = {'journal_mode'}
+
+
+def set_pragmas(connection, pragmas):
+    """Runs a PRAGMA statement for each name and value of a dictionary on a DBAPI SQLite connection"""
+    cursor = connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute('PRAGMA {} = {}'.format(name, value))
+    cursor.close()
+
+
+def connect(path, pragmas, read_only=False):
+    """
+    Opens a connection to an SQLite database file that may be shared between threads by a connection pool
+
+    Parameters
+    ----------
+    path : String
+        Absolute path of the database file
+    pragmas : dict
+        Pragmas run on the new connection
+    read_only : Boolean
+        Whether to open the file read-only, in which case pragmas that would modify the file are skipped
+    """
+
+    if read_only:
+        connection = sqlite3.connect('file:{}?mode=ro'.format(pathname2url(path)), uri=True, check_same_thread=False)
+        pragmas = {name: value for name, value in pragmas.items() if name not in WRITE_PRAGMAS}
+    else:
+        connection = sqlite3.connect(path, check_same_thread=False)
+    set_pragmas(connection, pragmas)
+    return connection
+
+
+def is_read(clause):
+    """returns True if a statement only reads, ie. a SELECT or a textual statement starting with SELECT"""
+    if isinstance(clause, SelectBase):
+        return True
+    if isinstance(clause, TextClause):
+        return clause.text.lstrip().upper().startswith('SELECT')
+    return False
+
+
+class RoutingSession(SignallingSession):
+    """
+    RoutingSession sends the read statements of GET and HEAD requests to the read-only connection pool, and
+    everything else to the writer, when the app's SQLITE_SPLIT_POOLS option is set
+    """
+
+    def __init__(self, db, **options):
+        self._db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        engines = self._db.get_split_engines(self.app)
+        if engines is None:
+            return SignallingSession.get_bind(self, mapper, clause)
+        reader, writer = engines
+        if (not self.info.get('writing') and not self._flushing and is_read(clause)
+                and has_request_context() and request.method in ('GET', 'HEAD')):
+            return reader
+        self.info['writing'] = True
+        return writer
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def end_writing(session, transaction):
+    """lets a session read from the read-only pool again once its outermost transaction ends"""
+    if transaction.parent is None:
+        session.info.pop('writing', None)
+
+
+class Database(SQLAlchemy):
+    """
+    Database is the Flask-SQLAlchemy extension used by the website, adding the SQLITE_PRAGMAS, SQLITE_SPLIT_POOLS
+    and SQLALCHEMY_POOL_PRE_PING options described in config.py, and batches of put off commits
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._tuned = weakref.WeakSet()
+        self._split_engines = {}
+        self._split_lock = threading.Lock()
+        SQLAlchemy.__init__(self, *args, **kwargs)
+
+    @contextmanager
+    def batch(self, chunk_size=None):
+        """
+        Puts off the commits of db.commit() until the end of the block, which commits once, or rolls back if it raises
+
+        Parameters
+        ----------
+        chunk_size : Integer
+            The number of put off commits after which the session is flushed, never when None
+        """
+
+        session = self.session()
+        if 'batch' in session.info:
+            yield
+            return
+        session.info['batch'] = {'chunk_size': chunk_size, 'pending': 0}
+        try:
+            yield
+            session.commit()
+        except BaseException:
+            session.rollback()
+            raise
+        finally:
+            session.info.pop('batch', None)
+
+    def commit(self):
+        """Commits the session, or when a batch() is open, counts the commit and flushes every chunk_size of them"""
+        session = self.session()
+        batch = session.info.get('batch')
+        if batch is None:
+            session.commit()
+            return
+        batch['pending'] += 1
+        if batch['chunk_size'] and batch['pending'] >= batch['chunk_size']:
+            session.flush()
+            batch['pending'] = 0
+
+    def apply_pool_defaults(self, app, options):
+        # Flask-SQLAlchemy 2.4 and later build the engine options here, see requirements.txt
+        options = SQLAlchemy.apply_pool_defaults(self, app, options)
+        if app.config.get('SQLALCHEMY_POOL_PRE_PING'):
+            options['pool_pre_ping'] = True
+        return options
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def get_engine(self, app=None, bind=None):
+        """Returns the engine Flask-SQLAlchemy creates for the app, running SQLITE_PRAGMAS on its new connections"""
+        engine = SQLAlchemy.get_engine(self, app, bind)
+        pragmas = self.get_app(app).config.get('SQLITE_PRAGMAS')
+        if pragmas and engine.dialect.name == 'sqlite' and engine not in self._tuned:
+            event.listen(engine, 'connect', lambda connection, record: set_pragmas(connection, pragmas))
+            self._tuned.add(engine)
+        return engine
+
+    def get_split_engines(self, app):
+        """
+        Returns the read-only and writer engines of the app's SQLite database, creating them on first use,
+        or None if SQLITE_SPLIT_POOLS is not set
+        """
+
+        if not app.config.get('SQLITE_SPLIT_POOLS'):
+            return None
+        uri = app.config['SQLALCHEMY_DATABASE_URI']
+        with self._split_lock:
+            engines = self._split_engines.get(uri)
+            if engines is None:
+                # relative paths are relative to the app, as they are for Flask-SQLAlchemy's own engine
+                path = os.path.join(app.root_path, make_url(uri).database)
+                pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+                reader = create_engine('sqlite://', creator=partial(connect, path, pragmas, read_only=True),
+                                       poolclass=QueuePool, pool_size=app.config['SQLITE_READ_POOL_SIZE'],
+                                       max_overflow=0)
+                writer = create_engine('sqlite://', creator=partial(connect, path, pragmas),
+                                       poolclass=QueuePool, pool_size=1, max_overflow=0,
+                                       pool_timeout=app.config['SQLITE_WRITE_TIMEOUT'])
+                engines = self._split_engines[uri] = (reader, writer)
+        return engines
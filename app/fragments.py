@@ -0,0 +1,178 @@
+"""
+fragments.py holds the cache of rendered rows for the thread listings of view_threads, view_topic and view_group.
+
+Notes
+-----
+    A thread's row is the same for every viewer apart from two cells: the author cell, which is an Edit button for the
+    thread's own author, and the button that subscribes to or unsubscribes from the thread's topic. Each cached entry
+    holds the shared row with slots for those cells, along with every variant of them, so filling in a row for a viewer
+    is a matter of string replacement (see thread_row).
+    Entries are stored with the version of the thread they were rendered from (its name, topic, post count and latest
+    post), so a row changed by another process is re-rendered when its version no longer matches. The routes and
+    models that change a thread also drop its entry once their transaction commits, see invalidate_thread.
+    Rows show relative times ("5 minutes ago"), so entries expire after FRAGMENT_CACHE_TTL seconds, and the least
+    recently used entry is dropped once FRAGMENT_CACHE_SIZE rows are cached.
+
+Classes
+-------
+FragmentCache
+    A thread safe LRU cache of rendered rows with a time to live, counting hits and misses
+
+Methods
+-------
+init_app(app)
+    Adds the thread_row template global to an app
+thread_row(thread, topic_ids, redir) : Markup
+    Template global returning the row of a thread listing for the current user
+invalidate_thread(thread_id)
+    Drops the cached row of a thread once the current transaction commits
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from flask_login import current_user
+from markupsafe import Markup
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from werkzeug.urls import url_quote
+from app import db
+from app.config import Config
+
+AUTHOR_SLOT = Markup('\x00author\x00')
+BUTTON_SLOT = Markup('\x00button\x00')
+REDIR_SLOT = Markup('\x00redir\x00')
+
+
+class FragmentCache:
+    """
+    FragmentCache keeps rendered fragments by key, along with the version of the data they were rendered from
+
+    Attributes
+    ----------
+    size : Integer
+        The maximum number of fragments kept
+    ttl : Float
+        Seconds a fragment is used for before it is rendered again
+    hits : Integer
+        The number of fragments returned from the cache
+    misses : Integer
+        The number of fragments that had to be rendered
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """Returns the fragment cached under the key for the given version, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version or entry[1] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def put(self, key, version, fragment):
+        """Caches a fragment rendered from the given version of its data"""
+        with self._lock:
+            self._entries[key] = (version, time.monotonic() + self.ttl, fragment)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """Drops the fragment cached under the key"""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drops every fragment"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Returns the hit and miss counts, the hit rate and the number of fragments cached"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return dict(hits=self.hits, misses=self.misses, size=len(self._entries),
+                        hit_rate=self.hits / lookups if lookups else 0.0)
+
+
+fragment_cache = FragmentCache(Config.FRAGMENT_CACHE_SIZE, Config.FRAGMENT_CACHE_TTL)
+
+
+def init_app(app):
+    """Adds the thread_row template global to the app, and sizes the fragment cache from its config"""
+    app.add_template_global(thread_row)
+    fragment_cache.size = app.config['FRAGMENT_CACHE_SIZE']
+    fragment_cache.ttl = app.config['FRAGMENT_CACHE_TTL']
+
+
+def thread_version(thread):
+    """returns the values shown in a thread's row, which change whenever the row must be rendered again"""
+    return (thread.name, thread.topic_id, thread.topic.name if thread.topic else None, thread.post_count,
+            thread.last_post_at, thread.last_poster_id, thread.author_id)
+
+
+def render_thread_row(thread):
+    """renders the shared row of a thread and the variants of its per-user cells"""
+    macros = current_app.jinja_env.get_template('fragments/thread_row.html').module
+    parts = dict(row=str(macros.row(thread, AUTHOR_SLOT, BUTTON_SLOT)),
+                 own_author=str(macros.own_author(thread)),
+                 other_author=str(macros.other_author(thread)),
+                 subscribe='', unsubscribe='')
+    if thread.topic:
+        parts['subscribe'] = str(macros.subscribe(thread, REDIR_SLOT))
+        parts['unsubscribe'] = str(macros.unsubscribe(thread, REDIR_SLOT))
+    return parts
+
+
+def thread_row(thread, topic_ids, redir):
+    """
+    Returns the row of a thread listing for the current user, from the cache when possible
+
+    Parameters
+    ----------
+    thread : Thread
+        The thread, with its topic, author and last poster loaded
+    topic_ids : set
+        The ids of the topics the current user is subscribed to
+    redir : String
+        The page the topic buttons return to
+    """
+
+    version = thread_version(thread)
+    parts = fragment_cache.get(thread.id, version)
+    if parts is None:
+        parts = render_thread_row(thread)
+        fragment_cache.put(thread.id, version, parts)
+    author = parts['own_author'] if thread.author_id == current_user.id else parts['other_author']
+    button = parts['unsubscribe'] if thread.topic_id in topic_ids else parts['subscribe']
+    return Markup(parts['row'].replace(AUTHOR_SLOT, author)
+                  .replace(BUTTON_SLOT, button.replace(REDIR_SLOT, url_quote(redir))))
+
+
+def invalidate_thread(thread_id):
+    """Drops the cached row of a thread once the current transaction commits"""
+    db.session.info.setdefault('stale_threads', set()).add(thread_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def drop_stale_threads(session):
+    """drops the rows of the threads changed by a committed transaction"""
+    for thread_id in session.info.pop('stale_threads', ()):
+        fragment_cache.invalidate(thread_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def keep_threads(session):
+    """forgets the threads changed by a transaction that was rolled back"""
+    session.info.pop('stale_threads', None)
@@ -0,0 +1,249 @@
+"""
+generate.py fills an empty database with synthetic users, groups, topics, threads, posts and subscriptions, so that
+the website can be measured at the scale of a real deployment, eg. with loadtest.py.
+
+Notes
+-----
+    Activity is skewed the way it is on real forums: users, topics and groups are ranked by a Zipf distribution
+    with exponent SKEW, so a few users write most of the posts and a few topics hold most of the threads, and replies
+    are shared out between threads by a gentler one (THREAD_SKEW), so the hottest threads run to thousands of posts
+    while most have a few.
+    The lowest user ids are the most active users.
+    Rows are written with bulk inserts of batch_size rows and explicit ids, bypassing the models, so no background jobs
+    are queued. The columns the models would have kept up to date are filled in as they go: each thread's post count,
+    latest post and updated_at, the avatar digest of each user, the subscription of every poster to their thread (with
+    a share of them unseen, so that alerts have something to show), and afterwards the home feed of every user and,
+    on SQLite, the search index. Feeds hold every post of the threads and topics a user follows, and grow far faster
+    than the posts do, so feeds=False leaves them empty for the largest databases.
+    Every user has the password PASSWORD, and is named user<id>.
+    The database is created and stamped with the latest migration when it has no tables yet, and must have no users.
+
+Methods
+-------
+generate_data(target_uri, users, groups, topics, threads, posts, topic_subscriptions, days, seed, feeds, batch_size,
+              echo) : dict
+    Fills an empty database with synthetic data, returning the number of rows written to each table
+zipf_weights(count, skew) : list
+    The cumulative weights of count items ranked by a Zipf distribution
+"""
+
+import random
+from datetime import datetime, timedelta
+from itertools import accumulate
+from sqlalchemy import create_engine, func, select, union
+from werkzeug.security import generate_password_hash
+from app import db, search
+from app.migrations import MIGRATIONS, set_version
+from app.models import User, Post, Thread, Topic, Group, FeedEntry, ThreadSubscriptions, TopicSubscriptions, \
+    group_user_association, email_digest
+
+PASSWORD = 'password'
+# exponent of the Zipf distributions that rank users, topics and groups, and the gentler one that shares out replies,
+# as every poster in a thread follows it, and a thread holding a tenth of all posts would be in every feed
+SKEW = 1.1
+THREAD_SKEW = 0.6
+# share of threads posted in a discussion group, and of public threads given a topic
+GROUP_SHARE = 0.1
+TOPIC_SHARE = 0.7
+# share of thread subscriptions flagged as having unseen posts
+UNSEEN_SHARE = 0.2
+# number of users whose feeds are filled by each statement
+FEED_BATCH = 1000
+
+WORDS = '''the a of to and in is it that for on with as was at by this be from or an are not but have one all
+can will about what there which when your would more so out up if do time like just know people think class
+module lecture exam assignment tutorial notes question answer week course marks deadline lab project group code
+python java database server test report essay reading library campus student teacher help thanks anyone else
+problem solution example idea reason work start finish submit review study revision slides room online'''.split()
+
+
+def zipf_weights(count, skew=SKEW):
+    """returns the cumulative weights of count items ranked by a Zipf distribution, to be passed to random.choices"""
+    return list(accumulate(1 / rank ** skew for rank in range(1, count + 1)))
+
+
+def sentence(rng, words):
+    """returns a sentence of the given number of random words"""
+    return ' '.join(rng.choices(WORDS, k=words)).capitalize()
+
+
+def post_text(rng):
+    """returns the text of a post, whose length in words follows a log-normal distribution as real posts do"""
+    return sentence(rng, max(3, int(rng.lognormvariate(3, 0.8)))) + '.'
+
+
+def generate_data(target_uri, users=1000, groups=20, topics=50, threads=10000, posts=200000,
+                  topic_subscriptions=None, days=365, seed=0, feeds=True, batch_size=10000, echo=print):
+    """
+    Fills an empty database with synthetic data
+
+    Parameters
+    ----------
+    target_uri : String
+        SQLAlchemy URI of the database to fill, which must have no users
+    users, groups, topics, threads : Integer
+        The number of rows of each to write
+    posts : Integer
+        The number of posts, at least one per thread
+    topic_subscriptions : Integer
+        The number of topic subscriptions, one per ten users when None
+    days : Integer
+        The number of days before now the threads are spread over
+    seed : Integer
+        Seed of the random numbers, so that the same arguments always give the same data
+    feeds : Boolean
+        Whether to fill the home feed of every user
+    batch_size : Integer
+        The number of rows inserted at a time
+    echo : function
+        Called with a line of progress after each table
+
+    Returns
+    -------
+    dict
+        The number of rows written, by table name
+    """
+
+    if users < 1 or threads < 1 or posts < threads:
+        raise ValueError('There must be at least one user and thread, and at least as many posts as threads')
+    rng = random.Random(seed)
+    target = create_engine(target_uri)
+    with target.begin() as connection:
+        if not target.dialect.has_table(connection, User.__tablename__):
+            db.metadata.create_all(connection)
+            set_version(connection, MIGRATIONS[-1][0])
+        elif connection.execute(select([func.count()]).select_from(User.__table__)).scalar():
+            raise ValueError('The target database already has users')
+    counts = {}
+
+    def insert(table, rows):
+        """inserts rows as they are generated, batch_size at a time, each batch in its own transaction"""
+        counts.setdefault(table.name, 0)
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                insert_batch(table, batch)
+                batch = []
+        if batch:
+            insert_batch(table, batch)
+
+    def insert_batch(table, batch):
+        with target.begin() as connection:
+            connection.execute(table.insert(), batch)
+        counts[table.name] += len(batch)
+
+    def report(*tables):
+        for table in tables:
+            echo('{:<24} {:9} rows'.format(table.name, counts.get(table.name, 0)))
+
+    now = datetime.utcnow()
+    start = now - timedelta(days=days)
+    user_weights = zipf_weights(users)
+
+    # region Users, topics and groups
+    password = generate_password_hash(PASSWORD, method='sha256')
+    insert(User.__table__, (dict(id=id, username='user{}'.format(id), email='user{}@example.com'.format(id),
+                                 avatar_digest=email_digest('user{}@example.com'.format(id)), password=password,
+                                 about_me=sentence(rng, 8)) for id in range(1, users + 1)))
+    insert(Topic.__table__, (dict(id=id, name='{} {}'.format(rng.choice(WORDS), id)) for id in range(1, topics + 1)))
+    members = {}
+    for id in range(1, groups + 1):
+        # the most active users are the likeliest members, and groups get smaller down the ranking
+        size = max(2, min(users, int(users * 0.2 / id ** SKEW)))
+        members[id] = sorted({user_id + 1 for user_id in rng.choices(range(users), cum_weights=user_weights, k=size)})
+    insert(Group.__table__, (dict(id=id, name='Group {}'.format(id), descr=sentence(rng, 12))
+                             for id in range(1, groups + 1)))
+    insert(group_user_association, (dict(group_id=id, user_id=user_id)
+                                    for id in range(1, groups + 1) for user_id in members[id]))
+    report(User.__table__, Topic.__table__, Group.__table__, group_user_association)
+    # endregion
+
+    # region Threads and posts
+    # every thread has its first post, and the replies are shared out with the hottest threads spread over time
+    sizes = [1] * threads
+    for index in rng.choices(range(threads), cum_weights=zipf_weights(threads, THREAD_SKEW), k=posts - threads):
+        sizes[index] += 1
+    rng.shuffle(sizes)
+    created = sorted(start + timedelta(seconds=rng.uniform(0, days * 86400)) for i in range(threads))
+    topic_weights = zipf_weights(topics) if topics else None
+    group_weights = zipf_weights(groups) if groups else None
+
+    def thread_rows(first, last, post_rows, subscription_rows):
+        """generates the threads with ids first to last, adding their posts and subscriptions to the given lists"""
+        for id in range(first, last + 1):
+            group_id = topic_id = None
+            if groups and rng.random() < GROUP_SHARE:
+                group_id = rng.choices(range(1, groups + 1), cum_weights=group_weights)[0]
+            elif topics and rng.random() < TOPIC_SHARE:
+                topic_id = rng.choices(range(1, topics + 1), cum_weights=topic_weights)[0]
+            if group_id is None:
+                authors = [user_id + 1 for user_id in
+                           rng.choices(range(users), cum_weights=user_weights, k=sizes[id - 1])]
+            else:
+                authors = rng.choices(members[group_id], k=sizes[id - 1])
+            begun = created[id - 1]
+            times = [begun] + sorted(begun + (now - begun) * rng.random() for i in range(sizes[id - 1] - 1))
+            title = sentence(rng, rng.randint(3, 8))
+            for index, (author_id, timestamp) in enumerate(zip(authors, times)):
+                post_rows.append(dict(id=post_ids[0] + index, thread_id=id, author_id=author_id,
+                                      timestamp=timestamp, text=post_text(rng), title=title if not index else None))
+            post_ids[0] += len(authors)
+            for author_id in sorted(set(authors)):
+                subscription_rows.append(dict(user_id='user{}'.format(author_id), thread_id=id,
+                                              unseen=rng.random() < UNSEEN_SHARE))
+            yield dict(id=id, name=title, created_at=begun, author_id=authors[0], last_post_at=times[-1],
+                       last_poster_id=authors[-1], post_count=len(authors), updated_at=times[-1],
+                       topic_id=topic_id, group_id=group_id)
+
+    # threads are generated batch_size posts or so at a time, and inserted before their posts
+    post_ids = [1]
+    first = 1
+    while first <= threads:
+        last = first
+        total = sizes[first - 1]
+        while last < threads and total + sizes[last] <= batch_size:
+            total += sizes[last]
+            last += 1
+        post_rows, subscription_rows = [], []
+        insert(Thread.__table__, list(thread_rows(first, last, post_rows, subscription_rows)))
+        insert(Post.__table__, post_rows)
+        insert(ThreadSubscriptions.__table__, subscription_rows)
+        first = last + 1
+    report(Thread.__table__, Post.__table__, ThreadSubscriptions.__table__)
+    # endregion
+
+    # region Topic subscriptions and feeds
+    if topics:
+        pairs = set()
+        wanted = min(users // 10 if topic_subscriptions is None else topic_subscriptions, users * topics)
+        while len(pairs) < wanted:
+            pairs.add((rng.choices(range(1, users + 1), cum_weights=user_weights)[0],
+                       rng.choices(range(1, topics + 1), cum_weights=topic_weights)[0]))
+        insert(TopicSubscriptions.__table__, (dict(user_id=user_id, topic_id=topic_id, unseen=False)
+                                              for user_id, topic_id in sorted(pairs)))
+    report(TopicSubscriptions.__table__)
+    counts[FeedEntry.__tablename__] = 0
+    for low in range(1, users + 1 if feeds else 1, FEED_BATCH):
+        high = low + FEED_BATCH - 1
+        from_threads = select([User.id.label('user_id'), Post.id.label('post_id'), Post.timestamp]) \
+            .where(ThreadSubscriptions.user_id == User.username) \
+            .where(Post.thread_id == ThreadSubscriptions.thread_id) \
+            .where(Post.author_id != User.id) \
+            .where(User.id.between(low, high))
+        from_topics = select([TopicSubscriptions.user_id, Post.id.label('post_id'), Post.timestamp]) \
+            .where(Post.thread_id == Thread.id) \
+            .where(Thread.topic_id == TopicSubscriptions.topic_id) \
+            .where(Post.author_id != TopicSubscriptions.user_id) \
+            .where(TopicSubscriptions.user_id.between(low, high))
+        with target.begin() as connection:
+            counts[FeedEntry.__tablename__] += connection.execute(FeedEntry.__table__.insert().from_select(
+                ['user_id', 'post_id', 'timestamp'], union(from_threads, from_topics))).rowcount
+    report(FeedEntry.__table__)
+    if target.dialect.name == 'sqlite':
+        with target.begin() as connection:
+            echo('{:<24} {:9} rows'.format('search_index', search.reindex(connection)))
+    # endregion
+
+    target.dispose()
+    return counts
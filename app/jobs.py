@@ -0,0 +1,250 @@
+"""
+jobs.py holds the background job queue used to move slow work, such as notifying every subscriber of a thread,
+out of the request that caused it.
+
+Notes
+-----
+    Jobs are rows of the 'jobs' table in the website's own database, so no external broker is required and a job is
+    committed in the same transaction as the post that enqueued it.
+    A worker claims a job by pushing its available_at time forward by the visibility timeout; should the worker die
+    before finishing, the job becomes available to another worker once the timeout passes.
+    Failing jobs are retried with an exponential backoff, and are kept with their last error once they run out of
+    attempts.
+    When JOBS_INLINE is set (as it is for unit testing), jobs run immediately instead of being stored.
+
+Classes
+-------
+Job : db.Model
+    A unit of work waiting to be run by a worker
+Worker
+    A pool of threads that claims and runs jobs until it is stopped
+
+Methods
+-------
+task(name)
+    Decorator registering a function as the job with the given name
+enqueue(name, **payload) : Job
+    Adds a job to the current transaction, or runs it immediately when JOBS_INLINE is set
+claim() : Job
+    Claims the next available job, or returns None if there is none
+run(job) : Boolean
+    Runs a claimed job, rescheduling it if it fails
+run_pending() : Integer
+    Runs jobs until the queue has none available, returning how many were run
+"""
+
+import json
+import threading
+import traceback
+from datetime import datetime, timedelta
+from flask import current_app
+from app import db
+
+# registered job functions, by name
+TASKS = {}
+
+
+def task(name):
+    """Registers the decorated function as the job with the given name, see enqueue()"""
+
+    def register(function):
+        TASKS[name] = function
+        return function
+
+    return register
+
+
+class Job(db.Model):
+    """
+    The Job class represents a registered task and its arguments, waiting to be run by a worker.
+    Unlike the other models, creating a job does not commit; it is committed along with the work that enqueued it.
+
+    Attributes
+    ----------
+    id : Integer
+        Primary key
+    name : String
+        Name of the registered task to run
+    payload : Text
+        JSON encoded keyword arguments of the task
+    attempts : Integer
+        The number of times a worker has claimed the job
+    available_at : DateTime
+        UTC time after which the job may be claimed, None once the job has failed for good
+    created_at : DateTime
+        UTC time the job was enqueued
+    failed_at : DateTime
+        UTC time the job ran out of attempts
+    last_error : Text
+        Traceback of the job's most recent failure
+    """
+
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        db.Index('ix_jobs_available_at', 'available_at', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text(), nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    available_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    failed_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text())
+
+    def __init__(self, name, payload):
+        self.name = name
+        self.payload = json.dumps(payload)
+
+    def __repr__(self):
+        return "Job " + self.name + " " + self.payload
+
+
+def enqueue(name, **payload):
+    """
+    Adds a job to the current database transaction, to be run by a worker once it is committed
+
+    Parameters
+    ----------
+    name : String
+        Name of a task registered with the task() decorator
+    **payload
+        JSON serializable keyword arguments passed to the task
+
+    Returns
+    -------
+    Job
+        The pending job, or None if JOBS_INLINE is set and the task has already been run
+    """
+
+    if name not in TASKS:
+        raise ValueError("There is no job named " + name)
+    if current_app.config.get('JOBS_INLINE'):
+        TASKS[name](**payload)
+        return None
+    job = Job(name, payload)
+    db.session.add(job)
+    return job
+
+
+def claim():
+    """Claims the next available job for the visibility timeout and returns it, or returns None if there is none"""
+    now = datetime.utcnow()
+    hidden_until = now + timedelta(seconds=current_app.config['JOBS_VISIBILITY_TIMEOUT'])
+    candidates = db.session.query(Job.id).filter(Job.available_at <= now) \
+        .order_by(Job.available_at, Job.id).limit(10).all()
+    for job_id, in candidates:
+        # another worker may have claimed the job since it was selected, in which case no row is updated
+        claimed = Job.query.filter(Job.id == job_id, Job.available_at <= now) \
+            .update({'available_at': hidden_until, 'attempts': Job.attempts + 1}, synchronize_session=False)
+        db.session.commit()
+        if claimed:
+            return Job.query.get(job_id)
+    db.session.commit()
+    return None
+
+
+def run(job):
+    """
+    Runs a claimed job and deletes it in the same transaction as the job's own changes.
+    Should the job raise an exception, its changes are rolled back and it is rescheduled, or marked as failed if it
+    has used up JOBS_MAX_ATTEMPTS.
+
+    Returns
+    -------
+    Boolean
+        True if the job succeeded
+    """
+
+    job_id, attempts = job.id, job.attempts
+    try:
+        TASKS[job.name](**json.loads(job.payload))
+        Job.query.filter_by(id=job_id, attempts=attempts).delete(synchronize_session=False)
+        db.session.commit()
+        return True
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception('Job %s failed on attempt %s', job_id, attempts)
+        error = traceback.format_exc()
+        now = datetime.utcnow()
+        job = Job.query.get(job_id)
+        if job is None:
+            # the row was removed while the job ran, eg. by the task itself, leaving nothing to reschedule
+            db.session.rollback()
+            return False
+        job.last_error = error
+        if attempts >= current_app.config['JOBS_MAX_ATTEMPTS']:
+            job.available_at = None
+            job.failed_at = now
+        else:
+            job.available_at = now + timedelta(seconds=current_app.config['JOBS_RETRY_DELAY'] * 2 ** (attempts - 1))
+        db.session.commit()
+        return False
+
+
+def run_pending():
+    """Runs jobs until none are available, returning the number of jobs run"""
+    count = 0
+    job = claim()
+    while job is not None:
+        run(job)
+        count += 1
+        job = claim()
+    return count
+
+
+class Worker:
+    """
+    A Worker runs jobs on a pool of threads, each with its own application context and database session.
+
+    Attributes
+    ----------
+    app : Flask
+        The app whose jobs are run, the current app when the worker was created
+    threads : Integer
+        The number of jobs run at once
+    poll_interval : Float
+        Seconds a thread waits before checking an empty queue again
+    """
+
+    def __init__(self, threads=None, poll_interval=None):
+        self.app = current_app._get_current_object()
+        self.threads = threads or self.app.config['JOBS_WORKERS']
+        self.poll_interval = poll_interval or self.app.config['JOBS_POLL_INTERVAL']
+        self._stopping = threading.Event()
+        self._pool = []
+
+    def start(self):
+        """Starts the worker threads"""
+        for i in range(self.threads):
+            thread = threading.Thread(target=self._work, name='job-worker-{}'.format(i), daemon=True)
+            thread.start()
+            self._pool.append(thread)
+
+    def stop(self):
+        """Asks the worker threads to exit once their current job is finished"""
+        self._stopping.set()
+
+    def join(self):
+        """Waits until every worker thread has exited"""
+        for thread in self._pool:
+            while thread.is_alive():
+                thread.join(1)
+
+    def _work(self):
+        """Claims and runs jobs until the worker is stopped"""
+        with self.app.app_context():
+            while not self._stopping.is_set():
+                try:
+                    job = claim()
+                    if job is None:
+                        self._stopping.wait(self.poll_interval)
+                    else:
+                        run(job)
+                except Exception:
+                    # the database may be briefly unavailable, eg. locked by a writer
+                    current_app.logger.exception('Job worker error')
+                    db.session.rollback()
+                    self._stopping.wait(self.poll_interval)
+                finally:
+                    db.session.remove()
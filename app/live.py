@@ -0,0 +1,257 @@
+"""
+live.py sends the new posts of a thread to the readers of its page as they are written, as a stream of Server-Sent
+Events, so that replies appear without reloading the page and re-rendering every post.
+
+Notes
+-----
+    The last page of a thread opens /view_thread/<id>/events with the browser's EventSource, giving the id of the
+    latest post it shows. The stream sends each newer post as a 'post' event whose data is the post rendered as it is
+    on the page and whose id is the post's id. Should the connection drop, the browser reconnects after RETRY
+    milliseconds with a Last-Event-ID header, and is sent the posts it missed in the meantime.
+    Each process has a Hub holding the open streams by thread. Thread.add_post announces its thread with
+    announce_post(), and once the transaction commits the hub is woken to look up the new posts straight away. The
+    hub also looks for new posts in the threads being watched every LIVE_POLL_INTERVAL seconds, which is how the
+    posts written by other processes reach this one's streams: the database is the only thing the processes share,
+    so it carries the fan-out without a broker, and a process runs one small query per interval, however many
+    streams it has open.
+    A stream holds a server thread for as long as it is open, so a process keeps at most LIVE_MAX_CONNECTIONS streams
+    and answers any more with 503 Service Unavailable, leaving those readers to reload by hand. A stream is closed after
+    LIVE_MAX_AGE seconds, and the browser reconnects, so that streams are spread again over the processes of a
+    server that has been restarted or grown. A comment is sent every LIVE_KEEPALIVE seconds of quiet, which keeps
+    proxies from timing the stream out and tells the server when the reader has gone.
+    The hub follows post ids upwards. Posts committed out of id order, which SQLite's single writer never does, may
+    only show when the page is reloaded.
+
+Classes
+-------
+Listener
+    The queue of new post ids of a thread for one open stream
+Hub
+    The open streams of a process by thread, and the thread that looks up new posts for them
+
+Methods
+-------
+init_app(app)
+    Gives an app its Hub
+announce_post(thread_id)
+    Wakes the hub once the current transaction, which adds a post to the thread, commits
+stream(thread_id, last_id, render) : Response
+    The event stream of the posts of a thread after last_id
+"""
+
+import queue
+import threading
+import time
+from flask import Response, current_app, has_app_context, stream_with_context
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from app import db
+
+# milliseconds a browser waits before reconnecting a dropped stream
+RETRY = 3000
+
+
+class Listener:
+    """
+    Listener receives the ids of the new posts of a thread for a stream
+
+    Attributes
+    ----------
+    thread_id : Integer
+        The thread the stream shows
+    """
+
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self._queue = queue.Queue()
+
+    def put(self, post_id):
+        self._queue.put(post_id)
+
+    def wait(self, timeout):
+        """returns the ids of the posts received, waiting up to timeout seconds for one, or an empty list"""
+        try:
+            post_ids = [self._queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                post_ids.append(self._queue.get_nowait())
+            except queue.Empty:
+                return post_ids
+
+
+class Hub:
+    """
+    Hub passes the ids of new posts to the listeners of their threads
+
+    Attributes
+    ----------
+    app : Flask
+        The app whose database is looked up
+    listeners : dict
+        The set of Listeners of each thread being watched, by thread id
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.listeners = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._poller = None
+        self._last_id = 0
+        self.closed = False
+
+    def subscribe(self, thread_id):
+        """returns a new Listener of a thread, or None if LIVE_MAX_CONNECTIONS listeners are open or the hub is closed"""
+        with self._lock:
+            if self.closed or sum(len(listeners) for listeners in self.listeners.values()) >= \
+                    self.app.config['LIVE_MAX_CONNECTIONS']:
+                return None
+            if self._poller is None:
+                # posts before the first listener are sent by the streams themselves, as their backlog
+                self._last_id = self.latest_id()
+                self._poller = threading.Thread(target=self.run, name='live-posts', daemon=True)
+                self._poller.start()
+            listener = Listener(thread_id)
+            self.listeners.setdefault(thread_id, set()).add(listener)
+            return listener
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            listeners = self.listeners.get(listener.thread_id, set())
+            listeners.discard(listener)
+            if not listeners:
+                self.listeners.pop(listener.thread_id, None)
+
+    def close(self):
+        """Ends every stream as soon as it has sent the posts it has, eg. when the process is stopping"""
+        with self._lock:
+            self.closed = True
+            for listeners in self.listeners.values():
+                for listener in listeners:
+                    listener.put(None)
+
+    def wake(self, thread_ids):
+        """looks up new posts straight away, if any of the threads are being watched"""
+        if any(thread_id in self.listeners for thread_id in thread_ids):
+            self._wake.set()
+
+    def latest_id(self):
+        """returns the id of the latest post"""
+        # imported here, as the models import this module to announce their posts
+        from app.models import Post
+        with db.get_engine(self.app).connect() as connection:
+            return connection.execute(select([func.max(Post.id)])).scalar() or 0
+
+    def poll(self):
+        """passes the posts written since the last poll to the listeners of their threads"""
+        from app.models import Post
+        if not self.listeners:
+            return
+        # every new post is read, rather than those of the watched threads, so the scan starts at the latest post
+        with db.get_engine(self.app).connect() as connection:
+            rows = connection.execute(select([Post.id, Post.thread_id]).where(Post.id > self._last_id)
+                                      .order_by(Post.id)).fetchall()
+        with self._lock:
+            for post_id, thread_id in rows:
+                for listener in self.listeners.get(thread_id, ()):
+                    listener.put(post_id)
+                self._last_id = post_id
+
+    def run(self):
+        while True:
+            self._wake.wait(self.app.config['LIVE_POLL_INTERVAL'])
+            self._wake.clear()
+            try:
+                self.poll()
+            except Exception:
+                # the next poll picks up where this one failed
+                self.app.logger.exception('Could not look up new posts')
+
+
+def announce_post(thread_id):
+    """Wakes the hub to send a new post of the thread once the current transaction commits"""
+    db.session.info.setdefault('posted_threads', set()).add(thread_id)
+
+
+@event.listens_for(Session, 'after_commit')
+def wake_hub(session):
+    """wakes the hub of the current app to look up the posts of a committed transaction"""
+    thread_ids = session.info.pop('posted_threads', None)
+    if thread_ids and has_app_context() and 'live' in current_app.extensions:
+        current_app.extensions['live'].wake(thread_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def forget_posts(session):
+    """forgets the posts of a transaction that was rolled back"""
+    session.info.pop('posted_threads', None)
+
+
+def format_event(post_id, data):
+    """formats an event, prefixing each line of its data as the event stream format requires"""
+    return 'event: post\nid: {}\n{}\n\n'.format(post_id, ''.join('data: {}\n'.format(line)
+                                                                   for line in data.strip().splitlines()))
+
+
+def stream(thread_id, last_id, render):
+    """
+    Returns the event stream of the posts of a thread, or a 503 response if the process has no room for another
+
+    Parameters
+    ----------
+    thread_id : Integer
+        The thread whose posts are sent
+    last_id : Integer
+        The id of the latest post the reader has, whose later posts are sent first
+    render : function
+        Called with a list of post ids, returning the (id, rendered post) of those in the thread in the order they
+        are shown
+    """
+
+    hub = current_app.extensions['live']
+    listener = hub.subscribe(thread_id)
+    if listener is None:
+        return Response('Too many live readers, reload the page to see new posts', status=503,
+                        headers={'Retry-After': '60'})
+    closes_at = time.monotonic() + current_app.config['LIVE_MAX_AGE']
+
+    def events(post_ids):
+        latest = last_id
+        yield 'retry: {}\n\n'.format(RETRY)
+        while time.monotonic() < closes_at:
+            post_ids = [post_id for post_id in post_ids if post_id is not None and post_id > latest]
+            for start in range(0, len(post_ids), current_app.config['PAGE_SIZE']):
+                for post_id, data in render(post_ids[start:start + current_app.config['PAGE_SIZE']]):
+                    yield format_event(post_id, data)
+            if post_ids:
+                latest = max(post_ids)
+            else:
+                yield ': keepalive\n\n'
+            # the stream stays open far longer than a request, and must not hold a connection while it waits
+            db.session.remove()
+            # rendering may have run past the stream's age, which a queue can not wait a negative time for
+            remaining = closes_at - time.monotonic()
+            if hub.closed or remaining <= 0:
+                return
+            post_ids = listener.wait(min(current_app.config['LIVE_KEEPALIVE'], max(0, remaining)))
+
+    # the posts written since the reader's latest, as the listener only hears of the posts written from now on
+    from app.models import Post
+    try:
+        backlog = [post_id for post_id, in db.session.query(Post.id).filter(Post.thread_id == thread_id,
+                                                                              Post.id > last_id).order_by(Post.id)]
+    except Exception:
+        hub.unsubscribe(listener)
+        raise
+    response = Response(stream_with_context(events(backlog)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # called by the server once the stream ends or the reader goes, even if the stream was never started
+    response.call_on_close(lambda: hub.unsubscribe(listener))
+    return response
+
+
+def init_app(app):
+    """Gives the app the Hub that its streams of new posts listen to"""
+    app.extensions['live'] = Hub(app)
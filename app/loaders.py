@@ -1,11 +1,125 @@
-from app import app
+"""
+loaders.py holds the Flask-Login user loader, which is run at the start of every request by a logged in user.
+
+Notes
+-----
+    Loading the logged in user is the most frequent query the website runs, so the loader first checks a per-process
+    cache of each user's column values. A cached user is placed into the request's database session without a query,
+    and behaves like any other loaded user; relationships are still loaded lazily when used.
+    Entries expire after USER_CACHE_TTL seconds, the least recently used entry is dropped once USER_CACHE_SIZE users are
+    cached, and the routes that change a user (edit_profile and change_password) invalidate the user's entry.
+    Each process has its own cache, so a change made by another process is seen once the entry expires.
+
+Classes
+-------
+UserCache
+    A thread safe LRU cache of user records with a time to live, counting hits and misses
+
+Methods
+-------
+init_app(app)
+    Sets up Flask-Login on an app
+load_user(user_id) : User
+    Returns the logged in user, from the cache when possible
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+from app.config import Config
 from app.models import *
 from flask_login import LoginManager
 
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'auth.login'
+
+
+class UserCache:
+    """
+    UserCache keeps the column values of recently loaded users, rather than the User objects themselves, as objects
+    belong to the database session of a single request.
+
+    Attributes
+    ----------
+    size : Integer
+        The maximum number of users kept
+    ttl : Float
+        Seconds an entry is used for before the user is loaded again
+    hits : Integer
+        The number of users returned from the cache
+    misses : Integer
+        The number of users loaded from the database
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        """Returns the user with the given id attached to the current session, or None if it is not cached"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(user_id, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            values = entry[1]
+        user = User.__mapper__.class_manager.new_instance()
+        for key, value in values.items():
+            setattr(user, key, value)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+
+    def put(self, user):
+        """Caches the column values of a loaded user"""
+        values = {attr.key: getattr(user, attr.key) for attr in inspect(User).column_attrs}
+        with self._lock:
+            self._entries[user.id] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        """Drops a user's entry, after the user has been changed"""
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        """Drops every entry, eg. when the database is replaced"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Returns the hit and miss counts along with the number of users cached"""
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, size=len(self._entries))
+
+
+user_cache = UserCache(Config.USER_CACHE_SIZE, Config.USER_CACHE_TTL)
+
+
+def init_app(app):
+    """Sets up Flask-Login on the app, and sizes the user cache from its config"""
+    login_manager.init_app(app)
+    user_cache.size = app.config['USER_CACHE_SIZE']
+    user_cache.ttl = app.config['USER_CACHE_TTL']
+
 
 @login_manager.user_loader
 def load_user(user_id):
-	return User.query.get(int(user_id))
\ No newline at end of file
+    """Returns the logged in user from the cache, or loads and caches it, or returns None if there is no such user"""
+    user_id = int(user_id)
+    user = user_cache.get(user_id)
+    if user is None:
+        user = User.query.get(user_id)
+        if user is not None:
+            user_cache.put(user)
+    return user
@@ -0,0 +1,254 @@
+"""
+metrics.py measures what each request costs and serves the measurements at /metrics in Prometheus' text format.
+
+Notes
+-----
+    Every request is recorded under the endpoint that served it, eg. threads.view_thread, or 'unmatched' for a URL
+    with no route, in a histogram of each of:
+        cs2005_request_duration_seconds, from the start of the request to its response
+        cs2005_sql_statements, the number of SQL statements the request executed
+        cs2005_sql_duration_seconds, the time spent executing them
+        cs2005_template_duration_seconds, the time spent rendering templates, including any queries run while rendering
+        cs2005_response_size_bytes, the length of the response body, or 0 when it is not known
+    along with cs2005_responses_total, counting responses by endpoint and status code.
+    Statements are counted by SQLAlchemy engine events on every engine, so the read and write pools of database.py are
+    both included, and only statements run during a request are recorded. Templates are timed by the template class
+    of the app's Jinja environment, and templates rendered within another, such as the cached rows of fragments.py,
+    are part of the outer template's time.
+    The hit and miss counts of the user and fragment caches are exported as counters, and their sizes as gauges.
+    The costs are kept in memory by each process, so a server running several processes reports those of whichever
+    process answers the scrape. Recording a request takes a few dictionary updates under a lock, so METRICS_ENABLED
+    can be left on; setting it to False leaves requests unrecorded and /metrics unregistered.
+
+Classes
+-------
+Histogram
+    Counts of observed values in cumulative buckets, by endpoint
+Metrics
+    The histograms and counters of an app
+
+Methods
+-------
+init_app(app)
+    Records the requests of an app and adds the /metrics route
+metrics() : Response
+    Route returning every metric in Prometheus' text format
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from flask import Response, current_app, g, has_request_context, request
+from jinja2 import Template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app.fragments import fragment_cache
+from app.loaders import user_cache
+
+PREFIX = 'cs2005_'
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+SECONDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENTS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+BYTES = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def format_labels(labels):
+    """formats (name, value) pairs as {name="value",...}, escaping the values as the text format requires"""
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', r'\\').replace('"', r'\"')
+                                           .replace('\n', r'\n')) for name, value in labels) + '}'
+
+
+def format_value(value):
+    """formats a number as the text format expects, eg. 3, 0.25 or +Inf"""
+    if value == float('inf'):
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    """
+    Histogram counts observed values in buckets by endpoint, along with their sum
+
+    Attributes
+    ----------
+    name : String
+        The metric's name, without PREFIX
+    description : String
+        The metric's HELP text
+    buckets : tuple
+        The upper bounds of the buckets, in increasing order; the +Inf bucket is added when exported
+    """
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, endpoint, value):
+        """Counts a value in the smallest bucket whose bound it does not exceed"""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(endpoint)
+            if series is None:
+                series = self._series[endpoint] = [[0] * (len(self.buckets) + 1), 0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self):
+        """Returns the lines of the histogram in the text format, with the buckets counted cumulatively"""
+        name = PREFIX + self.name
+        lines = ['# HELP {} {}'.format(name, self.description), '# TYPE {} histogram'.format(name)]
+        with self._lock:
+            series = sorted((endpoint, list(counts), total, count) for endpoint, (counts, total, count)
+                            in self._series.items())
+        for endpoint, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket
+                lines.append('{}_bucket{} {}'.format(
+                    name, format_labels([('endpoint', endpoint), ('le', format_value(bound))]), cumulative))
+            lines.append('{}_sum{} {}'.format(name, format_labels([('endpoint', endpoint)]), format_value(total)))
+            lines.append('{}_count{} {}'.format(name, format_labels([('endpoint', endpoint)]), count))
+        return lines
+
+
+class Metrics:
+    """
+    Metrics holds the histograms of an app's requests and the count of its responses by endpoint and status
+
+    Attributes
+    ----------
+    histograms : dict
+        The Histogram of each cost of a request, by name
+    responses : dict
+        The number of responses, by (endpoint, status code)
+    """
+
+    def __init__(self):
+        self.histograms = {histogram.name: histogram for histogram in (
+            Histogram('request_duration_seconds', 'Time from the start of a request to its response.', SECONDS),
+            Histogram('sql_statements', 'SQL statements executed by a request.', STATEMENTS),
+            Histogram('sql_duration_seconds', 'Time a request spent executing SQL statements.', SECONDS),
+            Histogram('template_duration_seconds', 'Time a request spent rendering templates.', SECONDS),
+            Histogram('response_size_bytes', 'Length of the response body.', BYTES),
+        )}
+        self.responses = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, status, timings, size):
+        """Records the costs of a finished request"""
+        self.histograms['request_duration_seconds'].observe(endpoint, time.perf_counter() - timings.start)
+        self.histograms['sql_statements'].observe(endpoint, timings.statements)
+        self.histograms['sql_duration_seconds'].observe(endpoint, timings.sql_seconds)
+        self.histograms['template_duration_seconds'].observe(endpoint, timings.template_seconds)
+        self.histograms['response_size_bytes'].observe(endpoint, size)
+        with self._lock:
+            self.responses[endpoint, status] = self.responses.get((endpoint, status), 0) + 1
+
+    def collect(self):
+        """Returns every metric in the text format, ending with a newline"""
+        lines = []
+        for histogram in self.histograms.values():
+            lines.extend(histogram.collect())
+        name = PREFIX + 'responses_total'
+        lines.extend(['# HELP {} Responses sent, by endpoint and status code.'.format(name),
+                      '# TYPE {} counter'.format(name)])
+        with self._lock:
+            responses = sorted(self.responses.items())
+        for (endpoint, status), count in responses:
+            lines.append('{}{} {}'.format(name, format_labels([('endpoint', endpoint), ('status', status)]), count))
+        for cache, stats in (('user', user_cache.stats()), ('fragment', fragment_cache.stats())):
+            for kind, outcome in (('hits', 'found'), ('misses', 'did not find')):
+                name = '{}{}_cache_{}_total'.format(PREFIX, cache, kind)
+                lines.extend(['# HELP {} Lookups that {} an entry in the {} cache.'.format(name, outcome, cache),
+                              '# TYPE {} counter'.format(name), '{} {}'.format(name, stats[kind])])
+            name = '{}{}_cache_size'.format(PREFIX, cache)
+            lines.extend(['# HELP {} Entries held by the {} cache.'.format(name, cache),
+                          '# TYPE {} gauge'.format(name), '{} {}'.format(name, stats['size'])])
+        return '\n'.join(lines) + '\n'
+
+
+class RequestTimings:
+    """The costs of the current request, kept on flask.g while it is served"""
+
+    __slots__ = ('start', 'statements', 'sql_seconds', 'template_seconds', 'rendering')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.rendering = False
+
+
+def current_timings():
+    """returns the timings of the request being served, or None outside of a recorded request"""
+    if not has_request_context():
+        return None
+    return g.get('request_timings')
+
+
+# region Hooks
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    if current_timings() is not None:
+        context.metrics_start = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    timings = current_timings()
+    start = getattr(context, 'metrics_start', None)
+    if timings is not None and start is not None:
+        timings.statements += 1
+        timings.sql_seconds += time.perf_counter() - start
+
+
+class TimedTemplate(Template):
+    """A template that adds the time it takes to render to the current request's timings, unless nested in another"""
+
+    def render(self, *args, **kwargs):
+        timings = current_timings()
+        if timings is None or timings.rendering:
+            return Template.render(self, *args, **kwargs)
+        timings.rendering = True
+        start = time.perf_counter()
+        try:
+            return Template.render(self, *args, **kwargs)
+        finally:
+            timings.template_seconds += time.perf_counter() - start
+            timings.rendering = False
+
+
+def start_request():
+    g.request_timings = RequestTimings()
+
+
+def finish_request(response):
+    timings = g.pop('request_timings', None)
+    if timings is not None:
+        current_app.extensions['metrics'].record(request.endpoint or 'unmatched', response.status_code, timings,
+                                                 response.content_length or 0)
+    return response
+
+
+# endregion
+
+def metrics():
+    """Returns the metrics of this process in Prometheus' text format"""
+    return Response(current_app.extensions['metrics'].collect(), content_type=CONTENT_TYPE)
+
+
+def init_app(app):
+    """Records the costs of the app's requests and adds the /metrics route, when METRICS_ENABLED is set"""
+    if not app.config.get('METRICS_ENABLED'):
+        return
+    app.extensions['metrics'] = Metrics()
+    app.jinja_env.template_class = TimedTemplate
+    app.before_request(start_request)
+    app.after_request(finish_request)
+    app.add_url_rule('/metrics', 'metrics', metrics)
@@ -0,0 +1,221 @@
+"""
+migrations.py holds the versioned changes to the database schema, so that an existing database such as data.db can be
+upgraded in place with `flask upgrade-database`.
+
+Notes
+-----
+    The version of a database is the number of the last migration applied to it, stored in the 'schema_version' table.
+    Upgrading applies each later migration in order, each in its own transaction along with the new version number.
+    A new database has every table created from the models by db.create_all(), and is stamped with the latest version.
+    Migrations check what already exists before changing it, as databases created before this module was added had
+    some of these changes applied by hand. A migration must only read the columns that exist at its version, so it
+    uses core selects of named columns rather than querying the models, which map the latest schema.
+    A new migration is added with the migration() decorator, with the next version number, and the models are changed
+    to match so that new databases are created the same way.
+
+Methods
+-------
+migration(version, description)
+    Decorator registering a function as a migration
+current_version(connection) : Integer
+    The version of a database, 0 if it has never been upgraded
+upgrade(echo) : list
+    Applies the migrations a database has not had yet, returning their versions
+"""
+
+from sqlalchemy import and_, func, inspect, select, text
+from sqlalchemy.schema import CreateColumn
+from app import db, search
+from app.jobs import Job
+from app.models import User, Post, Thread, FeedEntry, ThreadSubscriptions, TopicSubscriptions, \
+    group_user_association, email_digest
+
+schema_version = db.Table('schema_version', db.metadata,
+                          db.Column('version', db.Integer, nullable=False)
+                          )
+
+# registered migrations as (version, description, function), in order of version
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Registers the decorated function, which is called with a database connection, as a migration"""
+
+    def register(function):
+        MIGRATIONS.append((version, description, function))
+        MIGRATIONS.sort(key=lambda entry: entry[0])
+        return function
+
+    return register
+
+
+# region Helpers
+
+def add_column(connection, column):
+    """adds a model's column to its table, unless the table already has it"""
+    existing = [info['name'] for info in inspect(connection).get_columns(column.table.name)]
+    if column.name not in existing:
+        connection.execute('ALTER TABLE {} ADD COLUMN {}'.format(
+            connection.dialect.identifier_preparer.format_table(column.table),
+            CreateColumn(column).compile(dialect=connection.dialect)))
+
+
+def create_table(connection, table):
+    """creates a model's table unless it exists, returning True if it was created"""
+    if table.name in inspect(connection).get_table_names():
+        return False
+    table.create(connection)
+    return True
+
+
+def create_indexes(connection, table, *names):
+    """creates the named indexes declared on a model's table, or all of them, that the database does not have yet"""
+    existing = {info['name'] for info in inspect(connection).get_indexes(table.name)}
+    for index in table.indexes:
+        if index.name not in existing and (not names or index.name in names):
+            index.create(connection)
+
+
+def deduplicate(connection, table, *columns):
+    """
+    keeps a single row of each set of rows with the same values in the given columns, so a unique index can be added.
+    The first row of each set is kept, with its 'unseen' flag set if any of the set was unseen.
+    """
+
+    columns = [table.c[name] for name in columns]
+    duplicates = connection.execute(select(columns).group_by(*columns).having(func.count() > 1)).fetchall()
+    for values in duplicates:
+        condition = and_(*[column == value for column, value in zip(columns, values)])
+        rows = connection.execute(select([table]).where(condition).order_by(*table.primary_key.columns)).fetchall()
+        kept = dict(rows[0])
+        if 'unseen' in kept:
+            kept['unseen'] = any(row['unseen'] for row in rows)
+        connection.execute(table.delete().where(condition))
+        connection.execute(table.insert(), kept)
+
+
+# endregion
+
+# region Migrations
+
+@migration(1, 'Thread summaries and keyset pagination indexes')
+def thread_summaries(connection):
+    """stores each thread's author, creation time, post count and latest post, so listings need not load posts"""
+    table = Thread.__table__
+    for name in ('created_at', 'author_id', 'last_post_at', 'last_poster_id', 'post_count'):
+        add_column(connection, table.c[name])
+    connection.execute(text('''
+        UPDATE "Thread" SET
+            created_at = (SELECT MIN(timestamp) FROM "Post" WHERE thread_id = "Thread".id),
+            author_id = (SELECT author_id FROM "Post" WHERE thread_id = "Thread".id
+                         ORDER BY timestamp, id LIMIT 1),
+            last_post_at = (SELECT MAX(timestamp) FROM "Post" WHERE thread_id = "Thread".id),
+            last_poster_id = (SELECT author_id FROM "Post" WHERE thread_id = "Thread".id
+                              ORDER BY timestamp DESC, id DESC LIMIT 1),
+            post_count = (SELECT COUNT(*) FROM "Post" WHERE thread_id = "Thread".id)
+        WHERE post_count IS NULL
+    '''))
+    create_indexes(connection, table, 'ix_Thread_group_id_created_at', 'ix_Thread_topic_id_created_at')
+    create_indexes(connection, Post.__table__, 'ix_Post_thread_id_timestamp')
+
+
+@migration(2, 'Stored home feeds and the background job queue')
+def feeds_and_jobs(connection):
+    """adds the feed and jobs tables, filling in the feed of every user when the table is new"""
+    create_table(connection, Job.__table__)
+    if create_table(connection, FeedEntry.__table__):
+        # only the columns the User table has at this version, as later migrations add to it
+        for user in connection.execute(select([User.__table__.c.id, User.__table__.c.username])).fetchall():
+            FeedEntry.rebuild(user)
+        db.session.flush()
+
+
+@migration(3, 'Full-text search index')
+def search_index(connection):
+    """adds and fills the FTS5 search index, on SQLite only"""
+    if search.indexed(connection) and 'search_index' not in inspect(connection).get_table_names():
+        search.reindex(connection)
+
+
+@migration(4, 'Indexes for the hot paths and unique subscriptions')
+def hot_path_indexes(connection):
+    """
+    indexes every foreign key the routes filter on, and stops a user subscribing to the same thread or topic,
+    or joining the same group, twice
+    """
+    deduplicate(connection, ThreadSubscriptions.__table__, 'user_id', 'thread_id')
+    deduplicate(connection, TopicSubscriptions.__table__, 'user_id', 'topic_id')
+    deduplicate(connection, group_user_association, 'user_id', 'group_id')
+    for table in (ThreadSubscriptions.__table__, TopicSubscriptions.__table__, group_user_association,
+                  Post.__table__):
+        create_indexes(connection, table)
+
+
+@migration(5, 'Thread change times for conditional responses')
+def thread_updated_at(connection):
+    """stores the time each thread last changed, starting from the time of its latest post"""
+    add_column(connection, Thread.__table__.c.updated_at)
+    connection.execute(text('UPDATE "Thread" SET updated_at = last_post_at WHERE updated_at IS NULL'))
+
+
+@migration(6, 'Stored avatar digests')
+def avatar_digests(connection):
+    """stores the digest of each user's email address, which addresses their avatar"""
+    table = User.__table__
+    add_column(connection, table.c.avatar_digest)
+    for user_id, email in connection.execute(select([table.c.id, table.c.email])
+                                             .where(table.c.avatar_digest == None)).fetchall():
+        connection.execute(table.update().where(table.c.id == user_id), avatar_digest=email_digest(email))
+
+
+# endregion
+
+def current_version(connection):
+    """Returns the version of the database, 0 if it has never been upgraded"""
+    if schema_version.name not in inspect(connection).get_table_names():
+        return 0
+    return connection.execute(select([func.max(schema_version.c.version)])).scalar() or 0
+
+
+def set_version(connection, version):
+    """records the version of the database"""
+    connection.execute(schema_version.delete())
+    connection.execute(schema_version.insert(), version=version)
+
+
+def upgrade(echo=print):
+    """
+    Brings the database up to date, creating it if it has no tables
+
+    Parameters
+    ----------
+    echo : function
+        Called with a line describing each migration applied
+
+    Returns
+    -------
+    list
+        The versions of the migrations applied
+    """
+
+    connection = db.session.connection()
+    latest = MIGRATIONS[-1][0]
+    if User.__tablename__ not in inspect(connection).get_table_names():
+        db.metadata.create_all(connection)
+        set_version(connection, latest)
+        db.session.commit()
+        echo('Created a new database at version {}'.format(latest))
+        return []
+    create_table(connection, schema_version)
+    version = current_version(connection)
+    applied = []
+    for number, description, function in MIGRATIONS:
+        if number <= version:
+            continue
+        connection = db.session.connection()
+        function(connection)
+        set_version(connection, number)
+        db.session.commit()
+        applied.append(number)
+        echo('Applied migration {}: {}'.format(number, description))
+    return applied
@@ -18,15 +18,32 @@ Topic : db.Model
     Topics are user-submitted strings that are used to classify and group threads by topic
 Group : db.Model
     Discussion group with a list of users and threads made within each respective group
+FeedEntry : db.Model
+    A precomputed row of a user's home feed, written whenever a post is added to a thread
+
+Notes
+-----
+    The constructors of User, Post, Thread, Topic and Group commit the new object with db.commit(), unless they are
+    called inside `with db.batch():`, which commits everything created in the block at once, see database.py.
 """
 
 from app import db
+from app.fragments import invalidate_thread
+from app.jobs import enqueue
+from app.live import announce_post
 from datetime import datetime, timedelta
+from flask import url_for
 from flask_login import UserMixin
+from sqlalchemy import and_, exists, literal, select, union
 from sqlalchemy.ext.associationproxy import association_proxy
 from hashlib import md5
 
 
+def email_digest(email):
+    """returns the md5 digest of an email address, which addresses the avatar of its user"""
+    return md5((email or '').strip().lower().encode('utf-8')).hexdigest()
+
+
 # region Association Classes
 # Association classes are used by SQLAlchemy to manage many-to-many relationships
 # Outside of this module they should not need to be referenced directly
@@ -53,6 +70,10 @@ class ThreadSubscriptions(db.Model):
     """
 
     __tablename__ = 'thread_subscriptions'
+    __table_args__ = (
+        db.Index('uq_thread_subscriptions_user_id_thread_id', 'user_id', 'thread_id', unique=True),
+        db.Index('ix_thread_subscriptions_thread_id', 'thread_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('User.username'))
     thread_id = db.Column(db.Integer, db.ForeignKey('Thread.id'))
@@ -90,6 +111,10 @@ class TopicSubscriptions(db.Model):
     """
 
     __tablename__ = 'topic_subscriptions'
+    __table_args__ = (
+        db.Index('uq_topic_subscriptions_user_id_topic_id', 'user_id', 'topic_id', unique=True),
+        db.Index('ix_topic_subscriptions_topic_id', 'topic_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('User.id'))
     topic_id = db.Column(db.Integer, db.ForeignKey('Topic.id'))
@@ -107,12 +132,34 @@ class TopicSubscriptions(db.Model):
 
 group_user_association = db.Table('group_user', db.metadata,
                                   db.Column('user_id', db.Integer, db.ForeignKey('User.id')),
-                                  db.Column('group_id', db.Integer, db.ForeignKey('Group.id'))
+                                  db.Column('group_id', db.Integer, db.ForeignKey('Group.id')),
+                                  db.Index('uq_group_user_user_id_group_id', 'user_id', 'group_id', unique=True),
+                                  db.Index('ix_group_user_group_id', 'group_id')
                                   )
 
 
 # endregion
 
+def format_time(timestamp, relative=True):
+    """
+    Formats a UTC timestamp as a nicely formatted string, see Post.get_time
+    """
+
+    if timestamp is None:
+        return ""
+    diff = datetime.utcnow() - timestamp
+    if not relative:
+        dt = timestamp.strftime('%b %d, %Y at %X')
+        return dt
+    # relative time
+    if diff < timedelta(hours=1):
+        return str(int(diff.seconds / 60)) + " minutes ago"
+    if diff < timedelta(hours=24):
+        return str(int(diff.seconds / 3600)) + " hours ago"
+    else:
+        return str(int(diff.days)) + " days ago"
+
+
 class User(UserMixin, db.Model):
     """
     The User class is used to store user profile information, such as username, password,
@@ -128,6 +175,8 @@ class User(UserMixin, db.Model):
         User's password for logging onto the site.
     email : String
         User's email address
+    avatar_digest : String
+        md5 digest of the user's email address, which addresses their avatar (see avatars.py)
     about_me : Text
         A section of the user profile dedicated to a biography about said user
     posts : Post
@@ -148,6 +197,7 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(64), index=True, unique=True)
     password = db.Column(db.String(128))
     email = db.Column(db.String(128), index=True, unique=True)
+    avatar_digest = db.Column(db.String(32))
     about_me = db.Column(db.Text())
     # relationships
     posts = db.relationship('Post', backref='author', lazy='dynamic')
@@ -181,7 +231,7 @@ class User(UserMixin, db.Model):
         for key, value in kwargs.items():
             setattr(self, key, value)
         db.session.add(self)
-        db.session.commit()
+        db.commit()
 
     def has_notifications(self):
         """returns True if the user has unseen notifications"""
@@ -203,31 +253,32 @@ class User(UserMixin, db.Model):
         topics = []
         for topic in self.topic_id:
             if topic.unseen:
-                topics.append(topic.thread)
+                topics.append(topic.topic)
         return topics
 
     def get_feed(self):
-        """returns a set of threads created by other users, ordered latest first"""
-        feed = set()
-        for thread in self.subs:
-            for thread_post in thread.posts:
-                if thread_post.author == self:
-                    continue
-                feed.add(thread_post)
-        for topic in self.topics:
-            for topic_thread in topic.threads:
-                for topic_post in topic_thread.posts:
-                    if topic_post.author == self:
-                        continue
-                    feed.add(topic_post)
-        feed = sorted(list(feed), key=lambda post: post.timestamp, reverse=True)
-        return feed
+        """
+        returns a query of posts created by other users in threads and topics the user follows, ordered latest first
+
+        Notes
+        -----
+            The feed is read from the precomputed FeedEntry table, see FeedEntry for how it is kept up to date.
+            The query should be paged on (FeedEntry.timestamp, FeedEntry.post_id), which the feed table indexes.
+        """
+        return Post.query.join(FeedEntry, FeedEntry.post_id == Post.id) \
+            .filter(FeedEntry.user_id == self.id) \
+            .order_by(FeedEntry.timestamp.desc(), FeedEntry.post_id.desc()) \
+            .options(db.joinedload('author'))
+
+    @db.validates('email')
+    def set_avatar_digest(self, key, email):
+        """stores the digest of a new email address, so it is not computed each time the avatar is shown"""
+        self.avatar_digest = email_digest(email)
+        return email
 
     def avatar(self, size):
-        """returns an adjusted profile avatar for a user's profile"""
-        digest = md5(self.email.lower().encode('utf-8')).hexdigest()
-        return 'https://www.cs2005group.com/avatar/{}?d=identicon&s={}'.format(
-            digest, size)
+        """returns the URL of the user's identicon avatar at the given size in pixels"""
+        return url_for('avatar', digest=self.avatar_digest or email_digest(self.email), size=size)
 
     def __repr__(self):
         """
@@ -261,6 +312,10 @@ class Post(db.Model):
     """
 
     __tablename__ = "Post"
+    __table_args__ = (
+        db.Index('ix_Post_thread_id_timestamp', 'thread_id', 'timestamp', 'id'),
+        db.Index('ix_Post_author_id_timestamp', 'author_id', 'timestamp'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(128))
     text = db.Column(db.Text())
@@ -285,17 +340,7 @@ class Post(db.Model):
             If False, display data as human readable string, eg. ""
         """
 
-        diff = datetime.utcnow() - self.timestamp
-        if not relative:
-            dt = self.timestamp.strftime('%b %d, %Y at %X')
-            return dt
-        # relative time
-        if diff < timedelta(hours=1):
-            return str(int(diff.seconds / 60)) + " minutes ago"
-        if diff < timedelta(hours=24):
-            return str(int(diff.seconds / 3600)) + " hours ago"
-        else:
-            return str(int(diff.days)) + " days ago"
+        return format_time(self.timestamp, relative)
 
     def __init__(self, user, text, thread=None, title=None):
         """
@@ -324,9 +369,10 @@ class Post(db.Model):
         self.author = user
         self.text = text
         self.title = title
+        self.timestamp = datetime.utcnow()
         self.thread = thread
         if thread is not None:
-            if thread.posts == []:
+            if not thread.post_count:
                 if title is None:
                     raise ValueError("You cannot initialize an empty thread with a post that has no title!")
                 else:
@@ -334,7 +380,7 @@ class Post(db.Model):
             else:
                 thread.add_post(self)
         db.session.add(self)
-        db.session.commit()
+        db.commit()
 
 
 class Thread(db.Model):
@@ -346,6 +392,8 @@ class Thread(db.Model):
         Threads must be linked to a 'first post', which must have a title and ultimately the 'name' of the thread.
         The first post can be initialized by passing it as an argument in the constructor;
         otherwise, use the add_first_post() method.
+        The author, post count and latest post of a thread are stored on the thread itself by add_first_post() and
+        add_post(), so listings can be rendered without loading every thread's posts.
     
     Attributes
     ----------
@@ -353,6 +401,22 @@ class Thread(db.Model):
         Primary key
     name : String
         Title of the post thread.
+    created_at : DateTime
+        UTC time the thread was created, which is the time of the first post
+    author_id : Integer
+        Reference to the author of the first post
+    author : User
+        The author of the first post
+    last_post_at : DateTime
+        UTC time of the latest post in the thread
+    last_poster_id : Integer
+        Reference to the author of the latest post
+    last_poster : User
+        The author of the latest post
+    post_count : Integer
+        The number of posts in the thread
+    updated_at : DateTime
+        UTC time anything shown on the thread's page last changed, see touch()
     posts : Post
         A list of posts in the thread
     topic_id : Integer
@@ -370,8 +434,20 @@ class Thread(db.Model):
     """
 
     __tablename__ = "Thread"
+    __table_args__ = (
+        db.Index('ix_Thread_group_id_created_at', 'group_id', 'created_at', 'id'),
+        db.Index('ix_Thread_topic_id_created_at', 'topic_id', 'created_at', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(128))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    author_id = db.Column(db.Integer, db.ForeignKey('User.id'))
+    author = db.relationship('User', foreign_keys=[author_id], lazy='joined')
+    last_post_at = db.Column(db.DateTime)
+    last_poster_id = db.Column(db.Integer, db.ForeignKey('User.id'))
+    last_poster = db.relationship('User', foreign_keys=[last_poster_id], lazy='joined')
+    post_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
     # relationships
     posts = db.relationship('Post', backref='thread')
     topic_id = db.Column(db.Integer, db.ForeignKey('Topic.id'))
@@ -402,12 +478,14 @@ class Thread(db.Model):
         db.session.add(self)
         if first_post:
             self.add_first_post(first_post)
-        db.session.commit()
+        db.commit()
 
     def add_first_post(self, first_post):
         """
-        Adds the first post to the top of the thread, then sets the title of the thread to the title of the post and
+        Adds the first post to the top of the thread, then sets the title and summary of the thread from the post and
         subscribes the user to the thread automatically.
+        Publishing the post to feeds, indexing it for search and notifying the topic's subscribers are left to
+        background jobs.
 
         Parameter
         ---------
@@ -419,10 +497,27 @@ class Thread(db.Model):
         self.name = first_post.title
         self.posts = [first_post]
         self.subbed = [first_post.author]
+        self.author = first_post.author
+        self.created_at = first_post.timestamp
+        self.last_post_at = first_post.timestamp
+        self.last_poster = first_post.author
+        self.post_count = 1
+        self.updated_at = first_post.timestamp
+        db.session.add(first_post)
+        db.session.flush()
+        enqueue('publish_post', post_id=first_post.id)
+        enqueue('index_post', post_id=first_post.id)
+        if self.topic is not None:
+            enqueue('notify_subscribers', thread_id=self.id, author_id=first_post.author_id)
 
     def add_post(self, post):
         """
-        Adds a post to the thread and notifies the users, while automatically subscribes the user who posted to this thread
+        Adds a post to the thread and notifies the users subscribed to the thread and its topic,
+        while automatically subscribes the user who posted to this thread.
+        The subscription and the thread's post count and latest post are written in the same transaction as the post,
+        the count being incremented in the database so concurrent replies are all counted; notifications, feeds and
+        the search index are updated by background jobs once the post is committed, see tasks.py.
+        The post is also sent to the thread's live readers once it is committed, see live.py.
 
         Parameter
         ---------
@@ -431,13 +526,23 @@ class Thread(db.Model):
         
         """
 
-        self.posts.append(post)
-        self.notify()
-        self.subbed.append(post.author)
+        post.thread = self
+        db.session.add(post)
+        if self.subscribe(post.author):
+            enqueue('follow_thread', user_id=post.author.id, thread_id=self.id)
+        enqueue('notify_subscribers', thread_id=self.id, author_id=post.author.id)
+        enqueue('publish_post', post_id=post.id)
+        enqueue('index_post', post_id=post.id)
+        self.last_post_at = post.timestamp
+        self.last_poster = post.author
+        self.post_count = Thread.post_count + 1
+        announce_post(self.id)
+        self.touch()
 
     def add_topic(self, topic):
         """
-        Adds a topic to the thread
+        Adds a topic to the thread, then has background jobs publish the posts already in the thread to the topic's
+        subscribers and notify them
 
         Parameter
         ---------
@@ -447,11 +552,53 @@ class Thread(db.Model):
         """
 
         self.topic = topic
+        posts = self.posts
+        db.session.flush()
+        for post in posts:
+            enqueue('publish_post', post_id=post.id)
+        if posts:
+            enqueue('notify_subscribers', thread_id=self.id, author_id=self.author_id)
+        self.touch()
+
+    def touch(self):
+        """
+        Records that the thread or one of its posts has changed, which changes the validators of the thread's page
+        and drops its cached listing row once the transaction commits
+        """
+        self.updated_at = datetime.utcnow()
+        invalidate_thread(self.id)
+
+    def get_time(self, relative=True):
+        """Gets the time the thread was created as a nicely formatted string, see Post.get_time"""
+        return format_time(self.created_at, relative)
+
+    def get_last_post_time(self, relative=True):
+        """Gets the time of the latest post as a nicely formatted string, see Post.get_time"""
+        return format_time(self.last_post_at, relative)
+
+    def subscribe(self, usr):
+        """Subscribes a user to the thread unless they already are, returning True if a subscription was added"""
+        db.session.flush()
+        subscription = ThreadSubscriptions.query.filter_by(thread_id=self.id, user_id=usr.username).first()
+        if subscription is not None:
+            return False
+        db.session.add(ThreadSubscriptions(user=usr, thread=self))
+        return True
+
+    def notify(self, exclude=None):
+        """
+        Sets 'unseen' flags for every subscribed user with a single UPDATE, as part of the current transaction
 
-    def notify(self):
-        """Sets 'unseen' flags for every subscribed user"""
-        for sub in self.subbed_id:
-            sub.unseen = True
+        Parameter
+        ---------
+        exclude : User
+            A user who should not be notified, such as the author of the new post
+        """
+        db.session.flush()
+        subscriptions = ThreadSubscriptions.query.filter_by(thread_id=self.id)
+        if exclude is not None:
+            subscriptions = subscriptions.filter(ThreadSubscriptions.user_id != exclude.username)
+        subscriptions.update({'unseen': True}, synchronize_session=False)
 
     def __repr__(self):
         """Represents and returns the name of the thread as a string"""
@@ -526,20 +673,32 @@ class Topic(db.Model):
             raise ValueError("You have attempted to create a Topic with a pre-existing name, use Topic.get() instead")
         self.name = name
         db.session.add(self)
-        db.session.commit()
+        db.commit()
 
     def add_thread(self, thread):
         """Creates a new thread object, appends it into a list of threads"""
         self.threads.append(thread)
 
     def add_user(self, user):
-        """Creates a new user object, appends it into a list of users subscribed to the topic"""
-        self.users.append(user)
+        """Creates a new user object, appends it into a list of users subscribed to the topic unless it already is"""
+        if user not in self.users:
+            self.users.append(user)
+
+    def notify(self, exclude=None):
+        """
+        Send notifications for users in the list of subscribed users whenever there are unseen threads related to the topic.
+        The flags are set with a single UPDATE as part of the current transaction.
 
-    def notify(self):
-        """Send notifications for users in the list of subscribed users whenever there are unseen threads related to the topic"""
-        for user in self.user_id:
-            user.unseen = True
+        Parameter
+        ---------
+        exclude : User
+            A user who should not be notified, such as the author of the new post
+        """
+        db.session.flush()
+        subscriptions = TopicSubscriptions.query.filter_by(topic_id=self.id)
+        if exclude is not None:
+            subscriptions = subscriptions.filter(TopicSubscriptions.user_id != exclude.id)
+        subscriptions.update({'unseen': True}, synchronize_session=False)
 
     def __repr__(self):
         """Represents and returns the Topic name as a string"""
@@ -600,11 +759,12 @@ class Group(db.Model):
         self.descr = descr
         if user is not None:
             self.add_user(user)
-        db.session.commit()
+        db.commit()
 
     def add_user(self, usr):
-        """Adds a single user to the discussion group"""
-        self.users.append(usr)
+        """Adds a single user to the discussion group, unless they are already a member"""
+        if usr not in self.users:
+            self.users.append(usr)
 
     def add_users(self, users):
         """Adds a list of users to the discussion group"""
@@ -614,3 +774,105 @@ class Group(db.Model):
     def __repr__(self):
         """Represents and returns the title of the discussion group as a string"""
         return "Group " + self.name
+
+
+
+class FeedEntry(db.Model):
+    """
+    The FeedEntry class stores the home feed of every user ahead of time.
+    A row is written for each user following a post's thread, or the thread's topic, when the post is added,
+    so the feed is read newest first with one indexed query instead of being rebuilt on every page view.
+
+    Notes
+    -----
+        Posts are published by Thread.add_first_post, Thread.add_post and Thread.add_topic.
+        Changing a user's subscriptions should be followed by follow() or rebuild() for that user;
+        the `flask rebuild-feed` command backfills the table for existing users.
+
+    Attributes
+    ----------
+    id : Integer
+        Primary key
+    user_id : Integer
+        Reference to the user the post is shown to
+    post_id : Integer
+        Reference to the post being shown
+    timestamp : DateTime
+        Copy of the post's timestamp, used to order the feed
+    post : Post
+        The post being shown
+    """
+
+    __tablename__ = 'feed'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'post_id'),
+        db.Index('ix_feed_user_id_timestamp', 'user_id', 'timestamp', 'post_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('User.id'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('Post.id'), nullable=False)
+    timestamp = db.Column(db.DateTime, nullable=False)
+    # relationships
+    post = db.relationship('Post')
+
+    @classmethod
+    def publish(cls, post):
+        """
+        Writes a post into the feed of every user subscribed to its thread or to the thread's topic,
+        except for the post's author
+
+        Parameter
+        ---------
+        post : Post
+            A post that has been added to a thread
+        """
+
+        db.session.add(post)
+        db.session.flush()
+        thread = post.thread
+        thread_subs = select([User.id.label('user_id')]) \
+            .where(ThreadSubscriptions.user_id == User.username) \
+            .where(ThreadSubscriptions.thread_id == thread.id)
+        topic_subs = select([TopicSubscriptions.user_id.label('user_id')]) \
+            .where(TopicSubscriptions.topic_id == thread.topic_id)
+        users = union(thread_subs, topic_subs).alias()
+        rows = select([users.c.user_id,
+                       literal(post.id).label('post_id'),
+                       literal(post.timestamp).label('timestamp')]) \
+            .where(users.c.user_id != post.author_id)
+        cls._insert(rows)
+
+    @classmethod
+    def follow(cls, user, thread):
+        """Adds the posts already in a thread to a user's feed, used when the user subscribes to the thread"""
+        db.session.flush()
+        rows = select([literal(user.id).label('user_id'), Post.id.label('post_id'), Post.timestamp]) \
+            .where(Post.thread_id == thread.id) \
+            .where(Post.author_id != user.id)
+        cls._insert(rows)
+
+    @classmethod
+    def rebuild(cls, user):
+        """Recomputes a user's whole feed from their thread and topic subscriptions"""
+        db.session.flush()
+        db.session.execute(cls.__table__.delete().where(cls.user_id == user.id))
+        from_threads = select([literal(user.id).label('user_id'), Post.id.label('post_id'), Post.timestamp]) \
+            .where(Post.thread_id == ThreadSubscriptions.thread_id) \
+            .where(ThreadSubscriptions.user_id == user.username) \
+            .where(Post.author_id != user.id)
+        from_topics = select([literal(user.id).label('user_id'), Post.id.label('post_id'), Post.timestamp]) \
+            .where(Post.thread_id == Thread.id) \
+            .where(Thread.topic_id == TopicSubscriptions.topic_id) \
+            .where(TopicSubscriptions.user_id == user.id) \
+            .where(Post.author_id != user.id)
+        cls._insert(union(from_threads, from_topics))
+
+    @classmethod
+    def _insert(cls, rows):
+        """Inserts (user_id, post_id, timestamp) rows that are not already in the feed"""
+        rows = rows.alias()
+        feed = cls.__table__
+        missing = ~exists().where(and_(feed.c.user_id == rows.c.user_id, feed.c.post_id == rows.c.post_id))
+        db.session.execute(feed.insert().from_select(
+            ['user_id', 'post_id', 'timestamp'],
+            select([rows.c.user_id, rows.c.post_id, rows.c.timestamp]).where(missing)))
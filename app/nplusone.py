@@ -0,0 +1,88 @@
+"""
+nplusone.py warns about statements a request repeats, which is how a lazy load inside a template loop shows up, eg.
+`post.thread.name` for every post of a listing loading each post's thread with its own SELECT.
+
+Notes
+-----
+    When QUERY_REPEAT_THRESHOLD is set, as it is by the development config, every SQL statement run during a request is
+    counted by its text. SQLAlchemy sends the values of a statement separately as parameters, so the lazy loads of one
+    relationship all have the same text whatever rows they load. The first time a statement runs more than
+    QUERY_REPEAT_THRESHOLD times in a request, a warning is logged naming the endpoint, the template and line that ran
+    it (or the line of Python when no template was being rendered) and the statement.
+    Walking the stack on every statement would slow every request down, so it is only walked for the statement that
+    crosses the threshold, which is enough to find the loop it is repeated in.
+    The detector is meant for development and is left off by the other configs. Tests bound the statements of a route
+    with UnitTest.query_budget instead.
+
+Methods
+-------
+init_app(app)
+    Counts the repeated statements of an app's requests when QUERY_REPEAT_THRESHOLD is set
+fingerprint(statement) : String
+    The statement with its whitespace collapsed, which is the same for every run of a parameterized statement
+caller() : String
+    The template line, or else the line of the website's own code, that is running the current statement
+"""
+
+import os
+import re
+import sys
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+MODULE = os.path.abspath(__file__)
+PACKAGE = os.path.dirname(MODULE)
+WHITESPACE = re.compile(r'\s+')
+# the length the statement is cut to in a warning
+SHOWN = 300
+
+
+def fingerprint(statement):
+    """returns the statement with runs of whitespace collapsed"""
+    return WHITESPACE.sub(' ', statement).strip()
+
+
+def caller():
+    """
+    Returns where the current statement is run from: the innermost template being rendered and its line, eg.
+    'template user.html line 40', or else the innermost line of the website's own code outside this module
+    """
+
+    frame = sys._getframe(1)
+    code_line = None
+    while frame is not None:
+        # the module of a compiled template holds the template, which maps the module's lines to the template's
+        template = frame.f_globals.get('__jinja_template__')
+        if template is not None:
+            return 'template {} line {}'.format(template.name, template.get_corresponding_lineno(frame.f_lineno))
+        filename = os.path.abspath(frame.f_code.co_filename)
+        if code_line is None and filename.startswith(PACKAGE + os.sep) and filename != MODULE:
+            code_line = '{} line {}'.format(os.path.relpath(filename, os.path.dirname(PACKAGE)), frame.f_lineno)
+        frame = frame.f_back
+    return code_line or 'unknown'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_statement(connection, cursor, statement, parameters, context, executemany):
+    if not has_request_context():
+        return
+    counts = g.get('statement_counts')
+    if counts is None:
+        return
+    key = fingerprint(statement)
+    counts[key] = counts.get(key, 0) + 1
+    if counts[key] == current_app.config['QUERY_REPEAT_THRESHOLD'] + 1:
+        current_app.logger.warning('Statement run more than %s times by %s, from %s: %s',
+                                   current_app.config['QUERY_REPEAT_THRESHOLD'], request.endpoint, caller(),
+                                   key[:SHOWN])
+
+
+def start_request():
+    g.statement_counts = {}
+
+
+def init_app(app):
+    """Counts the statements of each request of the app, warning about repeats, if QUERY_REPEAT_THRESHOLD is set"""
+    if app.config.get('QUERY_REPEAT_THRESHOLD') is not None:
+        app.before_request(start_request)
@@ -0,0 +1,139 @@
+"""
+pagination.py holds the keyset (cursor) pagination used by the listing pages of the website.
+
+Notes
+-----
+    Rather than counting rows with OFFSET, every page is fetched by comparing against the (timestamp, id) of the
+    last row the client saw, so a page costs the same no matter how far into a listing it is.
+    Cursors are passed around as url parameters: `after` requests the page following a row, `before` the page
+    preceding it, and `last` requests the final page of the listing.
+
+Classes
+-------
+Page
+    A single page of results along with the cursors of its neighbouring pages
+
+Methods
+-------
+paginate(query, columns, key, after, before, last, per_page, descending) : Page
+    Applies a keyset to a query and returns the requested page
+encode_cursor(timestamp, id) : String
+    Turns a (timestamp, id) pair into a url safe cursor
+decode_cursor(cursor) : tuple
+    Turns a cursor back into a (timestamp, id) pair, or returns None if it is malformed
+"""
+
+from datetime import datetime
+from sqlalchemy import or_
+
+CURSOR_FORMAT = '%Y%m%d%H%M%S%f'
+
+
+class Page:
+    """
+    A Page is a single page of a listing, with the cursors required to link to the pages either side of it.
+
+    Attributes
+    ----------
+    items : list
+        The rows on this page
+    has_next : Boolean
+        True if there are rows after this page
+    has_prev : Boolean
+        True if there are rows before this page
+    next_cursor : String
+        Cursor of the last row on this page, passed as `after` to get the next page
+    prev_cursor : String
+        Cursor of the first row on this page, passed as `before` to get the previous page
+    """
+
+    def __init__(self, items, key, has_next, has_prev):
+        self.items = items
+        self.has_next = has_next and bool(items)
+        self.has_prev = has_prev and bool(items)
+        self.next_cursor = encode_cursor(*key(items[-1])) if items else None
+        self.prev_cursor = encode_cursor(*key(items[0])) if items else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(timestamp, id):
+    """Returns the url safe cursor for a row's (timestamp, id)"""
+    return '{}-{}'.format(timestamp.strftime(CURSOR_FORMAT), id)
+
+
+def decode_cursor(cursor):
+    """Returns the (timestamp, id) stored in a cursor, or None if the cursor is missing or malformed"""
+    if not cursor:
+        return None
+    try:
+        timestamp, id = cursor.split('-')
+        return datetime.strptime(timestamp, CURSOR_FORMAT), int(id)
+    except ValueError:
+        return None
+
+
+def paginate(query, columns, key=None, after=None, before=None, last=False, per_page=20, descending=True):
+    """
+    Returns a single page of a query, using a keyset on a (timestamp, id) column pair
+
+    Notes
+    -----
+        The query should already be filtered; any ordering on it is replaced.
+        A composite index on the filtered columns followed by (timestamp, id) lets each page be read directly.
+
+    Parameters
+    ----------
+    query : Query
+        The query being paginated
+    columns : tuple
+        The (timestamp, id) columns that order the listing
+    key : function
+        Returns the (timestamp, id) values of a row returned by the query,
+        by default the attributes named after the columns are used
+    after : String
+        Cursor of the row preceding the requested page
+    before : String
+        Cursor of the row following the requested page
+    last : Boolean
+        If True and no cursor is given, return the final page of the listing
+    per_page : Integer
+        The maximum number of rows on a page
+    descending : Boolean
+        If True, the listing is ordered newest first
+
+    Returns
+    -------
+    Page
+        The requested page of rows
+    """
+
+    timestamp, id = columns
+    if key is None:
+        key = lambda row: (getattr(row, timestamp.key), getattr(row, id.key))
+    after = decode_cursor(after)
+    before = decode_cursor(before)
+    # reading backwards means walking the index in the opposite direction, then flipping the rows
+    backwards = before is not None or (last and after is None)
+    cursor = before if before is not None else after
+    if cursor is not None:
+        cursor_timestamp, cursor_id = cursor
+        if descending != (before is not None):
+            query = query.filter(timestamp <= cursor_timestamp, or_(timestamp < cursor_timestamp, id < cursor_id))
+        else:
+            query = query.filter(timestamp >= cursor_timestamp, or_(timestamp > cursor_timestamp, id > cursor_id))
+    if descending != backwards:
+        query = query.order_by(None).order_by(timestamp.desc(), id.desc())
+    else:
+        query = query.order_by(None).order_by(timestamp.asc(), id.asc())
+    items = query.limit(per_page + 1).all()
+    more = len(items) > per_page
+    items = items[:per_page]
+    if backwards:
+        items.reverse()
+        return Page(items, key, has_next=before is not None, has_prev=more)
+    return Page(items, key, has_next=more, has_prev=after is not None)
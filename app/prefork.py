@@ -0,0 +1,413 @@
+"""
+prefork.py serves the website from a pool of worker processes, each answering requests on a pool of threads, for
+production use on a single Linux host in place of Flask's development server.
+
+Notes
+-----
+    The Arbiter, in the parent process, opens the listening socket and forks the workers, which all accept
+    connections from it. The arbiter never builds the app itself, so each worker imports the pages, models and
+    templates afresh, which is what lets a reload deploy changes to them, and opens its own database connections.
+    Changes to the modules the arbiter imports itself (app/__init__.py, config.py, database.py and this one) need a
+    restart.
+    A new worker warms up before it accepts a connection: it builds the app, compiles every template (reading the
+    bytecode written by `flask compile-templates` when there is some), opens its database connections and checks
+    that the database answers, and only then tells the arbiter it is ready. Until then its share of the connections
+    waits in the socket's backlog for the workers already serving.
+    Each worker answers at most `threads` requests at once, and only accepts a connection when one of its threads is
+    free, leaving the rest to the other workers. The live thread streams of live.py hold a thread each, so a worker
+    lets them take at most half its threads, whatever LIVE_MAX_CONNECTIONS says.
+    Signals sent to the arbiter:
+        SIGHUP reloads gracefully: a new set of workers is forked and warmed up, then the old workers are stopped.
+            The socket stays open throughout, so no connection is refused, and should the new workers fail to warm
+            up, they are stopped and the old workers are kept.
+        SIGTERM or SIGINT stops the server: the workers stop accepting connections and finish the requests they
+            have, or are killed after graceful_timeout seconds.
+    A worker whose resident memory grows past max_memory MiB is recycled: it stops accepting connections, finishes
+    its requests and exits, and the arbiter forks a replacement. Workers also exit should the arbiter die.
+    Live thread streams are closed when their worker stops, and the browsers reconnect to another worker.
+
+Classes
+-------
+PoolServer : BaseWSGIServer
+    Werkzeug's WSGI server, answering requests on a bounded pool of threads from an inherited socket
+Arbiter
+    Forks, replaces and reloads the worker processes
+
+Methods
+-------
+listen(bind) : socket.socket
+    Opens the listening socket for a host:port address
+warm_up(app)
+    Compiles the templates and opens the database connections of a worker's app
+resident_memory() : Integer
+    The resident memory of the current process, in bytes
+"""
+
+import os
+import select
+import signal
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.pool import QueuePool
+from werkzeug.serving import BaseWSGIServer
+
+# the exit status of a worker that stopped to be recycled
+RECYCLED = 3
+# the exit status of a worker that failed to warm up
+FAILED = 4
+# seconds between a worker's checks of its memory and of the arbiter
+MONITOR_INTERVAL = 1.0
+BACKLOG = 2048
+
+
+def log(message, *args):
+    print('[{}] {}'.format(os.getpid(), message.format(*args)), flush=True)
+
+
+def listen(bind):
+    """Opens a non-blocking listening socket for a 'host:port' address, which the workers share"""
+    host, port = bind.rsplit(':', 1)
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host.strip('[]'), int(port)))
+    sock.listen(BACKLOG)
+    # every worker is woken by a new connection, and all but one find nothing to accept
+    sock.setblocking(False)
+    sock.set_inheritable(True)
+    return sock
+
+
+def resident_memory():
+    """returns the resident memory of the current process in bytes, read from /proc"""
+    with open('/proc/self/statm') as statm:
+        return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class PoolServer(BaseWSGIServer):
+    """
+    PoolServer answers the requests of a socket it inherited on a pool of threads, accepting a connection only when
+    a thread is free
+
+    Attributes
+    ----------
+    threads : Integer
+        The number of requests answered at once
+    """
+
+    multithread = True
+
+    def __init__(self, app, sock, threads):
+        host, port = sock.getsockname()[:2]
+        BaseWSGIServer.__init__(self, host, port, app, fd=sock.fileno())
+        self.threads = threads
+        self._slots = threading.BoundedSemaphore(threads)
+        self._pool = ThreadPoolExecutor(threads)
+
+    def get_request(self):
+        self._slots.acquire()
+        try:
+            request, address = self.socket.accept()
+        except OSError:
+            # another worker accepted the connection
+            self._slots.release()
+            raise
+        request.setblocking(True)
+        return request, address
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def shutdown_request(self, request):
+        # called once for every accepted connection, whether it was answered or refused
+        try:
+            BaseWSGIServer.shutdown_request(self, request)
+        finally:
+            self._slots.release()
+
+    def finish(self):
+        """waits for the requests being answered once serve_forever() has returned"""
+        self._pool.shutdown(wait=True)
+
+
+def warm_up(app):
+    """Compiles every template of the app and opens its database connections, failing if the database does not answer"""
+    from app import db
+    from app.templating import compile_templates
+    with app.app_context():
+        compile_templates()
+        engines = [db.engine] + list(db.get_split_engines(app) or ())
+        for engine in engines:
+            # a pool keeps the connections checked back in, up to its size
+            size = engine.pool.size() if isinstance(engine.pool, QueuePool) else 1
+            connections = [engine.connect() for i in range(size)]
+            for connection in connections:
+                connection.execute('SELECT 1')
+                connection.close()
+
+
+def run_worker(sock, ready, config, threads, max_memory):
+    """
+    Warms up an app and serves its requests until the worker is told to stop, returning the worker's exit status
+
+    Parameters
+    ----------
+    sock : socket.socket
+        The listening socket
+    ready : Integer
+        The file descriptor written to once the worker is ready to accept connections
+    config : String
+        The name of the config to build the app with
+    threads : Integer
+        The number of requests answered at once
+    max_memory : Integer
+        The MiB of resident memory past which the worker is recycled, or None
+    """
+
+    from app import create_app
+    # the arbiter handles the signals sent to the process group, eg. by Ctrl-C in a terminal
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    # until the worker serves, it has no requests to finish and is simply stopped
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    arbiter = os.getppid()
+    try:
+        app = create_app(config)
+        app.config['LIVE_MAX_CONNECTIONS'] = min(app.config['LIVE_MAX_CONNECTIONS'], threads // 2)
+        warm_up(app)
+        server = PoolServer(app, sock, threads)
+    except Exception:
+        traceback.print_exc()
+        return FAILED
+    status = [0]
+
+    def stop(code=0):
+        if not status[0]:
+            status[0] = code
+        app.extensions['live'].close()
+        # shutdown() waits for serve_forever() to return, so it is called from a thread of its own
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    def monitor():
+        while True:
+            time.sleep(MONITOR_INTERVAL)
+            if os.getppid() != arbiter:
+                log('Arbiter is gone, stopping')
+                stop()
+                return
+            if max_memory and resident_memory() > max_memory * 1048576:
+                log('Using {} MiB, over the limit of {}, recycling', resident_memory() // 1048576, max_memory)
+                stop(RECYCLED)
+                return
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop())
+    threading.Thread(target=monitor, daemon=True).start()
+    os.write(ready, b'1')
+    os.close(ready)
+    server.serve_forever()
+    server.finish()
+    return status[0]
+
+
+class Worker:
+    """A forked worker process, as the arbiter sees it"""
+
+    def __init__(self, pid, generation, ready):
+        self.pid = pid
+        self.generation = generation
+        self.ready_fd = ready
+        self.ready = False
+
+
+class Arbiter:
+    """
+    Arbiter keeps a set of worker processes serving the listening socket, replacing any that exit and reloading them
+    all on SIGHUP
+
+    Attributes
+    ----------
+    bind : String
+        The 'host:port' address listened on
+    config : String
+        The name of the config the workers build the app with
+    workers : Integer
+        The number of worker processes
+    threads : Integer
+        The number of requests each worker answers at once
+    max_memory : Integer
+        The MiB of resident memory past which a worker is recycled, or None
+    graceful_timeout : Float
+        Seconds a stopping worker has to finish its requests before it is killed
+    warmup_timeout : Float
+        Seconds new workers have to warm up during a reload
+    """
+
+    def __init__(self, bind, config, workers, threads, max_memory=None, graceful_timeout=30, warmup_timeout=60):
+        self.bind = bind
+        self.config = config
+        self.workers = workers
+        self.threads = threads
+        self.max_memory = max_memory
+        self.graceful_timeout = graceful_timeout
+        self.warmup_timeout = warmup_timeout
+        self.socket = None
+        self.generation = 0
+        self.processes = {}
+        self._reloading = False
+        self._stopping = False
+
+    # region Workers
+
+    def spawn(self):
+        """forks a worker of the current generation"""
+        ready_read, ready_write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                os.close(ready_read)
+                for worker in self.processes.values():
+                    os.close(worker.ready_fd)
+                status = run_worker(self.socket, ready_write, self.config, self.threads, self.max_memory)
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                # the worker must not return into the arbiter's code it was forked from
+                os._exit(status)
+        os.close(ready_write)
+        self.processes[pid] = Worker(pid, self.generation, ready_read)
+        return pid
+
+    def current(self):
+        """returns the workers of the current generation"""
+        return [worker for worker in self.processes.values() if worker.generation == self.generation]
+
+    def check_ready(self, timeout):
+        """waits up to timeout seconds for a worker to report that it is ready"""
+        waiting = {worker.ready_fd: worker for worker in self.processes.values() if not worker.ready}
+        if not waiting:
+            time.sleep(timeout)
+            return
+        readable, _, _ = select.select(list(waiting), [], [], timeout)
+        for fd in readable:
+            worker = waiting[fd]
+            # a worker that exits before it is ready closes the pipe without writing to it
+            worker.ready = os.read(fd, 1) == b'1'
+            if worker.ready:
+                log('Worker {} is ready', worker.pid)
+
+    def reap(self):
+        """forgets the workers that have exited, returning those of the current generation"""
+        exited = []
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            worker = self.processes.pop(pid, None)
+            if worker is None:
+                continue
+            os.close(worker.ready_fd)
+            code = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+            if worker.generation == self.generation and not self._stopping:
+                exited.append(worker)
+                log('Worker {} exited with status {}{}', pid, code, ', replacing it' if code == RECYCLED else '')
+        return exited
+
+    def signal_workers(self, workers, signum):
+        for worker in workers:
+            try:
+                os.kill(worker.pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def wait_for(self, condition, timeout):
+        """reaps workers until condition() holds or timeout seconds pass, returning whether it held"""
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() >= deadline:
+                return False
+            self.check_ready(min(0.1, deadline - time.monotonic()))
+            self.reap()
+        return True
+
+    # endregion
+
+    def start_generation(self):
+        """forks a new set of workers and waits for them to warm up, returning whether they all did"""
+        self.generation += 1
+        for i in range(self.workers):
+            self.spawn()
+        new = self.current()
+        if self.wait_for(lambda: all(worker.ready or worker.pid not in self.processes for worker in new),
+                         self.warmup_timeout) and all(worker.ready for worker in new):
+            return True
+        self.signal_workers(self.current(), signal.SIGKILL)
+        self.wait_for(lambda: not self.current(), self.graceful_timeout)
+        self.generation -= 1
+        return False
+
+    def reload(self):
+        """replaces every worker with a new one, stopping the old workers only once the new ones are ready"""
+        old = self.current()
+        log('Reloading {} workers', len(old))
+        if not self.start_generation():
+            log('The new workers failed to warm up, keeping the old ones')
+            return
+        self.signal_workers(old, signal.SIGTERM)
+        if not self.wait_for(lambda: not any(worker.pid in self.processes for worker in old), self.graceful_timeout):
+            self.signal_workers([worker for worker in old if worker.pid in self.processes], signal.SIGKILL)
+        log('Reloaded')
+
+    def stop(self):
+        """stops every worker, killing those still answering requests after graceful_timeout seconds"""
+        self._stopping = True
+        log('Stopping {} workers', len(self.processes))
+        self.signal_workers(list(self.processes.values()), signal.SIGTERM)
+        if not self.wait_for(lambda: not self.processes, self.graceful_timeout):
+            self.signal_workers(list(self.processes.values()), signal.SIGKILL)
+            self.wait_for(lambda: not self.processes, self.graceful_timeout)
+        self.socket.close()
+
+    def run(self):
+        """Serves until SIGTERM or SIGINT, returning the exit status"""
+        self.socket = listen(self.bind)
+        host, port = self.socket.getsockname()[:2]
+        log('Listening on http://{}:{} with {} workers of {} threads', host, port, self.workers, self.threads)
+        signal.signal(signal.SIGHUP, lambda signum, frame: setattr(self, '_reloading', True))
+        signal.signal(signal.SIGTERM, lambda signum, frame: setattr(self, '_stopping', True))
+        signal.signal(signal.SIGINT, lambda signum, frame: setattr(self, '_stopping', True))
+        if not self.start_generation():
+            log('The workers failed to warm up')
+            self._stopping = True
+            self.socket.close()
+            return 1
+        next_spawn = 0
+        while not self._stopping:
+            if self._reloading:
+                self._reloading = False
+                self.reload()
+                continue
+            self.check_ready(0.5)
+            for worker in self.reap():
+                if not worker.ready:
+                    # a worker failing as it starts is replaced after a second, rather than as fast as it fails
+                    next_spawn = time.monotonic() + 1
+            if time.monotonic() >= next_spawn:
+                for i in range(self.workers - len(self.current())):
+                    self.spawn()
+        self.stop()
+        return 0
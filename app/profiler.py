@@ -0,0 +1,219 @@
+"""
+profiler.py profiles single requests on demand, so a route that has turned slow can be examined on the running server.
+
+Notes
+-----
+    A request is profiled when it has a 'profile' query argument or an X-Profile header, eg. /view_thread/5?profile=1,
+    and is made by a logged in user named in PROFILE_USERS. Everyone else's flag is ignored, and no users are named by
+    default, which leaves profiling off.
+    A profiled request is run under cProfile, for exact call counts and times, while a thread samples its stack every
+    PROFILE_SAMPLE_INTERVAL seconds, for a flame graph of where its time went. Both are written to PROFILE_FOLDER:
+        <name>.pstats, to be read with `python -m pstats` or snakeviz
+        <name>.collapsed, one line per stack ("frame;frame;frame count"), the input of flamegraph.pl and speedscope
+        <name>.json, the request's URL, endpoint, user, status and duration
+    The response carries the profile's name in its X-Profile header, and /profiles lists the latest profiles with
+    links to their files, to the users of PROFILE_USERS only.
+    Profiling slows a request down several times over, so a process profiles one request at a time and at most
+    PROFILE_LIMIT requests every PROFILE_PERIOD seconds; requests over the limit are served as usual, with
+    X-Profile: skipped. Only the PROFILE_KEEP latest profiles are kept.
+
+Classes
+-------
+Sampler : threading.Thread
+    Samples the stack of another thread at an interval, counting each distinct stack
+
+Methods
+-------
+init_app(app)
+    Profiles the flagged requests of an app's allowed users, and adds the /profiles pages
+profiles() : String
+    Page listing the latest profiles
+profile_file(filename) : Response
+    Sends a file of a profile
+"""
+
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime
+from flask import abort, current_app, g, render_template, request, send_from_directory
+from flask_login import current_user
+
+# the files written for each profile, by extension
+EXTENSIONS = ('.pstats', '.collapsed', '.json')
+
+_lock = threading.Lock()
+_started = deque()
+
+
+class Sampler(threading.Thread):
+    """
+    Sampler records the stack of a thread every interval seconds until it is stopped
+
+    Attributes
+    ----------
+    stacks : Counter
+        The number of samples of each stack, as the frames from the outermost in, separated by semicolons
+    """
+
+    def __init__(self, thread_id, interval):
+        threading.Thread.__init__(self, daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                # the last two parts of the path tell apart the many __init__.py files
+                path = '/'.join(code.co_filename.replace(os.sep, '/').split('/')[-2:])
+                frames.append('{} ({}:{})'.format(code.co_name, path, code.co_firstlineno).replace(';', ','))
+                frame = frame.f_back
+            if frames:
+                self.stacks[';'.join(reversed(frames))] += 1
+
+    def stop(self):
+        """Stops sampling and waits for the thread to finish"""
+        self._stopped.set()
+        self.join()
+
+
+def allowed():
+    """returns True if the current user may profile requests and read the profiles"""
+    return current_user.is_authenticated and current_user.username in current_app.config['PROFILE_USERS']
+
+
+def acquire():
+    """takes a profiling slot, returning False if a request is being profiled or PROFILE_LIMIT has been reached"""
+    if not _lock.acquire(blocking=False):
+        return False
+    now = time.monotonic()
+    while _started and _started[0] <= now - current_app.config['PROFILE_PERIOD']:
+        _started.popleft()
+    if len(_started) >= current_app.config['PROFILE_LIMIT']:
+        _lock.release()
+        return False
+    _started.append(now)
+    return True
+
+
+# region Hooks
+
+def start_profile():
+    if request.args.get('profile') is None and request.headers.get('X-Profile') is None:
+        return
+    if not allowed():
+        return
+    if not acquire():
+        g.profile = None
+        return
+    sampler = Sampler(threading.get_ident(), current_app.config['PROFILE_SAMPLE_INTERVAL'])
+    profile = cProfile.Profile()
+    g.profile = (profile, sampler, time.perf_counter())
+    sampler.start()
+    profile.enable()
+
+
+def stop_profile():
+    """stops the profile of the current request, returning it, or None if the request is not being profiled"""
+    running = g.pop('profile', None)
+    if running is None:
+        return None
+    profile, sampler, start = running
+    profile.disable()
+    sampler.stop()
+    _lock.release()
+    return profile, sampler, time.perf_counter() - start
+
+
+def finish_profile(response):
+    if 'profile' not in g:
+        return response
+    if g.profile is None:
+        g.pop('profile')
+        response.headers['X-Profile'] = 'skipped'
+        return response
+    profile, sampler, duration = stop_profile()
+    response.headers['X-Profile'] = save(profile, sampler, duration, response.status_code)
+    return response
+
+
+def abandon_profile(exception):
+    # a request that raised never reaches finish_profile, and must still free the profiling slot
+    if 'profile' in g:
+        stop_profile()
+
+
+# endregion
+
+def save(profile, sampler, duration, status):
+    """writes the files of a profile to PROFILE_FOLDER, drops the oldest profiles, and returns the profile's name"""
+    folder = current_app.config['PROFILE_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    name = '{}-{}-{}'.format(datetime.utcnow().strftime('%Y%m%dT%H%M%S%f'), request.endpoint or 'unmatched',
+                             os.getpid())
+    path = os.path.join(folder, name)
+    profile.dump_stats(path + '.pstats')
+    with open(path + '.collapsed', 'w') as file:
+        for stack, count in sorted(sampler.stacks.items()):
+            file.write('{} {}\n'.format(stack, count))
+    with open(path + '.json', 'w') as file:
+        json.dump(dict(name=name, url=request.full_path.rstrip('?'), endpoint=request.endpoint,
+                       user=current_user.username, status=status, duration=duration,
+                       samples=sum(sampler.stacks.values()), time=datetime.utcnow().isoformat()), file)
+    for old in recent(folder)[current_app.config['PROFILE_KEEP']:]:
+        for extension in EXTENSIONS:
+            try:
+                os.remove(os.path.join(folder, old['name'] + extension))
+            except OSError:
+                pass
+    return name
+
+
+def recent(folder):
+    """returns the details of the profiles in a folder, latest first"""
+    if not os.path.isdir(folder):
+        return []
+    details = []
+    for filename in sorted(os.listdir(folder), reverse=True):
+        if filename.endswith('.json'):
+            try:
+                with open(os.path.join(folder, filename)) as file:
+                    details.append(json.load(file))
+            except (OSError, ValueError):
+                # a profile being written or removed by another process
+                continue
+    return details
+
+
+def profiles():
+    """Lists the latest profiles, to the users allowed to profile requests"""
+    if not allowed():
+        abort(404)
+    return render_template('profiles.html', profiles=recent(current_app.config['PROFILE_FOLDER']))
+
+
+def profile_file(filename):
+    """Sends a file of a profile, to the users allowed to profile requests"""
+    if not allowed() or not filename.endswith(EXTENSIONS):
+        abort(404)
+    return send_from_directory(current_app.config['PROFILE_FOLDER'], filename, as_attachment=True)
+
+
+def init_app(app):
+    """Profiles the flagged requests of the users in PROFILE_USERS, and adds the pages listing the profiles"""
+    if not app.config.get('PROFILE_USERS'):
+        return
+    app.before_request(start_profile)
+    app.after_request(finish_profile)
+    app.teardown_request(abandon_profile)
+    app.add_url_rule('/profiles', 'profiles', profiles)
+    app.add_url_rule('/profiles/<filename>', 'profile_file', profile_file)
@@ -0,0 +1,122 @@
+"""
+queries.py holds the named queries used by the listing pages of the website.
+
+Notes
+-----
+    Each query eagerly loads the relationships its template displays, so rendering a page does not fire a lazy
+    SELECT for every row. Many-to-one relationships (a thread's topic, a post's author) are joined into the same
+    statement, while collections (a group's threads) are loaded with a single extra SELECT ... IN statement.
+    The author and last poster of a thread are always joined, see Thread.
+
+Methods
+-------
+thread_listing() : Query
+    Threads with the topic, author and last poster shown on each row of a listing
+thread_detail(id) : Thread
+    A single thread with its topic and group
+thread_posts(thread) : Query
+    The posts of a thread with their authors
+group_dashboard(id) : Group
+    A discussion group with every thread row of its dashboard
+listing_version(*criterion) : tuple
+    Values that change whenever a listing of threads does
+unseen_threads(user) : Query
+    The listing of threads with posts the user has not seen
+subscribed_threads(user) : Query
+    The listing of threads the user is subscribed to
+subscribed_topics(user) : Query
+    The topics the user is subscribed to
+subscribed_topic_ids(user) : set
+    The ids of the topics a user is subscribed to
+is_subscribed(user, thread) : Boolean
+    Whether a user is subscribed to a thread
+user_posts(user) : Query
+    The posts of a user with the threads they were made in
+user_groups(user) : Query
+    The groups a user is a member of, with the number of threads in each
+"""
+
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, selectinload
+from app import db
+from app.models import Thread, Post, Topic, Group, ThreadSubscriptions, TopicSubscriptions, group_user_association
+
+
+# region Threads
+
+def thread_listing():
+    """Returns a query of threads with the topic, author and last poster shown on each row of a listing"""
+    return Thread.query.options(joinedload('topic'))
+
+
+def thread_detail(id):
+    """Returns the thread with its topic and group, or None if there is no such thread"""
+    return Thread.query.options(joinedload('topic'), joinedload('group')).filter_by(id=id).first()
+
+
+def thread_posts(thread):
+    """Returns a query of the posts within a thread along with their authors"""
+    return Post.query.filter_by(thread_id=thread.id).options(joinedload('author'))
+
+
+def group_dashboard(id):
+    """Returns the discussion group with its threads and their topics, or None if there is no such group"""
+    return Group.query.options(selectinload('threads').joinedload('topic')).filter_by(id=id).first()
+
+
+def listing_version(*criterion):
+    """
+    Returns the number of threads matching the criterion along with their latest change time, latest post time and
+    total post count, which between them change whenever a row of the listing does
+    """
+    return db.session.query(func.count(Thread.id), func.max(Thread.updated_at), func.max(Thread.last_post_at),
+                            func.sum(Thread.post_count)).filter(*criterion).one()
+
+
+# endregion
+
+# region Subscriptions
+
+def unseen_threads(user):
+    """Returns a listing query of the threads the user is subscribed to that have unseen posts"""
+    return thread_listing().join(ThreadSubscriptions) \
+        .filter(ThreadSubscriptions.user_id == user.username, ThreadSubscriptions.unseen == True)
+
+
+def subscribed_threads(user):
+    """Returns a listing query of the threads the user is subscribed to"""
+    return thread_listing().join(ThreadSubscriptions).filter(ThreadSubscriptions.user_id == user.username)
+
+
+def subscribed_topics(user):
+    """Returns a query of the topics the user is subscribed to"""
+    return Topic.query.join(TopicSubscriptions).filter(TopicSubscriptions.user_id == user.id)
+
+
+def subscribed_topic_ids(user):
+    """Returns the set of ids of the topics a user is subscribed to"""
+    rows = db.session.query(TopicSubscriptions.topic_id).filter(TopicSubscriptions.user_id == user.id)
+    return {topic_id for topic_id, in rows}
+
+
+def is_subscribed(user, thread):
+    """Returns True if the user is subscribed to the thread"""
+    subscription = db.session.query(ThreadSubscriptions.id) \
+        .filter(ThreadSubscriptions.user_id == user.username, ThreadSubscriptions.thread_id == thread.id)
+    return subscription.first() is not None
+
+
+# endregion
+
+def user_posts(user):
+    """Returns a query of the posts made by a user along with the threads they were made in, latest first"""
+    return user.posts.options(joinedload('thread')).order_by(Post.timestamp.desc())
+
+
+def user_groups(user):
+    """Returns a query of (group, thread count) for the groups a user is a member of, counted in the same statement"""
+    return db.session.query(Group, func.count(Thread.id)) \
+        .join(group_user_association, group_user_association.c.group_id == Group.id) \
+        .filter(group_user_association.c.user_id == user.id) \
+        .outerjoin(Thread, Thread.group_id == Group.id) \
+        .group_by(Group.id).order_by(Group.id)
@@ -0,0 +1,173 @@
+"""
+search.py holds the full-text search over posts and threads, backed by an SQLite FTS5 virtual table.
+
+Notes
+-----
+    Each post is a row of the 'search_index' table, keyed by the post's id, holding the post's title and text along
+    with the name of its thread. Rows are written by the index_post job as posts are created and added to threads
+    (see Thread.add_first_post and Thread.add_post), and rewritten by the index_post and index_thread jobs when a post or
+    thread is edited, see tasks.py.
+    The table is created alongside the other tables by db.create_all(), and `flask reindex-search` rebuilds it.
+    FTS5 is only available on SQLite. On other databases nothing is indexed, and search() instead matches every word
+    anywhere in a post's title or text with LIKE, returning the latest matching posts first.
+    Results are ranked with bm25, weighting thread names over post titles over post text, and are filtered with the
+    same rule as Thread.is_visible_by: public threads, and threads of the groups the user is a member of.
+
+Methods
+-------
+index_post(post)
+    Writes a single post into the index
+index_thread(thread)
+    Rewrites every post of a thread, after the thread has been renamed
+reindex(connection)
+    Rebuilds the whole index from the Post and Thread tables
+search(user, terms, page, per_page) : list
+    Returns a page of ranked (post, snippet) results visible to a user
+make_query(terms) : String
+    Turns user input into an FTS5 query
+"""
+
+import re
+from markupsafe import Markup, escape
+from sqlalchemy import DDL, and_, event, or_, text
+from app import db
+from app.models import Post, Thread, group_user_association
+
+# markers placed around matches by snippet(), replaced with <mark> tags once the snippet is escaped
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+CREATE_INDEX = 'CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(' \
+               'thread_id UNINDEXED, thread_name, title, text, tokenize = "porter unicode61")'
+DROP_INDEX = 'DROP TABLE IF EXISTS search_index'
+event.listen(db.metadata, 'after_create', DDL(CREATE_INDEX).execute_if(dialect='sqlite'))
+event.listen(db.metadata, 'before_drop', DDL(DROP_INDEX).execute_if(dialect='sqlite'))
+
+SEARCH = text('''
+    SELECT search_index.rowid, snippet(search_index, -1, :match_start, :match_end, '...', 16)
+    FROM search_index
+    JOIN "Post" ON "Post".id = search_index.rowid
+    JOIN "Thread" ON "Thread".id = "Post".thread_id
+    WHERE search_index MATCH :query
+    AND ("Thread".group_id IS NULL
+         OR "Thread".group_id IN (SELECT group_id FROM group_user WHERE user_id = :user_id))
+    ORDER BY bm25(search_index, 0.0, 10.0, 5.0, 1.0), search_index.rowid DESC
+    LIMIT :limit OFFSET :offset
+''')
+
+
+def indexed(bind=None):
+    """returns True if the database has an FTS5 search index, ie. it is an SQLite database"""
+    return (bind or db.engine).dialect.name == 'sqlite'
+
+
+def _index(condition, connection=None, **params):
+    """rewrites the index rows of the posts matching a condition on the Post and Thread tables"""
+    if connection is None:
+        if not indexed():
+            return
+        db.session.flush()
+        connection = db.session
+    connection.execute(text('DELETE FROM search_index WHERE rowid IN '
+                            '(SELECT "Post".id FROM "Post" JOIN "Thread" ON "Thread".id = "Post".thread_id '
+                            'WHERE ' + condition + ')'), params)
+    connection.execute(text('INSERT INTO search_index (rowid, thread_id, thread_name, title, text) '
+                            'SELECT "Post".id, "Thread".id, "Thread".name, "Post".title, "Post".text '
+                            'FROM "Post" JOIN "Thread" ON "Thread".id = "Post".thread_id '
+                            'WHERE ' + condition), params)
+
+
+def index_post(post):
+    """Writes a post that has been added to a thread into the index, replacing any previous row for it"""
+    _index('"Post".id = :post_id', post_id=post.id)
+
+
+def index_thread(thread):
+    """Rewrites the index rows of every post in a thread, eg. after the thread has been renamed"""
+    _index('"Thread".id = :thread_id', thread_id=thread.id)
+
+
+def reindex(connection=None):
+    """
+    Rebuilds the whole index from the Post and Thread tables, returning the number of posts indexed.
+    The index is rebuilt through the given connection, or the session's when there is none.
+    """
+
+    if connection is None:
+        if not indexed():
+            return 0
+        connection = db.session
+    connection.execute(text(DROP_INDEX))
+    connection.execute(text(CREATE_INDEX))
+    _index('1 = 1', connection)
+    return connection.execute(text('SELECT COUNT(*) FROM search_index')).scalar()
+
+
+def make_query(terms):
+    """
+    Turns user input into an FTS5 query that matches posts containing every word.
+    Each word is quoted, so punctuation and FTS5 operators in the input are treated as plain text,
+    and the last word matches as a prefix so results appear while a word is still being typed.
+    Returns None if the input contains no words.
+    """
+
+    words = re.findall(r'\w+', terms or '')
+    if not words:
+        return None
+    return ' '.join('"{}"'.format(word) for word in words) + '*'
+
+
+def search(user, terms, page=1, per_page=20):
+    """
+    Searches the posts and thread names visible to a user
+
+    Parameters
+    ----------
+    user : User
+        The user searching, whose groups decide which private threads are included
+    terms : String
+        The words being searched for, as typed by the user
+    page : Integer
+        The page of results to return, starting at 1
+    per_page : Integer
+        The maximum number of results on a page
+
+    Returns
+    -------
+    list
+        (post, snippet) pairs ordered by relevance, where the snippet is HTML with the matches in <mark> tags.
+        One more result than per_page is returned when there is a following page.
+    """
+
+    query = make_query(terms)
+    if query is None:
+        return []
+    if not indexed():
+        return search_unindexed(user, terms, page, per_page)
+    rows = db.session.execute(SEARCH, dict(query=query, user_id=user.id, match_start=MATCH_START,
+                                           match_end=MATCH_END, limit=per_page + 1,
+                                           offset=(max(page, 1) - 1) * per_page)).fetchall()
+    posts = Post.query.filter(Post.id.in_([post_id for post_id, snippet in rows])) \
+        .options(db.joinedload('author'), db.joinedload('thread')).all()
+    posts = {post.id: post for post in posts}
+    return [(posts[post_id], highlight(snippet)) for post_id, snippet in rows if post_id in posts]
+
+
+def search_unindexed(user, terms, page, per_page):
+    """searches with LIKE on databases without FTS5, returning (post, snippet) pairs like search(), latest first"""
+    words = re.findall(r'\w+', terms)
+    member_of = db.session.query(group_user_association.c.group_id) \
+        .filter(group_user_association.c.user_id == user.id)
+    matches = [or_(*[column.ilike('%' + word + '%') for column in (Thread.name, Post.title, Post.text)])
+               for word in words]
+    posts = Post.query.join(Thread, Thread.id == Post.thread_id) \
+        .filter(or_(Thread.group_id == None, Thread.group_id.in_(member_of)), and_(*matches)) \
+        .options(db.joinedload('author'), db.joinedload('thread')) \
+        .order_by(Post.timestamp.desc(), Post.id.desc()) \
+        .limit(per_page + 1).offset((max(page, 1) - 1) * per_page).all()
+    return [(post, escape((post.text or '')[:200])) for post in posts]
+
+
+def highlight(snippet):
+    """escapes a snippet and replaces the match markers with <mark> tags"""
+    return Markup(str(escape(snippet)).replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>'))
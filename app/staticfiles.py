@@ -0,0 +1,136 @@
+"""
+staticfiles.py serves the files under app/static and the built bundles of assets.py, sending gzip compressed copies
+made ahead of time to the browsers that accept them.
+
+Notes
+-----
+    `flask compress-static` writes a gzip copy next to each file that compresses well, eg. util.css.gz next to util.css,
+    and `flask build-assets` does the same for the bundles it builds. Fonts such as woff and woff2 and images such as
+    jpg are compressed already, and are left alone, as are files gzip shrinks by less than MIN_SAVING.
+    A request whose Accept-Encoding allows gzip is sent the compressed copy, with Content-Encoding: gzip, unless the copy
+    is older than the file. Responses carry Vary: Accept-Encoding so that shared caches keep both versions apart.
+    Files are sent with Flask's send_file, which:
+        sets an ETag and Last-Modified, and answers If-None-Match and If-Modified-Since with 304 Not Modified
+        answers Range requests with 206 Partial Content, eg. a browser resuming a large image or font
+        hands the open file to the server's wsgi.file_wrapper, which servers such as gunicorn send with sendfile(2),
+        copying the file to the socket without passing it through Python, or to a front end server with X-Sendfile
+        when USE_X_SENDFILE is set
+    The compressed copy has its own ETag, so a client never matches one version's ETag against the other, and byte
+    ranges are ranges of the copy being sent.
+    STATIC_PRECOMPRESSED turns this off, leaving the static files to Flask's own handler.
+
+Methods
+-------
+init_app(app)
+    Serves the static files of an app with send_precompressed
+compress(path) : Boolean
+    Writes the gzip copy of a file when it is worth keeping
+compress_folder(folder) : tuple
+    Compresses every file of a folder that compresses well
+send_precompressed(folder, filename, cache_timeout) : Response
+    Sends a file, or its gzip copy when the client accepts it
+"""
+
+import gzip
+import mimetypes
+import os
+import shutil
+from flask import current_app, request, safe_join, send_file
+from werkzeug.exceptions import NotFound
+
+# extensions of the files worth compressing; images and woff fonts are compressed already
+COMPRESSIBLE = {'.css', '.js', '.json', '.svg', '.html', '.txt', '.xml', '.map', '.ttf', '.otf', '.eot', '.ico'}
+# the smallest fraction of a file its gzip copy must save to be kept
+MIN_SAVING = 0.1
+
+
+def compress(path):
+    """
+    Writes a gzip copy of a file next to it, eg. main.css.gz, returning True if the copy is kept.
+    The copy is left alone when it is newer than the file, and removed when it saves less than MIN_SAVING.
+    """
+
+    compressed = path + '.gz'
+    if os.path.exists(compressed) and os.path.getmtime(compressed) >= os.path.getmtime(path):
+        return True
+    # mtime=0 leaves the build time out of the copy, so the same file always compresses to the same bytes
+    with open(path, 'rb') as source, open(compressed, 'wb') as target:
+        with gzip.GzipFile(filename='', mode='wb', fileobj=target, compresslevel=9, mtime=0) as archive:
+            shutil.copyfileobj(source, archive)
+    if os.path.getsize(compressed) > os.path.getsize(path) * (1 - MIN_SAVING):
+        os.remove(compressed)
+        return False
+    return True
+
+
+def compress_folder(folder):
+    """
+    Writes gzip copies of the files of a folder and its subfolders that compress well
+
+    Returns
+    -------
+    tuple
+        The number of copies kept, their total size and the total size of the files they were made from
+    """
+
+    count = compressed_size = original_size = 0
+    for root, dirs, files in os.walk(folder):
+        for name in files:
+            path = os.path.join(root, name)
+            if os.path.splitext(name)[1].lower() in COMPRESSIBLE and compress(path):
+                count += 1
+                compressed_size += os.path.getsize(path + '.gz')
+                original_size += os.path.getsize(path)
+    return count, compressed_size, original_size
+
+
+def accepts_gzip():
+    """returns True if the request's Accept-Encoding allows gzip"""
+    return request.accept_encodings['gzip'] > 0
+
+
+def send_precompressed(folder, filename, cache_timeout=None):
+    """
+    Sends a file from a folder, or its gzip copy if the client accepts gzip and the copy is current
+
+    Parameters
+    ----------
+    folder : String
+        The directory holding the file
+    filename : String
+        The path of the file within the folder, as given in the URL
+    cache_timeout : Integer
+        Seconds the client may keep the file, Flask's SEND_FILE_MAX_AGE_DEFAULT when None
+
+    Returns
+    -------
+    Response
+        The file with an ETag and Vary: Accept-Encoding, or a 206 or 304 response
+    """
+
+    path = safe_join(folder, filename)
+    if not os.path.isfile(path):
+        raise NotFound()
+    if cache_timeout is None:
+        cache_timeout = current_app.get_send_file_max_age(filename)
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    compressed = path + '.gz'
+    if accepts_gzip() and os.path.isfile(compressed) and os.path.getmtime(compressed) >= os.path.getmtime(path):
+        response = send_file(compressed, mimetype=mimetype, cache_timeout=cache_timeout, conditional=True)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = send_file(path, mimetype=mimetype, cache_timeout=cache_timeout, conditional=True)
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def static(filename):
+    """Serves a file under app/static, replacing Flask's own static view"""
+    if not current_app.config['STATIC_PRECOMPRESSED']:
+        return current_app.send_static_file(filename)
+    return send_precompressed(current_app.static_folder, filename)
+
+
+def init_app(app):
+    """Serves the app's static files with static() rather than Flask's own view"""
+    app.view_functions['static'] = static
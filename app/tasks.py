@@ -0,0 +1,58 @@
+"""
+tasks.py holds the background jobs enqueued when posts are written, see jobs.py.
+
+Notes
+-----
+    Every task can safely run more than once, as a job is retried if its worker dies before committing.
+
+Methods
+-------
+notify_subscribers(thread_id, author_id)
+    Flags the thread and its topic as unseen for every subscriber other than the post's author
+publish_post(post_id)
+    Writes a post into the feed of every user following its thread or topic
+follow_thread(user_id, thread_id)
+    Adds the posts already in a thread to the feed of a newly subscribed user
+index_post(post_id)
+    Writes a new or edited post into the search index
+index_thread(thread_id)
+    Rewrites the search index rows of every post in a renamed thread
+"""
+
+from app import search
+from app.jobs import task
+from app.models import User, Post, Thread, FeedEntry
+
+
+@task('notify_subscribers')
+def notify_subscribers(thread_id, author_id):
+    """Flags the thread and its topic as unseen for every subscriber other than the post's author"""
+    thread = Thread.query.get(thread_id)
+    author = User.query.get(author_id)
+    thread.notify(exclude=author)
+    if thread.topic is not None:
+        thread.topic.notify(exclude=author)
+
+
+@task('publish_post')
+def publish_post(post_id):
+    """Writes a post into the feed of every user following its thread or topic"""
+    FeedEntry.publish(Post.query.get(post_id))
+
+
+@task('follow_thread')
+def follow_thread(user_id, thread_id):
+    """Adds the posts already in a thread to the feed of a newly subscribed user"""
+    FeedEntry.follow(User.query.get(user_id), Thread.query.get(thread_id))
+
+
+@task('index_post')
+def index_post(post_id):
+    """Writes a new or edited post into the search index"""
+    search.index_post(Post.query.get(post_id))
+
+
+@task('index_thread')
+def index_thread(thread_id):
+    """Rewrites the search index rows of every post in a renamed thread"""
+    search.index_thread(Thread.query.get(thread_id))
@@ -0,0 +1,41 @@
+"""
+templating.py keeps the compiled templates on disk, so a new worker process renders its first pages without
+compiling every template it uses.
+
+Notes
+-----
+    Jinja compiles each template to Python bytecode the first time a process renders it. With TEMPLATE_CACHE_FOLDER
+    set, the compiled code is written to that folder and read back by later processes, which only have to check that
+    the template's source has not changed since (each entry is keyed by the template's name and holds a checksum of its
+    source, so an edited template is compiled again rather than served stale).
+    `flask compile-templates` compiles the website's templates and Flask-Bootstrap's ahead of time, eg. during a
+    deploy, so that no worker pays for compiling them.
+
+Methods
+-------
+bytecode_cache(config) : FileSystemBytecodeCache
+    The bytecode cache for TEMPLATE_CACHE_FOLDER, or None when it is not set
+compile_templates() : list
+    Compiles every template into the bytecode cache, returning their names
+"""
+
+import os
+from flask import current_app
+from jinja2 import FileSystemBytecodeCache
+
+
+def bytecode_cache(config):
+    """Returns a bytecode cache writing to the config's TEMPLATE_CACHE_FOLDER, or None when it is not set"""
+    folder = config.get('TEMPLATE_CACHE_FOLDER')
+    if not folder:
+        return None
+    os.makedirs(folder, exist_ok=True)
+    return FileSystemBytecodeCache(folder)
+
+
+def compile_templates():
+    """Compiles every template of the website and its blueprints into the bytecode cache, returning their names"""
+    names = current_app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        current_app.jinja_env.get_template(name)
+    return names
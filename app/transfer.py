@@ -0,0 +1,92 @@
+"""
+transfer.py copies the website's data from one database to another, eg. from the SQLite data.db to a database server.
+
+Notes
+-----
+    Tables are created on the target and copied in dependency order (db.metadata.sorted_tables), so the users,
+    topics and groups a row refers to are always copied before it, and ids are copied unchanged so that every foreign
+    key still points at the same row.
+    Rows are streamed from the source in batches of batch_size and each batch is inserted in its own transaction,
+    so memory use does not grow with the size of the database.
+    Columns the source database does not have yet are filled with their defaults.
+    The search index is not copied; it is rebuilt on SQLite targets, and other databases fall back to a simpler search,
+    see search.py.
+
+Methods
+-------
+copy_database(source_uri, target_uri, batch_size, echo) : dict
+    Copies every table from the source database to an empty target database
+"""
+
+from sqlalchemy import create_engine, func, select, MetaData, Integer
+from app import db, search
+
+
+def copy_database(source_uri, target_uri, batch_size=1000, echo=print):
+    """
+    Copies every table of the website from the source database to the target database
+
+    Parameters
+    ----------
+    source_uri : String
+        SQLAlchemy URI of the database to copy, eg. 'sqlite:////path/to/data.db'
+    target_uri : String
+        SQLAlchemy URI of the database to copy to, whose tables must be empty or not exist yet
+    batch_size : Integer
+        The number of rows read and inserted at a time
+    echo : function
+        Called with a line of progress after each table
+
+    Returns
+    -------
+    dict
+        The number of rows copied, by table name
+    """
+
+    source = create_engine(source_uri)
+    target = create_engine(target_uri)
+    existing = MetaData()
+    existing.reflect(bind=source, only=lambda name, metadata: name in db.metadata.tables)
+    db.metadata.create_all(bind=target)
+    for table in db.metadata.sorted_tables:
+        if target.execute(select([func.count()]).select_from(table)).scalar():
+            raise ValueError('The target table {} is not empty'.format(table.name))
+
+    counts = {}
+    for table in db.metadata.sorted_tables:
+        counts[table.name] = 0
+        if table.name not in existing.tables:
+            continue
+        source_table = existing.tables[table.name]
+        columns = [column for column in source_table.columns if column.name in table.columns]
+        query = select(columns).order_by(*source_table.primary_key.columns)
+        with source.connect() as connection:
+            rows = connection.execution_options(stream_results=True).execute(query)
+            batch = rows.fetchmany(batch_size)
+            while batch:
+                with target.begin() as transaction:
+                    transaction.execute(table.insert(), [dict(row) for row in batch])
+                counts[table.name] += len(batch)
+                batch = rows.fetchmany(batch_size)
+        echo('{:<24} {:9} rows'.format(table.name, counts[table.name]))
+
+    with target.begin() as transaction:
+        if target.dialect.name == 'postgresql':
+            reset_sequences(transaction)
+        elif target.dialect.name == 'sqlite':
+            echo('{:<24} {:9} rows'.format('search_index', search.reindex(transaction)))
+    source.dispose()
+    target.dispose()
+    return counts
+
+
+def reset_sequences(connection):
+    """moves the id sequence of every table past the ids copied into it, so new rows do not reuse them"""
+    preparer = connection.dialect.identifier_preparer
+    for table in db.metadata.sorted_tables:
+        for column in table.primary_key.columns:
+            if isinstance(column.type, Integer) and column.autoincrement in (True, 'auto'):
+                connection.execute("SELECT setval(pg_get_serial_sequence('{table}', '{column}'), "
+                                   "COALESCE(MAX({quoted}), 0) + 1, false) FROM {table}"
+                                   .format(table=preparer.format_table(table), column=column.name,
+                                           quoted=preparer.quote(column.name)))
@@ -0,0 +1,54 @@
+"""
+views holds the pages of the website, as Flask blueprints that create_app() registers on the app it builds.
+
+Notes
+-----
+    Each module of the package is a blueprint holding the routes of one part of the website, and its endpoints are
+    named after it, eg. url_for('threads.view_thread', id=1).
+    The blueprints are listed by import name in BLUEPRINTS, and are only imported when they are registered, so that
+    processes which serve no pages (such as the background worker) do not import them, or the forms and WTForms.
+
+Modules
+-------
+auth
+    Signing up, logging in and logging out
+threads
+    Public threads and topics, and search
+subscriptions
+    Thread and topic subscriptions, and alerts
+groups
+    Private discussion groups
+profile
+    The home feed and the user profile pages
+
+Methods
+-------
+register_blueprints(app)
+    Imports every blueprint and registers it on an app
+page_args() : dict
+    The cursor arguments of the current request, to be passed on to paginate()
+"""
+
+from flask import current_app, request
+from werkzeug.utils import import_string
+
+BLUEPRINTS = [
+    'app.views.auth:blueprint',
+    'app.views.threads:blueprint',
+    'app.views.subscriptions:blueprint',
+    'app.views.groups:blueprint',
+    'app.views.profile:blueprint',
+]
+
+
+def register_blueprints(app):
+    """Imports each blueprint in BLUEPRINTS and registers it on the app"""
+    for name in BLUEPRINTS:
+        app.register_blueprint(import_string(name))
+
+
+def page_args():
+    """Returns the cursor arguments of the current request, to be passed on to paginate()
+    """
+    return dict(after=request.args.get('after'), before=request.args.get('before'),
+                last=request.args.get('last') is not None, per_page=current_app.config['PAGE_SIZE'])
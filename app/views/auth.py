@@ -0,0 +1,68 @@
+"""
+auth.py holds the pages for signing up, logging in and logging out.
+
+Methods
+-------
+login() : LoginForm
+    Have the user sign in via credentials (username and password)
+signup() : RegistrationForm
+    User enters username and password to be registered and cache credentials within database
+signup_success()
+    Redirect to page confirming user registration
+logout()
+    Logs out the user and returns them to the sign-in page
+"""
+
+from flask import Blueprint, render_template, redirect, url_for, request
+from flask_login import login_user, login_required, logout_user
+from werkzeug.security import generate_password_hash, check_password_hash
+from app import db
+from app.forms import LoginForm, RegistrationForm
+from app.models import User
+
+blueprint = Blueprint('auth', __name__)
+
+
+@blueprint.route('/')
+@blueprint.route('/login', methods=['GET', 'POST'])
+def login():
+    """Checks the user's username and password with the credentials stored within the database, before redirecting them to the homepage
+    """
+
+    form = LoginForm()
+    if form.validate_on_submit():
+        user = User.query.filter_by(username=form.username.data).first()
+        if user:
+            if check_password_hash(user.password, form.password.data):
+                login_user(user, remember=form.remember.data)
+                return redirect(url_for('profile.home'))
+    return render_template('login.html', form=form)
+
+
+@blueprint.route('/signup', methods=['GET', 'POST'])
+def signup():
+    """Creates a new User object from the data passed throught the webpage's username, password and email fields, then redirects to the signup_success HTML page
+    """
+    form = RegistrationForm(request.form)
+    if form.validate_on_submit():
+        hashed_password = generate_password_hash(form.password.data, method='sha256')
+        with db.batch():
+            User(username=form.username.data, email=form.email.data, password=hashed_password)
+        return redirect(url_for('auth.signup_success'))
+    return render_template('signup.html', form=form)
+
+
+@blueprint.route('/signup_success')
+def signup_success():
+    """Confirms user registration success upon passing valid username, password and email data in their respective fields
+    """
+    return render_template('signup_success.html')
+
+
+@blueprint.route('/logout')
+@login_required
+def logout():
+    """Logs the user out of their user profile, then redirects to the login webapge
+    """
+    logout_user()
+    return redirect(url_for('auth.login'))
@@ -0,0 +1,103 @@
+"""
+groups.py holds the pages of the private discussion groups.
+
+Methods
+-------
+groups()
+    Display all groups that the user has access to.
+create_group() : CreateGroupForm()
+    Prompt the user to create a discussion group and add it to their list of accessable groups.
+manage_group()
+    Allow user to make adjustments to the group, such as removing themselves from the group.
+view_group()
+    Allow user to access a discussion group they're a part of.
+"""
+
+from flask import Blueprint, abort, render_template, redirect, request, url_for
+from flask_login import login_required, current_user
+from app import db
+from app.conditional import conditional
+from app.forms import AddThreadToGroup, AddUserToGroupForm, CreateGroupForm
+from app.models import Group, Post, Thread, Topic, User
+from app.queries import group_dashboard, listing_version, subscribed_topic_ids, user_groups
+
+blueprint = Blueprint('groups', __name__)
+
+
+@blueprint.route('/groups')
+@login_required
+def groups():
+    """View a list of all discussion groups the user has access to
+    """
+    rem = request.args.get("rem")
+    if rem is not None:
+        group = Group.query.filter_by(id=rem).first()
+        group.users.remove(current_user)
+        db.session.commit()
+    return render_template('groups.html', groups=user_groups(current_user).all())
+
+
+@blueprint.route('/create_group', methods=['GET', 'POST'])
+@login_required
+def create_group():
+    """Creates the discussion group, along with it's title and description
+    """
+    form = CreateGroupForm()
+    if form.validate_on_submit():
+        name = form.title.data
+        descr = form.descr.data
+        with db.batch():
+            g = Group(name, descr, user=current_user)
+        id = g.id
+        return redirect(url_for('groups.manage_group', id=id))
+    return render_template('create_group.html', form=form)
+
+
+@blueprint.route('/manage_group', methods=['GET', 'POST'])
+@login_required
+def manage_group():
+    """Allows the user to edit a discussion group they have access to, which permits edits such as adding users and removing them (including the current user themselves if they wish)
+    """
+    group_id = request.args.get('id')
+    group = Group.query.filter_by(id=group_id).first()
+    form = AddUserToGroupForm()
+    if form.validate_on_submit():
+        username = form.username.data
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            # redirect(url_for('groups.manage_group', id=group_id, status="bad_user"))
+            return render_template('manage_group.html', group=group, form=form, status="bad_user")
+        else:
+            group.add_user(user)
+            db.session.commit()
+            redirect(url_for('groups.manage_group', id=group_id))
+    return render_template('manage_group.html', group=group, form=form)
+
+
+@blueprint.route('/view_group/<string:id>', methods=['GET', 'POST'])
+@login_required
+def view_group(id):
+    """Displays the chosen discussion group's threads and posts to the user, while prompting them to either create a new post, new thread, or a new topic
+    """
+    group = Group.query.get(id)
+    if group is None:
+        abort(404)
+    form = AddThreadToGroup()
+    if form.validate_on_submit():
+        with db.batch():
+            new_thread = Thread()
+            new_topic = Topic.get(form.topic.data)
+            new_post = Post(title=form.title.data, text=form.post.data, user=current_user)
+            new_thread.add_first_post(new_post)
+            new_thread.add_topic(new_topic)
+            group.threads.append(new_thread)
+        # flash('Thread submitted.')
+        # return "well done"
+        # return render_template('view_group.html', group=group, form=form)
+    topic_ids = subscribed_topic_ids(current_user)
+    version = listing_version(Thread.group_id == group.id)
+
+    def render():
+        return render_template('view_group.html', group=group_dashboard(id), form=form, topic_ids=topic_ids)
+
+    return conditional(render, version, group.name, sorted(topic_ids), last_modified=version[1])
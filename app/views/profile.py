@@ -0,0 +1,87 @@
+"""
+profile.py holds the logged in user's home feed and the profile pages.
+
+Methods
+-------
+home()
+    Redirects to the homepage of the website.
+user(username)
+    Displays user's profile page, displaying the posts they've created and their username.
+edit_profile()
+    Allows users to overwrite their usernames and biographies (i.e 'about me') in their profile page.
+change_password()
+    Allows users to overwrite their password credential.
+"""
+
+from flask import Blueprint, flash, render_template, redirect, request, url_for
+from flask_login import login_required, current_user
+from werkzeug.security import generate_password_hash
+from app import db
+from app.forms import ChangePasswordForm, EditProfileForm
+from app.loaders import user_cache
+from app.models import FeedEntry, User
+from app.pagination import paginate
+from app.queries import user_posts
+from app.views import page_args
+
+blueprint = Blueprint('profile', __name__)
+
+
+@blueprint.route('/home')
+@login_required
+def home():
+    """Renders the homepage template for the website, along with a page of the user's feed
+    """
+    feed = paginate(current_user.get_feed(), (FeedEntry.timestamp, FeedEntry.post_id),
+                    key=lambda post: (post.timestamp, post.id), **page_args())
+    return render_template('home.html', name=current_user.username, feed=feed)
+
+
+@blueprint.route('/user/<username>')
+@login_required
+def user(username):
+    """Displays the user's profile based on their username, which also reveals a list of posts they've made on the website
+    """
+    user = User.query.filter_by(username=username).first_or_404()
+    return render_template('user.html', user=user, posts=user_posts(user).all())
+
+
+@blueprint.route('/edit_profile', methods=['GET', 'POST'])
+@login_required
+def edit_profile():
+    """Retrieves the current user's username and about me (i.e biography) data from the server database, then overrides the user's username and about me data with the input passed through the form
+    """
+    form = EditProfileForm()
+    if form.validate_on_submit():
+        current_user.username = form.username.data
+        current_user.about_me = form.about_me.data
+        db.session.commit()
+        user_cache.invalidate(current_user.id)
+        # flash('Your changes have been saved.') #flash not imported
+        return redirect(url_for('profile.edit_profile'))
+    elif request.method == 'GET':
+        form.username.data = current_user.username
+        form.about_me.data = current_user.about_me
+
+    return render_template('edit_profile.html', title='Edit Profile',
+                           form=form)
+
+
+@blueprint.route('/change_password', methods=['GET', 'POST'])
+def change_password():
+    """Retrieves the current user's hashed password from the database, then overrides the user's password with the input passed through the form, which is then hashed
+    """    
+    form = ChangePasswordForm(request.form)
+    if form.validate_on_submit():
+        hashed_password = generate_password_hash(form.password.data, method='sha256')
+        current_user.password = hashed_password
+        db.session.commit()
+        user_cache.invalidate(current_user.id)
+        flash('Your changes have been saved.')
+        return redirect(url_for('profile.edit_profile'))
+    elif request.method == 'GET':
+        hashed_password = generate_password_hash(form.password.data, method='sha256')
+        hashed_password = current_user.password
+
+    return render_template('change_password.html', title='Change Password',
+                           form=form)
@@ -0,0 +1,105 @@
+"""
+subscriptions.py holds the pages for following threads and topics, and the alerts of unseen replies.
+
+Methods
+-------
+subscriptions()
+    Display all subscriptions for an individual user
+sub_topic()
+    Display, specifically, the list of tags an individual user is subscribed to
+sub_thread()
+    Display, specifically, the list of threads an individual user is subscribed to
+unsub_topic()
+    Remove a topic from the list of subscribed topics for an individual user.
+unsub_thread()
+    Remove a thread from the list of subscribed threads for an individual user.
+alerts()
+    Notifies users whenever unread thread posts, topic-based threads, or discussion group posts, haven't been viewed yet by the respective user.
+"""
+
+from flask import Blueprint, render_template, redirect, request
+from flask_login import login_required, current_user
+from app import db
+from app.models import FeedEntry, Thread, Topic
+from app.queries import subscribed_threads, subscribed_topics, unseen_threads
+
+blueprint = Blueprint('subscriptions', __name__)
+
+
+@blueprint.route('/subscriptions')
+@login_required
+def subscriptions():
+    """Displays to users their respective thread, topic, and group subscriptions
+    """
+    return render_template('subscriptions.html', threads=subscribed_threads(current_user).all(),
+                           topics=subscribed_topics(current_user).all())
+
+
+@blueprint.route('/sub_topic/<string:topic_name>')
+@login_required
+def sub_topic(topic_name):
+    """Appends an additional topic into the user's list of subscribed topics
+    """
+    with db.batch():
+        topic = Topic.get(topic_name)
+        if topic not in current_user.topics:
+            current_user.topics.append(topic)
+            FeedEntry.rebuild(current_user)
+    redir = request.args.get('redir')
+    if redir is None:
+        redir = 'home'
+    return redirect(redir)
+
+
+@blueprint.route('/sub_thread/<int:thread_id>')
+@login_required
+def sub_thread(thread_id):
+    """Appends an additional thread into the user's list of subscribed threads, assuming that the thread doesn't already exist within the user's list of subscribed threads
+    """
+    thread = Thread.query.filter_by(id=thread_id).first_or_404()
+    if thread not in current_user.subs:
+        current_user.subs.append(thread)
+        FeedEntry.follow(current_user, thread)
+        db.session.commit()
+    redir = request.args.get('redir')
+    if redir is None:
+        redir = 'home'
+    return redirect(redir)
+
+
+@blueprint.route('/unsub_topic/<string:topic_name>')
+@login_required
+def unsub_topic(topic_name):
+    """Removes a topic from the user's list of subscribed topics
+    """
+    with db.batch():
+        current_user.topics.remove(Topic.get(topic_name))
+        FeedEntry.rebuild(current_user)
+    redir = request.args.get('redir')
+    if redir is None:
+        redir = 'home'
+    return redirect(redir)
+
+
+@blueprint.route('/unsub_thread/<int:thread_id>')
+@login_required
+def unsub_thread(thread_id):
+    """Removes a thread from the user's list of subscribed topics
+    """
+    thread = Thread.query.filter_by(id=thread_id).first_or_404()
+    if thread in current_user.subs:
+        current_user.subs.remove(thread)
+        FeedEntry.rebuild(current_user)
+        db.session.commit()
+    redir = request.args.get('redir')
+    if redir is None:
+        redir = 'home'
+    return redirect(redir)
+
+
+@blueprint.route('/alerts')
+@login_required
+def alerts():
+    """Displays any unread notifications to the users, which pertain to topics, threads and posts
+    """
+    return render_template('alerts.html', name=current_user.username, threads=unseen_threads(current_user).all())
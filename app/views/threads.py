@@ -0,0 +1,187 @@
+"""
+threads.py holds the pages of the public threads and topics: creating, listing, reading and editing threads, and
+searching their posts.
+
+Methods
+-------
+create_thread() : ThreadForm
+    Create a new post thread and committ it to the database
+view_threads()
+    Display a page of the threads cached within the database in a table in a specified format
+view_thread(id) : PostForm
+    Display a page of the posts within a specific thread, and prompt a form to create a new post in the thread
+thread_events(id) : Response
+    Stream the new posts of a thread to its last page as they are written
+edit_post() : PostForm
+    Identify and edit a post made by the same user that created the post
+edit_thread() : ThreadForm
+    Identify and edit a thread made by the same user that created the thread
+view_topic()
+    Identify and present a page of the threads pertaining to a particular topic
+search_posts()
+    Displays a page of the posts and threads matching the user's search, ranked by relevance.
+"""
+
+from flask import Blueprint, abort, current_app, render_template, redirect, request, url_for
+from flask_login import login_required, current_user
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+from app import db, live
+from app.conditional import conditional
+from app.forms import PostForm, ThreadForm
+from app.jobs import enqueue
+from app.models import Post, Thread, Topic
+from app.pagination import paginate
+from app.queries import is_subscribed, listing_version, subscribed_topic_ids, thread_detail, thread_listing, \
+    thread_posts
+from app.search import search
+from app.views import page_args
+
+blueprint = Blueprint('threads', __name__)
+
+
+@blueprint.route('/create_thread', methods=['GET', 'POST'])
+@login_required
+def create_thread():
+    """Create a new thread with a title, a new topic, and a new post and commits it to the database.
+    """
+    form = ThreadForm()
+    if form.validate_on_submit():
+        # the thread, its topic and its first post are written in a single transaction
+        with db.batch():
+            new_thread = Thread()
+            new_topic = Topic.get(form.topic.data)
+            new_post = Post(title=form.thread.data, text=form.post.data, user=current_user)
+            new_thread.add_first_post(new_post)
+            new_thread.add_topic(new_topic)
+        # flash('Thread submitted.')
+        return redirect(url_for('threads.view_threads'))
+    return render_template('create_thread.html', form=form)
+
+
+@blueprint.route('/view_threads', methods=['GET', 'POST'])
+@login_required
+def view_threads():
+    """Insert a page of the public threads within the database into a table and display the title, author, datetime and topic of each thread.
+    """
+    threads = paginate(thread_listing().filter_by(group=None), (Thread.created_at, Thread.id), **page_args())
+    return render_template('view_threads.html', threads=threads, topic_ids=subscribed_topic_ids(current_user))
+
+
+@blueprint.route('/view_thread/<string:id>', methods=['GET', 'POST'])
+@login_required
+def view_thread(id):
+    """Display a page of the posts within a thread and include a form to create a new post within that thread.
+    """
+    current_thread = thread_detail(id)
+    if current_thread is None:
+        abort(404)
+    form = PostForm()
+    if form.validate_on_submit():
+        with db.batch():
+            new_post = Post(title=current_thread.name, text=form.post.data, user=current_user)
+            current_thread.add_post(new_post)
+        # flash('Post submitted.')
+        return redirect(url_for('threads.view_thread', id=id, last=1))
+    subscribed = is_subscribed(current_user, current_thread)
+
+    def render():
+        posts = paginate(thread_posts(current_thread), (Post.timestamp, Post.id), descending=False, **page_args())
+        return render_template('view_thread.html', form=form, posts=posts, current_thread=current_thread,
+                               subscribed=subscribed, last_post_id=max((post.id for post in posts.items), default=None))
+
+    topic_name = current_thread.topic.name if current_thread.topic else None
+    return conditional(render, current_thread.updated_at, current_thread.name, topic_name, subscribed,
+                       last_modified=current_thread.updated_at)
+
+
+@blueprint.route('/view_thread/<string:id>/events')
+@login_required
+def thread_events(id):
+    """Stream the posts of a thread written after the reader's latest, given by the Last-Event-ID header of a
+    reconnecting browser or else the last_event_id argument, as Server-Sent Events
+    """
+    current_thread = thread_detail(id)
+    # the stream pushes every new post for as long as it is open, so a private group's posts go to its members only
+    if current_thread is None or not current_thread.is_visible_by(current_user):
+        abort(404)
+    last_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id'))
+    if last_id is None or not last_id.isdigit():
+        last_id = db.session.query(func.max(Post.id)).filter(Post.thread_id == current_thread.id).scalar() or 0
+
+    thread_id = current_thread.id
+
+    def render(post_ids):
+        # the stream outlives the request's session, and with it current_thread
+        posts = Post.query.options(joinedload('author')).filter(Post.thread_id == thread_id, Post.id.in_(post_ids)) \
+            .order_by(Post.timestamp, Post.id)
+        return [(post.id, render_template('fragments/post.html', post=post)) for post in posts]
+
+    return live.stream(thread_id, int(last_id), render)
+
+
+@blueprint.route('/view_thread/edit_post/<string:id>', methods=['GET', 'POST'])
+@login_required
+def edit_post(id):
+    """Identify a post created by the user and allow the user to edit that post.
+    """
+    current_post = Post.query.get(id)
+
+    form = PostForm(post=current_post.text)
+    if form.validate_on_submit():
+        current_post.text = form.post.data
+        enqueue('index_post', post_id=current_post.id)
+        current_post.thread.touch()
+        db.session.commit()
+        # flash('Post editted.')
+        return redirect(url_for('threads.view_thread', id=current_post.thread_id))
+    return render_template('edit_post.html', id=id, form=form, post=current_post)
+
+
+@blueprint.route('/edit_thread/<string:id>', methods=['GET', 'POST'])
+@login_required
+def edit_thread(id):
+    """Identify a thread created by the user and allow the user to edit that thread.
+    """
+    current_thread = Thread.query.get(id)
+    form = ThreadForm(thread=current_thread.name, topic=current_thread.topic.name, post=current_thread.posts[0].text)
+    if form.validate_on_submit():
+        current_thread.name = form.thread.data
+        current_thread.topic.name = form.topic.data
+        current_thread.posts[0].text = form.post.data
+        enqueue('index_thread', thread_id=current_thread.id)
+        current_thread.touch()
+        db.session.commit()
+        # flash('Thread editted.')
+        return redirect(url_for('threads.view_threads', id=id))
+    return render_template('edit_thread.html', id=id, form=form, thread=current_thread)
+
+
+@blueprint.route('/view_topic/<string:topic_name>')
+@login_required
+def view_topic(topic_name):
+    """Display a page of the threads based on topic
+    """
+    topic = Topic.get(topic_name)
+    topic_ids = subscribed_topic_ids(current_user)
+    version = listing_version(Thread.topic_id == topic.id)
+
+    def render():
+        threads = paginate(thread_listing().filter_by(topic=topic), (Thread.created_at, Thread.id), **page_args())
+        return render_template('view_topic.html', threads=threads, topic=topic, topic_ids=topic_ids)
+
+    return conditional(render, version, topic.id in topic_ids, last_modified=version[1])
+
+
+@blueprint.route('/search')
+@login_required
+def search_posts():
+    """Displays a page of the posts matching the terms searched for, within the threads visible to the user.
+    Results are ranked rather than ordered by time, so pages are numbered instead of using cursors
+    """
+    terms = request.args.get('q', '')
+    page = request.args.get('page', 1, type=int)
+    per_page = current_app.config['PAGE_SIZE']
+    results = search(current_user, terms, page=page, per_page=per_page)
+    return render_template('search.html', terms=terms, page=page, results=results[:per_page],
+                           has_next=len(results) > per_page)
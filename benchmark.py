@@ -0,0 +1,361 @@
+"""
+benchmark.py
+A benchmarking script for the cs2005 website
+Each benchmark builds its own temporary database, so the production data.db is never modified
+Benchmarks are run by name, eg:
+    python benchmark.py notify --subscribers 10000
+notify:
+    times replying to a thread with many subscribers, comparing the request with its jobs queued, the same jobs run
+    inline with their set-based notifications, and the previous approach of flagging every subscription in Python
+concurrency:
+    runs threads reading listings and threads posting replies at the same time, comparing the default SQLite setup
+    with the production config's WAL pragmas and read/write connection pools
+writes:
+    creates threads and replies by new users through the model constructors, committing every object as they do
+    outside a batch, and inside a db.batch() that commits once, with and without flushing every 100 objects
+startup:
+    starts fresh processes and times their first response and compiling the rest of the templates, with and without
+    the compiled templates kept by the bytecode cache (see templating.py)
+imports:
+    starts fresh processes and times importing the package, building the app without its pages, as the worker does,
+    and with them, then lists the modules that took longest to import
+static:
+    fetches the stylesheets, fonts and images the pages use, comparing Flask's static handler with the gzip copies
+    made by `flask compress-static`, by bytes sent and latency, for a first visit and a repeat visit sending ETags
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from sqlalchemy.exc import OperationalError
+from app import create_app, db
+from app.config import Config, ProductionConfig
+from app.models import *
+from app.jobs import run_pending
+from app.queries import thread_listing, thread_posts
+from app.staticfiles import compress_folder
+
+app = create_app()
+
+
+# region Helpers
+
+def temporary_database(directory):
+    """points the app at an empty database inside the given directory"""
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(directory, 'benchmark.db')
+    db.session.remove()
+    db.create_all()
+
+
+def bulk_users(prefix, count):
+    """inserts users with a single statement, returning their usernames"""
+    usernames = ['{}_{}'.format(prefix, i) for i in range(count)]
+    db.session.execute(User.__table__.insert(),
+                       [dict(username=name, email=name + '@example.com', password='') for name in usernames])
+    db.session.commit()
+    return usernames
+
+
+def report(name, samples):
+    """prints the median and worst of a list of timings given in seconds"""
+    samples = sorted(samples)
+    print('{:<28} median {:9.2f} ms    max {:9.2f} ms'.format(
+        name, 1000 * samples[len(samples) // 2], 1000 * samples[-1]))
+
+
+# endregion
+
+# region Notifications
+
+def legacy_add_post(thread, post):
+    """the replying code path as it was before notifications were set-based, kept here for comparison"""
+    post.thread = thread
+    for sub in thread.subbed_id:
+        sub.unseen = True
+    # subscriptions are unique, and every reply in bench_notify is by a subscriber
+    if post.author not in thread.subbed:
+        thread.subbed.append(post.author)
+    thread.post_count = Thread.post_count + 1
+
+
+def bench_notify(args):
+    """times replies to a thread with args.subscribers subscribers"""
+    with tempfile.TemporaryDirectory() as directory:
+        temporary_database(directory)
+        author = User('author', '', 'author@example.com')
+        thread = Thread(Post(author, 'first post', title='benchmark thread'))
+        thread_id = thread.id
+        usernames = bulk_users('subscriber', args.subscribers)
+        db.session.execute(ThreadSubscriptions.__table__.insert(),
+                           [dict(user_id=name, thread_id=thread_id, unseen=False) for name in usernames])
+        db.session.commit()
+
+        def reply(add_post, inline=True):
+            # each reply starts from a fresh session and cleared flags, as a new request would
+            app.config['JOBS_INLINE'] = inline
+            run_pending()
+            db.session.remove()
+            ThreadSubscriptions.query.update({'unseen': False})
+            db.session.commit()
+            thread = Thread.query.get(thread_id)
+            replier = User.query.filter_by(username=usernames[0]).first()
+            start = time.perf_counter()
+            post = Post(replier, 'reply')
+            add_post(thread, post)
+            db.session.commit()
+            return time.perf_counter() - start
+
+        print('Replying to a thread with {} subscribers'.format(args.subscribers))
+        report('add_post, jobs queued', [reply(Thread.add_post, inline=False) for i in range(args.replies)])
+        report('add_post, jobs run inline', [reply(Thread.add_post) for i in range(args.replies)])
+        report('per-object notify', [reply(legacy_add_post) for i in range(args.replies)])
+        db.session.remove()
+
+
+# endregion
+
+# region Concurrency
+
+def bench_concurrency(args):
+    """runs args.readers reading threads and args.writers posting threads for args.seconds under each config"""
+    for name, config in (('default', Config), ('production', ProductionConfig)):
+        with tempfile.TemporaryDirectory() as directory:
+            for key in ('SQLITE_PRAGMAS', 'SQLITE_SPLIT_POOLS'):
+                app.config[key] = getattr(config, key)
+            app.config['JOBS_INLINE'] = False
+            temporary_database(directory)
+            thread_id = Thread(Post(User('author', '', 'author@example.com'), 'first post', title='thread')).id
+            user_ids = [db.session.query(User.id).filter_by(username=name).scalar()
+                        for name in bulk_users('writer', args.writers)]
+            db.session.remove()
+            timings = {'read': [], 'write': []}
+            errors = {'read': 0, 'write': 0}
+            stopping = threading.Event()
+
+            def read():
+                with app.test_request_context(method='GET'):
+                    thread_listing().order_by(Thread.created_at.desc()).limit(20).all()
+                    thread_posts(Thread.query.get(thread_id)).order_by(Post.timestamp.desc()).limit(20).all()
+
+            def write(user_id):
+                with app.test_request_context(method='POST'):
+                    Thread.query.get(thread_id).add_post(Post(User.query.get(user_id), 'reply'))
+                    db.session.commit()
+
+            def loop(kind, action, *arguments):
+                while not stopping.is_set():
+                    start = time.perf_counter()
+                    try:
+                        action(*arguments)
+                        timings[kind].append(time.perf_counter() - start)
+                    except OperationalError:
+                        errors[kind] += 1
+                    finally:
+                        db.session.remove()
+
+            pool = [threading.Thread(target=loop, args=('read', read)) for i in range(args.readers)]
+            pool += [threading.Thread(target=loop, args=('write', write, user_id)) for user_id in user_ids]
+            for thread in pool:
+                thread.start()
+            time.sleep(args.seconds)
+            stopping.set()
+            for thread in pool:
+                thread.join()
+            print('{} config, {} readers and {} writers for {} seconds'.format(
+                name, args.readers, args.writers, args.seconds))
+            for kind in ('read', 'write'):
+                report('{}s, {} done, {} locked'.format(kind, len(timings[kind]), errors[kind]), timings[kind] or [0])
+    db.session.remove()
+    app.config.from_object(Config)
+
+
+# endregion
+
+# region Writes
+
+def bench_writes(args):
+    """creates args.threads threads of args.replies replies each by new users, committing each object and in batches"""
+
+    def create(prefix):
+        for i in range(args.threads):
+            author = User('{}_{}'.format(prefix, i), '', '{}_{}@example.com'.format(prefix, i))
+            thread = Thread(Post(author, 'first post', title='thread {}'.format(i)))
+            for j in range(args.replies):
+                Post(author, 'reply {}'.format(j), thread=thread)
+
+    with tempfile.TemporaryDirectory() as directory:
+        temporary_database(directory)
+        app.config['JOBS_INLINE'] = False
+        rows = args.threads * (args.replies + 2)
+        print('Creating {} threads with {} replies each'.format(args.threads, args.replies))
+        start = time.perf_counter()
+        create('committed')
+        elapsed = time.perf_counter() - start
+        print('{:<28} {:9.2f} s    {:9.0f} objects/s'.format('commit per object', elapsed, rows / elapsed))
+        for chunk_size in (None, 100):
+            start = time.perf_counter()
+            with db.batch(chunk_size=chunk_size):
+                create('batch_{}'.format(chunk_size))
+            elapsed = time.perf_counter() - start
+            print('{:<28} {:9.2f} s    {:9.0f} objects/s'.format(
+                'batch, chunk size {}'.format(chunk_size), elapsed, rows / elapsed))
+        db.session.remove()
+    app.config.from_object(Config)
+
+
+# endregion
+
+# region Startup
+
+# run in a new process: times importing the app, its first response and compiling every other template
+STARTUP = '''
+import json, sys, time
+start = time.perf_counter()
+from app import create_app
+from app.templating import compile_templates
+app = create_app()
+imported = time.perf_counter()
+if sys.argv[1] == 'cold':
+    app.jinja_env.bytecode_cache = None
+app.test_client().get('/login')
+responded = time.perf_counter()
+with app.app_context():
+    compile_templates()
+print(json.dumps([imported - start, responded - imported, time.perf_counter() - responded]))
+'''
+
+
+def bench_startup(args):
+    """starts args.processes processes without and with the bytecode cache, which is filled beforehand"""
+    root = os.path.dirname(os.path.abspath(__file__))
+
+    def start(mode):
+        output = subprocess.check_output([sys.executable, '-c', STARTUP, mode], cwd=root)
+        return json.loads(output.decode('utf-8').splitlines()[-1])
+
+    start('warm')
+    for mode in ('cold', 'warm'):
+        runs = [start(mode) for i in range(args.processes)]
+        print('{} templates, {} processes'.format('compiled' if mode == 'cold' else 'cached', args.processes))
+        for index, name in enumerate(('import', 'first response', 'compile the rest')):
+            report(name, [run[index] for run in runs])
+
+
+# run in a new process: times importing the package and building the app with and without its pages, printing
+# python -X importtime's report of the modules imported on the way to stderr
+IMPORTS = '''
+import json, time
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app(views=False)
+worker = time.perf_counter()
+create_app()
+print(json.dumps([imported - start, worker - imported, time.perf_counter() - worker]))
+'''
+
+
+def bench_imports(args):
+    """times args.processes new processes importing and building the app, and lists the slowest imports of the last"""
+    root = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for i in range(args.processes):
+        process = subprocess.run([sys.executable, '-X', 'importtime', '-c', IMPORTS], cwd=root,
+                                 stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+        runs.append(json.loads(process.stdout.decode('utf-8').splitlines()[-1]))
+    print('{} processes'.format(args.processes))
+    for index, name in enumerate(('import app', 'create_app(views=False)', 'create_app() after it')):
+        report(name, [run[index] for run in runs])
+    # lines read "import time: self [us] | cumulative | imported package", the package indented by its depth
+    modules = []
+    for line in process.stderr.decode('utf-8').splitlines():
+        fields = line.split('|')
+        if line.startswith('import time:') and fields[1].strip().isdigit():
+            modules.append((int(fields[1]), fields[2].rstrip()))
+    print('slowest imports, cumulative')
+    for cumulative, module in sorted(modules, reverse=True)[:args.top]:
+        print('{:>9.2f} ms  {}'.format(cumulative / 1000, module))
+
+
+# endregion
+
+# region Static files
+
+STATIC_FILES = ['css/main.css', 'css/util.css', 'vendor/bootstrap/css/bootstrap.min.css',
+                'vendor/jquery/jquery-3.2.1.min.js', 'fonts/iconic/fonts/Material-Design-Iconic-Font.ttf',
+                'fonts/font-awesome-4.7.0/fonts/fontawesome-webfont.ttf', 'fonts/poppins/Poppins-Regular.ttf',
+                'fonts/poppins/Poppins-Bold.ttf', 'images/bg-02.jpg', 'images/icons/notif.svg']
+
+
+def bench_static(args):
+    """fetches STATIC_FILES args.rounds times with Flask's static handler and with the precompressed one"""
+    compress_folder(app.static_folder)
+    client = app.test_client()
+    etags = {}
+
+    def visit(repeat):
+        # a repeat visit sends the ETags of the first, as a browser revalidating its cache would
+        sent = 0
+        for filename in STATIC_FILES:
+            headers = {'Accept-Encoding': 'gzip, deflate, br'}
+            if repeat:
+                headers['If-None-Match'] = etags[filename]
+            response = client.get('/static/' + filename, headers=headers)
+            sent += len(response.get_data())
+            etags[filename] = response.headers['ETag']
+            response.close()
+        return sent
+
+    for name, precompressed in (('flask', False), ('precompressed', True)):
+        app.config['STATIC_PRECOMPRESSED'] = precompressed
+        for repeat in (False, True):
+            timings = []
+            for i in range(args.rounds):
+                start = time.perf_counter()
+                sent = visit(repeat)
+                timings.append(time.perf_counter() - start)
+            report('{} {} {} KB'.format(name, 'repeat' if repeat else 'first', sent // 1024), timings)
+    app.config['STATIC_PRECOMPRESSED'] = Config.STATIC_PRECOMPRESSED
+
+
+# endregion
+
+BENCHMARKS = {
+    'notify': bench_notify,
+    'concurrency': bench_concurrency,
+    'writes': bench_writes,
+    'startup': bench_startup,
+    'imports': bench_imports,
+    'static': bench_static,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks for the cs2005 website')
+    subparsers = parser.add_subparsers(dest='benchmark')
+    notify = subparsers.add_parser('notify', help='reply latency for a thread with many subscribers')
+    notify.add_argument('--subscribers', type=int, default=10000)
+    notify.add_argument('--replies', type=int, default=20)
+    concurrency = subparsers.add_parser('concurrency', help='throughput of concurrent readers and writers')
+    concurrency.add_argument('--readers', type=int, default=8)
+    concurrency.add_argument('--writers', type=int, default=4)
+    concurrency.add_argument('--seconds', type=float, default=5)
+    writes = subparsers.add_parser('writes', help='creating threads with per-object commits and in batches')
+    writes.add_argument('--threads', type=int, default=200)
+    writes.add_argument('--replies', type=int, default=5)
+    startup = subparsers.add_parser('startup', help='time to first response of a new process')
+    startup.add_argument('--processes', type=int, default=10)
+    imports = subparsers.add_parser('imports', help='time to import the package and build the app')
+    imports.add_argument('--processes', type=int, default=10)
+    imports.add_argument('--top', type=int, default=15)
+    static = subparsers.add_parser('static', help='bytes sent and latency of the static files')
+    static.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+    if args.benchmark is None:
+        parser.error('choose a benchmark: ' + ', '.join(BENCHMARKS))
+    with app.app_context():
+        BENCHMARKS[args.benchmark](args)
@@ -0,0 +1,231 @@
+"""
+loadtest.py
+A load testing harness for the cs2005 website
+Logs in as users of a database filled by `flask generate-data` and requests the pages that read the most data, reporting
+the 50th, 95th and 99th percentile latency of each route along with the SQL statements its requests executed
+Pages are requested in-process with Flask's test client, against the database of APP_CONFIG or --database, eg:
+    python loadtest.py --database sqlite:////tmp/large.db --requests 200
+or from a server that is already running, in which case statements are not counted:
+    python loadtest.py --database sqlite:////tmp/large.db --url http://localhost:5000 --clients 8
+The database is read either way, to choose the users and the threads and groups they visit
+ROUTES:
+    home is the user's feed, view_threads the public thread listing, view_thread a public thread picked in proportion
+    to its posts (readers follow activity), alerts the threads with posts the user has not seen, and view_group one of
+    the user's groups, or a random group when they belong to none
+Each client logs in as one of the --users most active users (the lowest ids of a generated database) and requests
+every route in turn, running through them --warmup times first without recording, so that templates are compiled and
+caches filled as on a server that has been up for a while
+"""
+
+import argparse
+import math
+import random
+import re
+import threading
+import time
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, build_opener
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import create_app, db
+from app.generate import PASSWORD
+from app.models import User, Thread, Group, group_user_association
+
+ROUTES = ['home', 'view_threads', 'view_thread', 'alerts', 'view_group']
+PERCENTILES = [50, 95, 99]
+CSRF_TOKEN = re.compile(r'name="csrf_token" type="hidden" value="([^"]*)"')
+
+# statements executed by the requests of each thread, counted on every engine, as split pools have several
+statements = threading.local()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_statement(*args):
+    statements.count = getattr(statements, 'count', 0) + 1
+
+
+# region Clients
+
+class TestClient:
+    """Requests pages from the app in this process, counting the SQL statements of each"""
+
+    counts_statements = True
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path):
+        """returns the status and body of a GET request"""
+        response = self.client.get(path)
+        body = response.get_data(as_text=True)
+        response.close()
+        return response.status_code, body
+
+    def post(self, path, data):
+        """returns the status of a POST request, without following a redirect"""
+        response = self.client.post(path, data=data)
+        response.close()
+        return response.status_code
+
+
+class NoRedirect(HTTPRedirectHandler):
+    """leaves redirects to the caller, so a login answered with a redirect can be told from one answered with a page"""
+
+    def redirect_request(self, *args):
+        return None
+
+
+class HTTPClient:
+    """Requests pages from a running server, keeping its session cookie"""
+
+    counts_statements = False
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()), NoRedirect)
+
+    def request(self, path, data=None):
+        try:
+            with self.opener.open(self.url + path, data=data) as response:
+                return response.status, response.read().decode('utf-8')
+        except HTTPError as error:
+            return error.code, error.read().decode('utf-8', 'replace')
+
+    def get(self, path):
+        """returns the status and body of a GET request"""
+        return self.request(path)
+
+    def post(self, path, data):
+        """returns the status of a POST request, without following a redirect"""
+        return self.request(path, urlencode(data).encode('utf-8'))[0]
+
+
+def login(client, username, password):
+    """logs a client in through the login form, as a browser would"""
+    status, body = client.get('/login')
+    match = CSRF_TOKEN.search(body)
+    data = dict(username=username, password=password, csrf_token=match.group(1) if match else '')
+    if client.post('/login', data) != 302:
+        raise SystemExit('Could not log in as {}, is this a database filled by `flask generate-data`?'.format(username))
+
+
+# endregion
+
+# region Load
+
+def choose_targets(count, seed):
+    """
+    picks the users the clients log in as, with the pages each visits
+
+    Returns
+    -------
+    list
+        (username, thread_paths, group_paths) for each of the count most active users
+    """
+
+    rng = random.Random(seed)
+    users = User.query.order_by(User.id).limit(count).all()
+    if not users:
+        raise SystemExit('The database has no users, fill it with `flask generate-data`')
+    threads = db.session.query(Thread.id, Thread.post_count).filter(Thread.group_id == None).all()
+    if not threads:
+        raise SystemExit('The database has no public threads')
+    group_ids = [id for id, in db.session.query(Group.id)]
+    targets = []
+    for user in users:
+        thread_ids = rng.choices([id for id, posts in threads], weights=[posts or 1 for id, posts in threads], k=50)
+        member_of = [id for id, in db.session.query(group_user_association.c.group_id)
+                     .filter(group_user_association.c.user_id == user.id)]
+        groups = member_of or rng.sample(group_ids, min(len(group_ids), 5))
+        targets.append((user.username, ['/view_thread/{}'.format(id) for id in thread_ids],
+                        ['/view_group/{}'.format(id) for id in groups]))
+    db.session.remove()
+    return targets
+
+
+def run_client(client, target, password, rounds, warmup, results, seed):
+    """logs a client in and requests every route rounds times, appending (route, seconds, statements, status)"""
+    rng = random.Random(seed)
+    username, thread_paths, group_paths = target
+    login(client, username, password)
+    paths = {'home': lambda: '/home', 'view_threads': lambda: '/view_threads',
+             'view_thread': lambda: rng.choice(thread_paths), 'alerts': lambda: '/alerts',
+             'view_group': lambda: rng.choice(group_paths) if group_paths else None}
+    for index in range(warmup + rounds):
+        for route in ROUTES:
+            path = paths[route]()
+            if path is None:
+                continue
+            statements.count = 0
+            start = time.perf_counter()
+            status, body = client.get(path)
+            elapsed = time.perf_counter() - start
+            if index >= warmup:
+                results.append((route, elapsed, statements.count, status))
+
+
+def percentile(samples, rank):
+    """returns the nearest-rank percentile of a sorted list"""
+    return samples[max(0, math.ceil(rank / 100 * len(samples)) - 1)]
+
+
+def report(results, counted):
+    """prints the latency percentiles and statement counts of each route"""
+    print('{:<14}{:>8}{}{:>10}{:>12}{:>9}'.format(
+        'route', 'requests', ''.join('{:>10}'.format('p{}'.format(rank)) for rank in PERCENTILES), 'max',
+        'statements', 'errors'))
+    for route in ROUTES:
+        rows = [row for row in results if row[0] == route]
+        if not rows:
+            continue
+        timings = sorted(1000 * elapsed for route, elapsed, count, status in rows)
+        counts = [count for route, elapsed, count, status in rows]
+        errors = sum(1 for route, elapsed, count, status in rows if status != 200)
+        print('{:<14}{:>8}{}{:>8.1f}ms{:>12}{:>9}'.format(
+            route, len(rows), ''.join('{:>8.1f}ms'.format(percentile(timings, rank)) for rank in PERCENTILES),
+            timings[-1], '{:.1f}/{}'.format(sum(counts) / len(counts), max(counts)) if counted else '-', errors))
+    if counted:
+        print('statements are the mean/max per request')
+
+
+def load_test(app, args):
+    """runs args.clients clients at once, each making args.requests requests of every route"""
+    targets = choose_targets(args.users, args.seed)
+    results = []
+    threads = []
+    for index in range(args.clients):
+        client = HTTPClient(args.url) if args.url else TestClient(app)
+        threads.append(threading.Thread(target=run_client, args=(
+            client, targets[index % len(targets)], args.password, args.requests, args.warmup, results,
+            args.seed + index)))
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    print('{} clients, {} requests in {:.1f} seconds, {:.0f} requests per second'.format(
+        args.clients, len(results), elapsed, len(results) / elapsed))
+    report(results, counted=not args.url)
+
+
+# endregion
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load test for the cs2005 website')
+    parser.add_argument('--database', default=None, help='URI of the database, the configured one by default')
+    parser.add_argument('--url', default=None, help='URL of a running server, eg. http://localhost:5000')
+    parser.add_argument('--clients', type=int, default=1, help='number of clients requesting at once')
+    parser.add_argument('--requests', type=int, default=100, help='requests of each route made by each client')
+    parser.add_argument('--warmup', type=int, default=1, help='unrecorded requests of each route first')
+    parser.add_argument('--users', type=int, default=20, help='number of the most active users to log in as')
+    parser.add_argument('--password', default=PASSWORD, help='password of the users')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    app = create_app()
+    if args.database:
+        app.config['SQLALCHEMY_DATABASE_URI'] = args.database
+    with app.app_context():
+        load_test(app, args)
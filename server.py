@@ -0,0 +1,33 @@
+"""
+server.py
+Serves the website in production from a pool of worker processes, each answering requests on a pool of threads, see
+app/prefork.py. It needs nothing but the website's own dependencies, on Linux
+    python server.py [--bind HOST:PORT] [--workers N] [--threads N] [--max-memory MIB] [--config NAME]
+--bind, --workers, --threads and --max-memory default to WEB_BIND, WEB_WORKERS (one per CPU when None), WEB_THREADS
+and WEB_MAX_MEMORY in app/config.py, and --config to the APP_CONFIG environment variable, eg. production
+Each worker warms up, compiling the templates and opening its database connections, before it accepts a connection
+    kill -HUP <pid> reloads the workers gracefully, eg. after a deploy, starting new ones before stopping the old
+    kill -TERM <pid> (or Ctrl-C) stops the server once the requests in progress are answered
+A worker using more than --max-memory MiB is replaced once it has answered its requests; 0 turns the limit off
+"""
+
+import argparse
+import os
+from app.config import CONFIGS
+from app.prefork import Arbiter
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serves the cs2005 website from a pool of worker processes')
+    parser.add_argument('--config', default=os.environ.get('APP_CONFIG', 'default'), choices=sorted(CONFIGS),
+                        help='name of the config, APP_CONFIG by default')
+    parser.add_argument('--bind', default=None, help='HOST:PORT to listen on')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--threads', type=int, default=None, help='number of requests each worker answers at once')
+    parser.add_argument('--max-memory', type=int, default=None, help='MiB of memory past which a worker is replaced')
+    args = parser.parse_args()
+    config = CONFIGS[args.config]
+    arbiter = Arbiter(args.bind or config.WEB_BIND, args.config, args.workers or config.WEB_WORKERS or os.cpu_count(),
+                      args.threads or config.WEB_THREADS,
+                      max_memory=config.WEB_MAX_MEMORY if args.max_memory is None else args.max_memory or None,
+                      graceful_timeout=config.WEB_GRACEFUL_TIMEOUT, warmup_timeout=config.WEB_WARMUP_TIMEOUT)
+    raise SystemExit(arbiter.run())
@@ -5,47 +5,169 @@ Tests all 5 major modules for functionality
 Including simulating HTML get and posts requests
 setUp:
     the setup method is run before each unit test
-    it changes the Flask app configuration to the test config
-    and changes the SQL database to a dummy test database
+    it pushes an application context of the app built with the test config,
+    which uses a dummy test database
     it then initializes the database and allows each test to run
 tearDown:
     tearDown is run after each unit test
     it removes the database session and drops all the tables, effectively removing the DB
-    it then reloads the standard Flask config file
+    it then reloads the test config and pops the application context
 """
 
+import gzip
 import os
-from app import app
+import pstats
+import re
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
 import unittest
+from flask import render_template_string, url_for
+from contextlib import contextmanager
+from urllib.request import urlopen
+from sqlalchemy import create_engine, event, inspect
+from sqlalchemy.exc import OperationalError
+from app import create_app
 from app.config import Config, TestConfig
 from app.models import *
+from app.pagination import paginate
+from app.jobs import Job, task, enqueue, claim, run_pending
+from app.search import search, search_unindexed
+from app.transfer import copy_database
+from app.migrations import MIGRATIONS, current_version, upgrade
+from app.loaders import user_cache
+from app.fragments import fragment_cache
+from app.assets import BUNDLES, build_assets, minify_js
+from app.templating import bytecode_cache, compile_templates
+from app.generate import generate_data
+from app.metrics import Metrics
+from app.nplusone import fingerprint
+from app.live import Hub, stream as live_stream
 from werkzeug.security import generate_password_hash
 
 
+@task('unit_test_failure')
+def failing_job():
+    """a job that always fails, used to test retries"""
+    raise RuntimeError('failing job')
+
+
+@task('unit_test_vanishing')
+def vanishing_job():
+    """a job that deletes its own row before failing, used to test failures of removed jobs"""
+    Job.query.delete()
+    db.session.commit()
+    raise RuntimeError('vanishing job')
+
+
+app = create_app(TestConfig)
+
+# the tables of app/data/data.db as the website shipped them, before the first migration
+BASELINE_SCHEMA = """
+    CREATE TABLE "Group" (
+        id INTEGER NOT NULL,
+        name VARCHAR(128),
+        descr TEXT,
+        PRIMARY KEY (id)
+    );
+    CREATE TABLE "Topic" (
+        id INTEGER NOT NULL,
+        name VARCHAR(128),
+        PRIMARY KEY (id),
+        UNIQUE (name)
+    );
+    CREATE TABLE "User" (
+        id INTEGER NOT NULL,
+        username VARCHAR(64),
+        password VARCHAR(128),
+        email VARCHAR(128),
+        about_me TEXT,
+        PRIMARY KEY (id)
+    );
+    CREATE UNIQUE INDEX "ix_User_username" ON "User" (username);
+    CREATE UNIQUE INDEX "ix_User_email" ON "User" (email);
+    CREATE TABLE "Thread" (
+        id INTEGER NOT NULL,
+        name VARCHAR(128),
+        topic_id INTEGER,
+        group_id INTEGER,
+        PRIMARY KEY (id),
+        FOREIGN KEY(topic_id) REFERENCES "Topic" (id),
+        FOREIGN KEY(group_id) REFERENCES "Group" (id)
+    );
+    CREATE TABLE group_user (
+        user_id INTEGER,
+        group_id INTEGER,
+        FOREIGN KEY(user_id) REFERENCES "User" (id),
+        FOREIGN KEY(group_id) REFERENCES "Group" (id)
+    );
+    CREATE TABLE topic_subscriptions (
+        id INTEGER NOT NULL,
+        user_id INTEGER,
+        topic_id INTEGER,
+        unseen BOOLEAN,
+        PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES "User" (id),
+        FOREIGN KEY(topic_id) REFERENCES "Topic" (id),
+        CHECK (unseen IN (0, 1))
+    );
+    CREATE TABLE "Post" (
+        id INTEGER NOT NULL,
+        title VARCHAR(128),
+        text TEXT,
+        timestamp DATETIME,
+        author_id INTEGER,
+        thread_id INTEGER,
+        PRIMARY KEY (id),
+        FOREIGN KEY(author_id) REFERENCES "User" (id),
+        FOREIGN KEY(thread_id) REFERENCES "Thread" (id)
+    );
+    CREATE INDEX "ix_Post_timestamp" ON "Post" (timestamp);
+    CREATE TABLE thread_subscriptions (
+        id INTEGER NOT NULL,
+        user_id INTEGER,
+        thread_id INTEGER,
+        unseen BOOLEAN,
+        PRIMARY KEY (id),
+        FOREIGN KEY(user_id) REFERENCES "User" (username),
+        FOREIGN KEY(thread_id) REFERENCES "Thread" (id),
+        CHECK (unseen IN (0, 1))
+    );
+"""
+
+
 class UnitTest(unittest.TestCase):
     TESTING = True
 
     def setUp(self):
         """
-        setup changes the config to a temporary test config
+        setup pushes an application context for the test app
         wtform authentication is bypassed
         the database path is changed to test.db
         the database is then initialized
         """
-        app.config.from_object(TestConfig)
+        self.context = app.app_context()
+        self.context.push()
         app.config['WTF_CSRF_ENABLED'] = False
-        app.testing = True
         self.app = app.test_client()
         db.create_all()
         # login for wtforms
 
     def tearDown(self):
         """
-        teardown removes the database session, drops the table, and restores the original config
+        teardown removes the database session, drops the table, restores the test config and pops the context
         """
         db.session.remove()
         db.drop_all()
-        app.config.from_object(Config)
+        user_cache.clear()
+        fragment_cache.clear()
+        app.config.from_object(TestConfig)
+        self.context.pop()
 
     def login(self, username, password):
         """
@@ -60,6 +182,30 @@ class UnitTest(unittest.TestCase):
             form=''
         ), follow_redirects=True)
 
+    @contextmanager
+    def query_budget(self, budget=None, name='the block'):
+        """
+        a convenience context manager that fails the test if more than budget SQL statements are executed within it
+        the failure lists each statement with the number of times it ran, so a lazy load in a loop stands out
+        the yielded list holds the statements run, and with no budget they are only recorded, for the test to count
+        """
+        statements = []
+
+        def before_cursor_execute(connection, cursor, statement, *args):
+            statements.append(fingerprint(statement))
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        if budget is None:
+            return
+        repeats = sorted(((statements.count(statement), statement) for statement in set(statements)), reverse=True)
+        self.assertTrue(len(statements) <= budget, '{} ran {} statements, over its budget of {}:\n{}'.format(
+            name, len(statements), budget, '\n'.join('{} x {}'.format(count, statement[:200])
+                                                     for count, statement in repeats)))
+
     # region Class Creation Tests
 
     def test_empty_db(self):
@@ -159,6 +305,22 @@ class UnitTest(unittest.TestCase):
         self.assertTrue(post in thread.posts)
         self.assertTrue(post.thread == thread)
 
+    def test_thread_summary(self):
+        """
+        Asserts that a thread's author, post count and latest post are kept up to date as posts are added
+        """
+        author = User('test_author', 'test_password', 'author_email')
+        replier = User('test_replier', 'test_password', 'replier_email')
+        thread = Thread(Post(author, 'first post', title='test_thread'))
+        self.assertTrue(thread.author == author and thread.last_poster == author)
+        self.assertTrue(thread.post_count == 1)
+        reply = Post(replier, 'reply', thread=thread)
+        db.session.commit()
+        self.assertTrue(thread.author == author and thread.last_poster == replier)
+        self.assertTrue(thread.post_count == 2)
+        self.assertTrue(thread.last_post_at == reply.timestamp)
+        self.assertTrue(thread.created_at == thread.posts[0].timestamp)
+
     def test_thread_topic_relationship(self):
         topic = Topic('test_topic')
         thread = Thread(topic=topic)
@@ -229,6 +391,852 @@ class UnitTest(unittest.TestCase):
 
     # endregion
 
+    # region Feed Tests
+
+    def test_feed_publish(self):
+        """
+        Replies are written to the feed of the thread's and topic's subscribers, but not to the author's own feed
+        """
+        author = User('test_author', 'test_password', 'author_email')
+        replier = User('test_replier', 'test_password', 'replier_email')
+        follower = User('test_follower', 'test_password', 'follower_email')
+        topic = Topic('test_topic')
+        topic.add_user(follower)
+        thread = Thread(Post(author, 'first post', title='test_thread'))
+        thread.add_topic(topic)
+        reply = Post(replier, 'reply', thread=thread)
+        self.assertTrue(author.get_feed().all() == [reply])
+        self.assertTrue(replier.get_feed().all() == [thread.posts[0]])
+        self.assertTrue(follower.get_feed().all() == [reply, thread.posts[0]])
+
+    def test_feed_rebuild(self):
+        """
+        Rebuilding a feed recomputes it from the user's current subscriptions
+        """
+        author = User('test_author', 'test_password', 'author_email')
+        reader = User('test_reader', 'test_password', 'reader_email')
+        thread = Thread(Post(author, 'first post', title='test_thread'))
+        self.assertTrue(reader.get_feed().all() == [])
+        thread.subbed.append(reader)
+        FeedEntry.rebuild(reader)
+        self.assertTrue(reader.get_feed().all() == thread.posts)
+        thread.subbed.remove(reader)
+        FeedEntry.rebuild(reader)
+        self.assertTrue(reader.get_feed().all() == [])
+
+    def test_notify(self):
+        """
+        Asserts that replying flags the thread's and the topic's subscribers, and subscribes the replier only once
+        """
+        author = User('test_author', 'test_password', 'author_email')
+        replier = User('test_replier', 'test_password', 'replier_email')
+        follower = User('test_follower', 'test_password', 'follower_email')
+        topic = Topic('test_topic')
+        topic.add_user(follower)
+        thread = Thread(Post(author, 'first post', title='test_thread'), topic=topic)
+        db.session.commit()
+        self.assertTrue(follower.get_unseen_topics() == [topic])
+        TopicSubscriptions.query.update({'unseen': False})
+        Post(replier, 'reply', thread=thread)
+        Post(replier, 'second reply', thread=thread)
+        self.assertTrue(author.get_unseen_threads() == [thread])
+        self.assertTrue(follower.get_unseen_topics() == [topic])
+        self.assertTrue(ThreadSubscriptions.query.filter_by(user_id=replier.username).count() == 1)
+
+    # endregion
+
+    # region Job Tests
+
+    def test_jobs_queued(self):
+        """
+        Asserts that replying only enqueues the notification, feed and search jobs, which take effect once they are run,
+        while the thread's post count and latest post are updated with the reply
+        """
+        app.config['JOBS_INLINE'] = False
+        author = User('test_author', 'test_password', 'author_email')
+        replier = User('test_replier', 'test_password', 'replier_email')
+        thread = Thread(Post(author, 'first post', title='test_thread'))
+        run_pending()
+        reply = Post(replier, 'reply', thread=thread)
+        self.assertTrue(Job.query.count() == 4)
+        self.assertTrue(thread.post_count == 2 and thread.last_poster == replier)
+        self.assertTrue(author.get_unseen_threads() == [] and author.get_feed().all() == [])
+        self.assertTrue(run_pending() == 4)
+        db.session.expire_all()
+        self.assertTrue(author.get_unseen_threads() == [thread] and author.get_feed().all() == [reply])
+        self.assertTrue(Job.query.count() == 0)
+
+    def test_job_retries(self):
+        """
+        Asserts that a claimed job is hidden from other workers, and that a failing job is retried until it runs out
+        of attempts
+        """
+        app.config['JOBS_INLINE'] = False
+        enqueue('unit_test_failure')
+        db.session.commit()
+        job = claim()
+        self.assertTrue(job.attempts == 1)
+        self.assertTrue(claim() is None)
+        for attempt in range(app.config['JOBS_MAX_ATTEMPTS'] - 1):
+            Job.query.update({'available_at': datetime.utcnow()})
+            self.assertTrue(run_pending() == 1)
+        job = Job.query.first()
+        self.assertTrue(job.attempts == app.config['JOBS_MAX_ATTEMPTS'])
+        self.assertTrue(job.failed_at is not None and 'failing job' in job.last_error)
+        self.assertTrue(claim() is None)
+        # a job whose row is gone by the time it fails is simply dropped
+        db.session.delete(job)
+        enqueue('unit_test_vanishing')
+        db.session.commit()
+        self.assertTrue(run_pending() == 1 and Job.query.count() == 0)
+
+    # endregion
+
+    # region Pagination Tests
+
+    def test_paginate(self):
+        """
+        Walks forwards and backwards through a listing using the cursors of each page
+        """
+        threads = [Thread() for i in range(5)]
+        columns = (Thread.created_at, Thread.id)
+        first = paginate(Thread.query, columns, per_page=2)
+        self.assertTrue(first.items == threads[:2:-1])
+        self.assertTrue(first.has_next and not first.has_prev)
+        second = paginate(Thread.query, columns, after=first.next_cursor, per_page=2)
+        self.assertTrue(second.items == threads[2:0:-1])
+        self.assertTrue(second.has_next and second.has_prev)
+        last = paginate(Thread.query, columns, after=second.next_cursor, per_page=2)
+        self.assertTrue(last.items == threads[:1])
+        self.assertTrue(not last.has_next and last.has_prev)
+        back = paginate(Thread.query, columns, before=last.prev_cursor, per_page=2)
+        self.assertTrue(back.items == second.items)
+        self.assertTrue(paginate(Thread.query, columns, last=True, per_page=2).items == threads[1::-1])
+
+    def test_view_thread_pages(self):
+        """
+        Asserts that a thread's posts are split over pages, and that replying redirects to the last page
+        """
+        self.login('test_user', 'test_password')
+        app.config['PAGE_SIZE'] = 2
+        usr = User.query.filter_by(username='test_user').first()
+        thread = Thread(Post(usr, 'post 0', title='test_thread'))
+        for i in range(1, 3):
+            Post(usr, 'post {}'.format(i), thread=thread)
+        rv = self.app.get('/view_thread/{}'.format(thread.id))
+        self.assertTrue(b'post 1' in rv.data and b'post 2' not in rv.data)
+        rv = self.app.post('/view_thread/{}'.format(thread.id), data=dict(post='post 3'), follow_redirects=True)
+        self.assertTrue(b'post 3' in rv.data and b'post 1' not in rv.data)
+
+    # endregion
+
+    # region User Cache Tests
+
+    def test_user_cache(self):
+        """
+        The logged in user is loaded from the database once, then from the cache until their profile is edited
+        """
+        self.login('test_user', 'test_password')
+        self.app.get('/home')
+        stats = user_cache.stats()
+        with self.query_budget() as cached:
+            rv = self.app.get('/user/test_user')
+        self.assertTrue(user_cache.stats()['hits'] == stats['hits'] + 1)
+        self.assertTrue(b'test_user' in rv.data)
+        self.app.post('/edit_profile', data=dict(username='renamed_user', about_me='about'))
+        with self.query_budget() as reloaded:
+            rv = self.app.get('/user/renamed_user')
+        self.assertTrue(user_cache.stats()['misses'] == stats['misses'] + 1)
+        self.assertTrue(len(reloaded) == len(cached) + 1)
+        self.assertTrue(b'renamed_user' in rv.data)
+
+    # endregion
+
+    # region Database Tests
+
+    def test_split_pools(self):
+        """
+        With SQLITE_SPLIT_POOLS set, GET requests read through the read-only pool until they write, while other
+        requests always use the writer
+        """
+        app.config['SQLITE_SPLIT_POOLS'] = True
+        app.config['SQLITE_PRAGMAS'] = {'busy_timeout': 1000}
+        reader, writer = db.get_split_engines(app)
+        db.session.remove()
+        with app.test_request_context(method='GET'):
+            self.assertTrue(db.session.get_bind(clause=User.query.statement) is reader)
+            User('test_username', 'test_password', 'test_email')
+            self.assertTrue(db.session.get_bind(clause=User.query.statement) is reader)
+            self.assertTrue(User.query.first().username == 'test_username')
+            User.query.first().about_me = 'about'
+            db.session.flush()
+            self.assertTrue(db.session.get_bind(clause=User.query.statement) is writer)
+            db.session.remove()
+        with app.test_request_context(method='POST'):
+            self.assertTrue(db.session.get_bind(clause=User.query.statement) is writer)
+            db.session.remove()
+        with self.assertRaises(OperationalError):
+            reader.execute('DELETE FROM "User"')
+
+    def test_copy_database(self):
+        """
+        Copying the database to an empty one keeps every row and every foreign key between them
+        """
+        usr = User('test_username', 'test_password', 'test_email')
+        group = Group('test_group', 'test_group_description', user=usr)
+        thread = Thread(Post(usr, 'first post', title='test_thread'), topic=Topic('test_topic'))
+        group.threads.append(thread)
+        Post(User('test_replier', 'test_password', 'replier_email'), 'reply', thread=thread)
+        db.session.commit()
+        with tempfile.TemporaryDirectory() as directory:
+            target = 'sqlite:///' + os.path.join(directory, 'copy.db')
+            counts = copy_database(app.config['SQLALCHEMY_DATABASE_URI'], target, batch_size=1, echo=lambda line: None)
+            self.assertTrue(counts['Post'] == 2 and counts['User'] == 2 and counts['group_user'] == 1)
+            engine = create_engine(target)
+            self.assertTrue(engine.execute('PRAGMA foreign_key_check').fetchall() == [])
+            self.assertTrue(engine.execute('SELECT rowid FROM search_index WHERE search_index MATCH "reply"')
+                            .fetchall() == [(thread.posts[1].id,)])
+            self.assertTrue(engine.execute('SELECT "Thread".group_id FROM "Post" JOIN "Thread" '
+                                           'ON "Thread".id = "Post".thread_id').fetchall() == [(group.id,)] * 2)
+            with self.assertRaises(ValueError):
+                copy_database(app.config['SQLALCHEMY_DATABASE_URI'], target, echo=lambda line: None)
+            engine.dispose()
+
+    def test_upgrade(self):
+        """
+        Upgrading a database from before the migrations merges duplicate subscriptions, adds the missing indexes and
+        records the latest version, after which there is nothing left to apply
+        """
+        usr = User('test_username', 'test_password', 'test_email')
+        thread = Thread(Post(usr, 'first post', title='test_thread'))
+        db.session.execute('DROP INDEX uq_thread_subscriptions_user_id_thread_id')
+        db.session.execute('DROP INDEX ix_Post_author_id_timestamp')
+        db.session.execute(ThreadSubscriptions.__table__.insert(), dict(user_id=usr.username, thread_id=thread.id,
+                                                                       unseen=True))
+        db.session.execute(User.__table__.update(), dict(avatar_digest=None))
+        db.session.commit()
+        self.assertTrue(current_version(db.session.connection()) == 0)
+        self.assertTrue(upgrade(echo=lambda line: None) == [version for version, description, function in MIGRATIONS])
+        subscriptions = ThreadSubscriptions.query.filter_by(thread_id=thread.id).all()
+        self.assertTrue(len(subscriptions) == 1 and subscriptions[0].unseen)
+        indexes = [index['name'] for index in inspect(db.engine).get_indexes('Post')]
+        self.assertTrue('ix_Post_author_id_timestamp' in indexes)
+        self.assertTrue(User.query.filter_by(username='test_username').first().avatar_digest == email_digest('test_email'))
+        self.assertTrue(upgrade(echo=lambda line: None) == [])
+        self.assertTrue(current_version(db.session.connection()) == MIGRATIONS[-1][0])
+
+    def test_upgrade_baseline(self):
+        """
+        A database with the schema the website shipped with, before any of the migrations, is upgraded through every
+        one of them to the tables of the current models, with the feeds of its users filled in
+        """
+        folder = tempfile.mkdtemp()
+        path = os.path.join(folder, 'baseline.db')
+        baseline = sqlite3.connect(path)
+        baseline.executescript(BASELINE_SCHEMA)
+        baseline.executescript("""
+            INSERT INTO "User" VALUES (1, 'test_username', 'test_password', 'test_email', NULL);
+            INSERT INTO "User" VALUES (2, 'test_reader', 'test_password', 'test_reader_email', NULL);
+            INSERT INTO "Topic" VALUES (1, 'test_topic');
+            INSERT INTO "Thread" VALUES (1, 'test_thread', 1, NULL);
+            INSERT INTO "Post" VALUES (1, 'test_thread', 'first post', '2018-04-01 12:00:00', 1, 1);
+            INSERT INTO thread_subscriptions VALUES (1, 'test_username', 1, 0);
+            INSERT INTO thread_subscriptions VALUES (2, 'test_username', 1, 1);
+            INSERT INTO thread_subscriptions VALUES (3, 'test_reader', 1, 1);
+        """)
+        baseline.commit()
+        baseline.close()
+        upgraded = create_app(type('BaselineConfig', (TestConfig,), {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + path}),
+                              views=False)
+        # the session is shared by the thread, and must be bound to the baseline database's app
+        db.session.remove()
+        try:
+            with upgraded.app_context():
+                self.assertTrue(upgrade(echo=lambda line: None) ==
+                                [version for version, description, function in MIGRATIONS])
+                inspector = inspect(db.engine)
+                for table in db.metadata.sorted_tables:
+                    columns = {column['name'] for column in inspector.get_columns(table.name)}
+                    self.assertTrue(set(table.columns.keys()) <= columns, table.name)
+                thread = Thread.query.get(1)
+                self.assertTrue(thread.post_count == 1 and thread.updated_at is not None)
+                self.assertTrue(FeedEntry.query.filter_by(user_id=2, post_id=1).count() == 1)
+                self.assertTrue(ThreadSubscriptions.query.filter_by(user_id='test_username').count() == 1)
+                self.assertTrue(User.query.get(1).avatar_digest == email_digest('test_email'))
+                db.session.remove()
+                db.get_engine(upgraded).dispose()
+        finally:
+            shutil.rmtree(folder)
+
+    @contextmanager
+    def count_commits(self):
+        """
+        a convenience context manager that counts the commits of the session within it
+        the count is stored in the yielded list's first element
+        """
+        count = [0]
+
+        def after_commit(session):
+            count[0] += 1
+
+        event.listen(db.session, 'after_commit', after_commit)
+        try:
+            yield count
+        finally:
+            event.remove(db.session, 'after_commit', after_commit)
+
+    def test_batch(self):
+        """
+        Objects created in a batch are committed once at its end, the constructors' checks still hold,
+        and a batch that raises writes nothing
+        """
+        with self.count_commits() as commits:
+            with db.batch(chunk_size=2):
+                users = [User('batch_user_{}'.format(i), 'test_password', 'batch_{}'.format(i)) for i in range(5)]
+                self.assertTrue(users[3].id is not None and users[4].id is None)
+                thread = Thread(Post(users[0], 'first post', title='batch thread'), Topic.get('batch_topic'))
+                Post(users[1], 'reply', thread=thread)
+        self.assertTrue(commits[0] == 1)
+        self.assertTrue(User.query.count() == 5 and Thread.query.get(thread.id).post_count == 2)
+        with self.assertRaises(ValueError):
+            with db.batch():
+                User('rolled_back', 'test_password', 'rolled_back')
+                Post(users[0], 'no title', thread=Thread())
+        self.assertTrue(User.query.filter_by(username='rolled_back').first() is None)
+
+    def test_route_transaction(self):
+        """
+        Creating a thread commits its thread, topic and first post in a single transaction
+        """
+        self.login('test_user', 'test_password')
+        with self.count_commits() as commits:
+            self.app.post('/create_thread', data=dict(thread='one commit', topic='new_topic', post='first post'))
+        self.assertTrue(commits[0] == 1)
+        self.assertTrue(Thread.query.filter_by(name='one commit').first().topic.name == 'new_topic')
+
+    # endregion
+
+    # region Fragment Cache Tests
+
+    def test_fragment_cache(self):
+        """
+        Listing rows are rendered once and shared between users, with each user's own buttons filled in,
+        and are rendered again once a reply is posted
+        """
+        self.login('test_user', 'test_password')
+        author = User('test_author', 'test_password', 'author_email')
+        thread = Thread(Post(author, 'first post', title='cached_thread'), topic=Topic('test_topic'))
+        thread_id = thread.id
+        db.session.commit()
+        rv = self.app.get('/view_threads')
+        self.assertTrue(b'cached_thread' in rv.data and b'1 posts' in rv.data)
+        stats = fragment_cache.stats()
+        self.app.get('/sub_topic/test_topic')
+        rv = self.app.get('/view_topic/test_topic')
+        self.assertTrue(fragment_cache.stats()['hits'] == stats['hits'] + 1)
+        self.assertTrue(b'unsub_topic/test_topic?redir=/view_topic/test_topic' in rv.data)
+        self.app.post('/view_thread/{}'.format(thread_id), data=dict(post='reply'))
+        rv = self.app.get('/view_threads')
+        self.assertTrue(fragment_cache.stats()['misses'] == stats['misses'] + 1)
+        self.assertTrue(b'2 posts' in rv.data and b'redir=view_threads' in rv.data)
+
+    # endregion
+
+    # region Conditional Response Tests
+
+    def test_conditional_view_thread(self):
+        """
+        A client with the current ETag of a thread page gets a 304 response without the posts being queried,
+        until a reply is posted or the user subscribes
+        """
+        self.login('test_user', 'test_password')
+        author = User('test_author', 'test_password', 'author_email')
+        thread = Thread(Post(author, 'first post', title='test_thread'), topic=Topic('test_topic'))
+        url = '/view_thread/{}'.format(thread.id)
+        etag = self.app.get(url).headers['ETag']
+        with self.query_budget(2, '304'):
+            rv = self.app.get(url, headers={'If-None-Match': etag})
+        self.assertTrue(rv.status_code == 304 and rv.data == b'')
+        self.app.get('/sub_thread/{}'.format(thread.id))
+        rv = self.app.get(url, headers={'If-None-Match': etag})
+        self.assertTrue(rv.status_code == 200 and b'Unsubscribe' in rv.data)
+        etag = rv.headers['ETag']
+        self.app.post(url, data=dict(post='a new reply'))
+        rv = self.app.get(url, headers={'If-None-Match': etag})
+        self.assertTrue(rv.status_code == 200 and b'a new reply' in rv.data)
+
+    def test_conditional_listings(self):
+        """
+        Topic and group pages answer 304 until a thread is added to them
+        """
+        self.login('test_user', 'test_password')
+        usr = User.query.filter_by(username='test_user').first()
+        group = Group('test_group', 'test_group_description', user=usr)
+        topic = Topic('test_topic')
+        thread = Thread(Post(usr, 'first post', title='test_thread'), topic=topic)
+        group.threads.append(thread)
+        db.session.commit()
+        for url in ('/view_topic/test_topic', '/view_group/{}'.format(group.id)):
+            etag = self.app.get(url).headers['ETag']
+            self.assertTrue(self.app.get(url, headers={'If-None-Match': etag}).status_code == 304)
+            self.app.post('/view_group/{}'.format(group.id), data=dict(title='another thread', topic='test_topic',
+                                                                       post='first post'))
+            self.assertTrue(self.app.get(url, headers={'If-None-Match': etag}).status_code == 200)
+
+    # endregion
+
+    # region Search Tests
+
+    def test_search(self):
+        """
+        Posts are searchable once added to a thread, and threads of a group are only found by the group's members
+        """
+        member = User('test_member', 'test_password', 'member_email')
+        outsider = User('test_outsider', 'test_password', 'outsider_email')
+        group = Group('test_group', 'test_group_description', user=member)
+        public = Thread(Post(member, 'the quick brown fox', title='public thread'))
+        private = Thread(Post(member, 'the lazy brown dog', title='private thread'))
+        group.threads.append(private)
+        Post(outsider, 'jumps over', thread=public)
+        db.session.commit()
+        self.assertTrue({post for post, snippet in search(member, 'brown')} == {private.posts[0], public.posts[0]})
+        self.assertTrue([post for post, snippet in search(outsider, 'brown')] == public.posts[:1])
+        self.assertTrue([post for post, snippet in search(outsider, 'jump')] == public.posts[1:])
+        self.assertTrue('<mark>fox</mark>' in search(outsider, 'fox')[0][1])
+        self.assertTrue(search(outsider, '"*) OR') == [])
+        self.assertTrue([post for post, snippet in search_unindexed(outsider, 'brown', 1, 20)] == public.posts[:1])
+
+    def test_search_edits(self):
+        """
+        Editing a post or renaming its thread through the website updates the search index
+        """
+        self.login('test_user', 'test_password')
+        self.app.post('/create_thread', data=dict(thread='original name', topic='test_topic', post='first draft'))
+        thread_id, post_id = db.session.query(Post.thread_id, Post.id).first()
+        self.app.post('/view_thread/edit_post/{}'.format(post_id), data=dict(post='edited text'))
+        usr = User.query.filter_by(username='test_user').first()
+        self.assertTrue(len(search(usr, 'edited')) == 1 and len(search(usr, 'draft')) == 0)
+        self.app.post('/edit_thread/{}'.format(thread_id), data=dict(thread='renamed', topic='test_topic',
+                                                                      post='edited text'))
+        usr = User.query.filter_by(username='test_user').first()
+        self.assertTrue(len(search(usr, 'renamed')) == 1)
+        rv = self.app.get('/search?q=renamed')
+        self.assertTrue(b'<mark>renamed</mark>' in rv.data)
+
+    # endregion
+
+    # region Query Count Tests
+
+    def test_listing_statement_counts(self):
+        """
+        Renders every listing page over ten threads by different users and asserts an upper bound on the number of
+        SQL statements each one runs, so a lazy load per row shows up as a failure
+        """
+        self.login('test_user', 'test_password')
+        usr = User.query.filter_by(username='test_user').first()
+        group = Group('test_group', 'test_group_description', user=usr)
+        for i in range(10):
+            author = User('author_{}'.format(i), 'test_password', 'email_{}'.format(i))
+            thread = Thread(Post(author, 'first post', title='thread_{}'.format(i)))
+            thread.add_topic(Topic('topic_{}'.format(i)))
+            if i % 2:
+                group.threads.append(thread)
+            thread.subbed.append(usr)
+            FeedEntry.rebuild(usr)
+            Post(User('replier_{}'.format(i), 'test_password', 'replier_email_{}'.format(i)), 'reply', thread=thread)
+            usr.topics.append(thread.topic)
+        db.session.commit()
+        budgets = {
+            '/home': 3,
+            '/view_threads': 3,
+            '/view_thread/{}'.format(thread.id): 4,
+            '/view_topic/topic_0': 4,
+            '/view_group/{}'.format(group.id): 5,
+            '/alerts': 2,
+            '/subscriptions': 3,
+            '/user/author_0': 3,
+            '/groups': 2,
+        }
+        for url, budget in budgets.items():
+            with self.query_budget(budget, url):
+                rv = self.app.get(url)
+            self.assertTrue(rv.status_code == 200)
+
+    # endregion
+
+    # region Template Cache Tests
+
+    def test_compile_templates(self):
+        """
+        Compiling the templates fills the bytecode cache with every template, including Flask-Bootstrap's
+        """
+        folder = tempfile.mkdtemp()
+        cache = app.jinja_env.bytecode_cache
+        app.jinja_env.bytecode_cache = bytecode_cache(dict(TEMPLATE_CACHE_FOLDER=folder))
+        app.jinja_env.cache.clear()
+        try:
+            names = compile_templates()
+            self.assertTrue('login.html' in names and 'bootstrap/base.html' in names)
+            self.assertTrue(len(os.listdir(folder)) == len(names))
+        finally:
+            app.jinja_env.bytecode_cache = cache
+            app.jinja_env.cache.clear()
+            shutil.rmtree(folder)
+
+    # endregion
+
+    # region Avatar Tests
+
+    def test_avatar(self):
+        """
+        Avatars are local identicons addressed by the stored digest of the user's email, drawn once and cached on disk
+        at the sizes the templates use
+        """
+        usr = User('test_username', 'test_password', 'Test@Example.com')
+        folder = tempfile.mkdtemp()
+        app.config['AVATAR_FOLDER'] = folder
+        try:
+            with app.test_request_context():
+                url = usr.avatar(64)
+            self.assertTrue(url == '/avatar/{}/64'.format(email_digest('test@example.com')))
+            rv = self.app.get(url)
+            self.assertTrue(rv.status_code == 200 and rv.mimetype == 'image/png' and rv.data.startswith(b'\x89PNG'))
+            self.assertTrue('immutable' in rv.headers['Cache-Control'])
+            rv.close()
+            self.assertTrue(os.listdir(folder) == ['{}-64.png'.format(usr.avatar_digest)])
+            self.assertTrue(self.app.get('/avatar/not-a-digest/64').status_code == 404)
+            self.assertTrue(self.app.get('/avatar/{}/65'.format(usr.avatar_digest)).status_code == 404)
+            # a digest that is no user's is drawn but not written, so the folder can not be filled from outside
+            rv = self.app.get('/avatar/{}/128'.format(email_digest('someone@example.com')))
+            self.assertTrue(rv.status_code == 200 and rv.data.startswith(b'\x89PNG'))
+            rv.close()
+            self.assertTrue(len(os.listdir(folder)) == 1)
+        finally:
+            app.config['AVATAR_FOLDER'] = Config.AVATAR_FOLDER
+            shutil.rmtree(folder)
+
+    # endregion
+
+    # region Asset Tests
+
+    def test_build_assets(self):
+        """
+        Built bundles are linked by the login page and served with immutable cache headers,
+        while the source files are linked until the bundles are built
+        """
+        folder = tempfile.mkdtemp()
+        app.config['ASSETS_FOLDER'] = folder
+        try:
+            self.assertTrue(b'/static/vendor/jquery/jquery-3.2.1.min.js' in self.app.get('/login').data)
+            manifest = build_assets()
+            self.assertTrue(sorted(manifest) == sorted(BUNDLES))
+            page = self.app.get('/login').data.decode('utf-8')
+            self.assertTrue('/assets/' + manifest['auth.css'] in page and '/static/vendor' not in page)
+            rv = self.app.get('/assets/' + manifest['auth.css'])
+            self.assertTrue(rv.status_code == 200 and 'immutable' in rv.headers['Cache-Control'])
+            css = rv.data.decode('utf-8')
+            rv.close()
+            # only the icons the templates use are kept, and fonts are still found from /assets
+            self.assertTrue('.zmdi-accounts:before' in css and '.zmdi-airplane:before' not in css)
+            self.assertTrue("url('../static/fonts/poppins/Poppins-Regular.ttf')" in css and '/*' not in css)
+        finally:
+            app.config['ASSETS_FOLDER'] = Config.ASSETS_FOLDER
+            shutil.rmtree(folder)
+
+    def test_minify_js(self):
+        """
+        Comments are removed from scripts wherever they start on a line, while strings and line breaks are kept
+        """
+        script = "/* x */ var a = 1;\nf(); /* start\nof a comment\n*/ g();\n    // a line\nvar s = '/* // */';\n"
+        self.assertTrue(minify_js(script) == "var a = 1;\nf();\ng();\nvar s = '/* // */';")
+
+    def test_precompressed_assets(self):
+        """
+        Bundles are sent gzip compressed to clients that accept it, and answer If-None-Match and Range requests
+        """
+        folder = tempfile.mkdtemp()
+        app.config['ASSETS_FOLDER'] = folder
+        try:
+            url = '/assets/' + build_assets()['auth.js']
+            rv = self.app.get(url)
+            plain = rv.data
+            rv.close()
+            rv = self.app.get(url, headers={'Accept-Encoding': 'gzip'})
+            self.assertTrue(rv.headers['Content-Encoding'] == 'gzip' and 'Accept-Encoding' in rv.headers['Vary'])
+            self.assertTrue(gzip.decompress(rv.data) == plain and len(rv.data) < len(plain))
+            etag = rv.headers['ETag']
+            rv.close()
+            rv = self.app.get(url, headers={'Accept-Encoding': 'gzip', 'If-None-Match': etag})
+            self.assertTrue(rv.status_code == 304)
+            rv = self.app.get(url, headers={'Range': 'bytes=0-99'})
+            self.assertTrue(rv.status_code == 206 and rv.data == plain[:100])
+            rv.close()
+        finally:
+            app.config['ASSETS_FOLDER'] = Config.ASSETS_FOLDER
+            shutil.rmtree(folder)
+
+    # endregion
+
+    # region App Factory Tests
+
+    def test_create_app(self):
+        """
+        Apps are built independently of each other, and an app built without its views only serves files
+        """
+        worker = create_app(TestConfig, views=False)
+        self.assertTrue(worker is not app and 'threads.view_thread' not in worker.view_functions)
+        self.assertTrue({'static', 'asset', 'avatar'} <= set(worker.view_functions))
+        with app.test_request_context():
+            self.assertTrue(url_for('threads.view_thread', id=1) == '/view_thread/1')
+            self.assertTrue(url_for('auth.login') == '/login')
+
+    # endregion
+
+    # region Metrics Tests
+
+    def test_metrics(self):
+        """
+        Requests are recorded by endpoint with their statements, SQL and template time and size, and served at /metrics
+        """
+        self.login('test_user', 'test_password')
+        app.extensions['metrics'] = Metrics()
+        with self.query_budget() as statements:
+            rv = self.app.get('/view_threads')
+        self.app.get('/no_such_page')
+        lines = self.app.get('/metrics').get_data(as_text=True).splitlines()
+        values = {line.rsplit(' ', 1)[0]: float(line.rsplit(' ', 1)[1]) for line in lines if not line.startswith('#')}
+        endpoint = '{endpoint="threads.view_threads"}'
+        self.assertTrue(values['cs2005_sql_statements_sum' + endpoint] == len(statements))
+        self.assertTrue(values['cs2005_sql_statements_count' + endpoint] == 1)
+        self.assertTrue(values['cs2005_sql_duration_seconds_sum' + endpoint] > 0)
+        self.assertTrue(values['cs2005_template_duration_seconds_sum' + endpoint] > 0)
+        self.assertTrue(values['cs2005_response_size_bytes_sum' + endpoint] == len(rv.data))
+        self.assertTrue(values['cs2005_request_duration_seconds_bucket{endpoint="threads.view_threads",le="+Inf"}'] == 1)
+        self.assertTrue(values['cs2005_responses_total{endpoint="unmatched",status="404"}'] == 1)
+        self.assertTrue('cs2005_user_cache_hits_total' in values)
+
+    # endregion
+
+    # region Repeated Statement Tests
+
+    def test_repeated_statement_warning(self):
+        """
+        A lazy load in a template loop is logged once, with the template line running it, past QUERY_REPEAT_THRESHOLD
+        """
+        for i in range(4):
+            Post(User('author_{}'.format(i), 'test_password', 'email_{}'.format(i)), 'post {}'.format(i))
+        development = create_app(type('RepeatConfig', (TestConfig,), {'QUERY_REPEAT_THRESHOLD': 2}))
+        with development.test_request_context('/'):
+            development.preprocess_request()
+            db.session.expunge_all()
+            with self.assertLogs(development.logger, level='WARNING') as logs:
+                render_template_string('{% for post in posts %}\n{{ post.author.username }}{% endfor %}',
+                                       posts=Post.query.all())
+        self.assertTrue(len(logs.output) == 1)
+        self.assertTrue('line 2' in logs.output[0] and 'FROM "User"' in logs.output[0])
+
+    # endregion
+
+    # region Live Update Tests
+
+    def test_live_posts(self):
+        """
+        A thread's event stream sends the posts after the reader's latest, then each reply as it is committed, and
+        processes turn away streams past LIVE_MAX_CONNECTIONS
+        """
+        self.login('test_user', 'test_password')
+        app.extensions['live'] = Hub(app)
+        app.config['LIVE_KEEPALIVE'] = 0.1
+        usr = User.query.filter_by(username='test_user').first()
+        thread_id = Thread(Post(usr, 'post 0', title='test_thread')).id
+        first_id = Post.query.one().id
+        rv = self.app.get('/view_thread/{}'.format(thread_id))
+        self.assertTrue('last_event_id={}'.format(first_id).encode() in rv.data)
+        rv = self.app.get('/view_thread/{}/events'.format(thread_id), headers={'Last-Event-ID': '0'})
+        self.assertTrue(rv.mimetype == 'text/event-stream')
+        events = iter(rv.response)
+        self.assertTrue(next(events).startswith(b'retry: '))
+        event = next(events).decode()
+        self.assertTrue('id: {}\n'.format(first_id) in event and 'post 0' in event)
+        # replies come from other requests, which have sessions of their own
+        reply = threading.Thread(target=self.app.post, args=('/view_thread/{}'.format(thread_id),),
+                                 kwargs=dict(data=dict(post='post 1')))
+        reply.start()
+        reply.join()
+        for i in range(50):
+            event = next(events).decode()
+            if not event.startswith(':'):
+                break
+        self.assertTrue(event.startswith('event: post\n') and 'post 1' in event and 'post 0' not in event)
+        rv.close()
+        self.assertTrue(not app.extensions['live'].listeners)
+        app.config['LIVE_MAX_CONNECTIONS'] = 0
+        self.assertTrue(self.app.get('/view_thread/{}/events'.format(thread_id)).status_code == 503)
+        # a stopping server closes its hub, ending the streams and refusing new ones
+        app.config['LIVE_MAX_CONNECTIONS'] = 1
+        app.extensions['live'].close()
+        self.assertTrue(app.extensions['live'].subscribe(thread_id) is None)
+
+    def test_live_private_thread(self):
+        """
+        Only the members of a thread's group may open the thread's event stream
+        """
+        self.login('test_user', 'test_password')
+        app.extensions['live'] = Hub(app)
+        usr = User.query.filter_by(username='test_user').first()
+        member = User('test_member', 'test_password', 'member_email')
+        group = Group('test_group', 'test_group_description', user=member)
+        thread = Thread(Post(member, 'private post', title='test_thread'))
+        group.threads.append(thread)
+        db.session.commit()
+        url = '/view_thread/{}/events'.format(thread.id)
+        self.assertTrue(self.app.get(url).status_code == 404)
+        group.users.append(usr)
+        db.session.commit()
+        rv = self.app.get(url)
+        self.assertTrue(rv.status_code == 200 and rv.mimetype == 'text/event-stream')
+        rv.close()
+
+    def test_live_max_age(self):
+        """
+        A stream whose posts take longer to render than LIVE_MAX_AGE ends normally once they are sent
+        """
+        app.extensions['live'] = Hub(app)
+        app.config['LIVE_MAX_AGE'] = 0.05
+        usr = User('test_username', 'test_password', 'test_email')
+        thread_id = Thread(Post(usr, 'post 0', title='test_thread')).id
+
+        def render(post_ids):
+            time.sleep(0.1)
+            return [(post_id, 'post {}'.format(post_id)) for post_id in post_ids]
+
+        with app.test_request_context():
+            response = live_stream(thread_id, 0, render)
+            events = list(response.response)
+            response.close()
+        self.assertTrue(len(events) == 2 and events[1].startswith('event: post\n'))
+        self.assertTrue(not app.extensions['live'].listeners)
+
+    # endregion
+
+    # region Profiler Tests
+
+    def test_profile_request(self):
+        """
+        An allowed user's ?profile request writes its pstats and stacks, listed at /profiles, up to PROFILE_LIMIT
+        """
+        directory = tempfile.mkdtemp()
+        profiling = create_app(type('ProfileConfig', (TestConfig,), {
+            'PROFILE_USERS': ('test_user',), 'PROFILE_FOLDER': directory, 'PROFILE_LIMIT': 2,
+            'WTF_CSRF_ENABLED': False}))
+        client = profiling.test_client()
+        try:
+            User(username='test_user', email='test_email', password=generate_password_hash('test_password'))
+            User(username='other_user', email='other_email', password=generate_password_hash('test_password'))
+            client.post('/login', data=dict(username='other_user', password='test_password'))
+            self.assertTrue('X-Profile' not in client.get('/view_threads?profile=1').headers)
+            self.assertTrue(client.get('/profiles').status_code == 404)
+            client.get('/logout')
+            client.post('/login', data=dict(username='test_user', password='test_password'))
+            name = client.get('/view_threads?profile=1').headers['X-Profile']
+            self.assertTrue(sorted(os.listdir(directory)) == [name + '.collapsed', name + '.json', name + '.pstats'])
+            self.assertTrue(pstats.Stats(os.path.join(directory, name + '.pstats')).total_calls > 0)
+            self.assertTrue('X-Profile' not in client.get('/view_threads').headers)
+            self.assertTrue(client.get('/home', headers={'X-Profile': '1'}).headers['X-Profile'] != 'skipped')
+            self.assertTrue(client.get('/home?profile=1').headers['X-Profile'] == 'skipped')
+            page = client.get('/profiles').get_data(as_text=True)
+            self.assertTrue(name + '.pstats' in page and '/view_threads?profile=1' in page)
+            self.assertTrue(client.get('/profiles/' + name + '.collapsed').status_code == 200)
+        finally:
+            shutil.rmtree(directory)
+
+    # endregion
+
+    # region Server Tests
+
+    def test_server_reload(self):
+        """
+        server.py answers every request while its workers are reloaded, and exits once the workers have stopped
+        """
+        server = subprocess.Popen([sys.executable, 'server.py', '--config', 'test', '--bind', '127.0.0.1:0',
+                                   '--workers', '2', '--threads', '2'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                  stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        lines = []
+        statuses = []
+        reloading = threading.Event()
+
+        def read():
+            for line in server.stdout:
+                lines.append(line)
+
+        def request():
+            while not reloading.is_set():
+                try:
+                    with urlopen(url) as response:
+                        statuses.append(response.status)
+                except OSError as error:
+                    statuses.append(error)
+
+        def wait_for(text, count=1):
+            for i in range(300):
+                if sum(text in line for line in lines) >= count:
+                    return
+                time.sleep(0.1)
+            self.fail('server.py did not log {!r}:\n{}'.format(text, ''.join(lines)))
+
+        try:
+            url = re.search(r'Listening on (\S+)', server.stdout.readline()).group(1) + '/login'
+            threading.Thread(target=read, daemon=True).start()
+            wait_for('is ready', 2)
+            clients = [threading.Thread(target=request) for i in range(4)]
+            for client in clients:
+                client.start()
+            server.send_signal(signal.SIGHUP)
+            wait_for('Reloaded')
+            reloading.set()
+            for client in clients:
+                client.join()
+            server.send_signal(signal.SIGTERM)
+            self.assertTrue(server.wait(30) == 0)
+        finally:
+            reloading.set()
+            if server.poll() is None:
+                server.kill()
+            server.stdout.close()
+        self.assertTrue(statuses and all(status == 200 for status in statuses), statuses[-5:])
+
+    # endregion
+
+    # region Data Generator Tests
+
+    def test_generate_data(self):
+        """
+        Generated threads hold the summary of their posts, every poster is subscribed, and feeds and search are filled
+        """
+        directory = tempfile.mkdtemp()
+        uri = 'sqlite:///' + os.path.join(directory, 'generated.db')
+        try:
+            counts = generate_data(uri, users=30, groups=3, topics=4, threads=40, posts=400, echo=lambda line: None)
+            self.assertTrue(counts['User'] == 30 and counts['Thread'] == 40 and counts['Post'] == 400)
+            self.assertTrue(counts['feed'] > 0)
+            engine = create_engine(uri)
+            mismatched = engine.execute('SELECT COUNT(*) FROM "Thread" WHERE post_count != '
+                                        '(SELECT COUNT(*) FROM "Post" WHERE thread_id = "Thread".id) OR last_post_at != '
+                                        '(SELECT MAX(timestamp) FROM "Post" WHERE thread_id = "Thread".id)').scalar()
+            unsubscribed = engine.execute('SELECT COUNT(*) FROM "Post" JOIN "User" ON "User".id = "Post".author_id '
+                                          'WHERE NOT EXISTS (SELECT 1 FROM thread_subscriptions WHERE thread_id = '
+                                          '"Post".thread_id AND user_id = "User".username)').scalar()
+            self.assertTrue(mismatched == 0 and unsubscribed == 0)
+            self.assertTrue(engine.execute('SELECT COUNT(*) FROM search_index').scalar() == 400)
+            self.assertTrue(current_version(engine.connect()) == MIGRATIONS[-1][0])
+            with self.assertRaises(ValueError):
+                generate_data(uri, users=1, threads=1, posts=1, echo=lambda line: None)
+            engine.dispose()
+        finally:
+            shutil.rmtree(directory)
+
+    # endregion
+
 
 if __name__ == '__main__':
     print("Testing")
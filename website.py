@@ -1 +1,9 @@
-from app import app
+"""
+website.py
+Creates the app served by `flask run`, Flask's development server, once FLASK_APP=website.py is exported
+In production the website is served by server.py instead, whose worker processes create their own apps
+"""
+
+from app import create_app
+
+app = create_app()
@@ -0,0 +1,34 @@
+"""
+worker.py
+Runs the background jobs enqueued by the website, such as notifying subscribers and filling feeds, see app/jobs.py
+The worker needs no broker; it reads jobs from the website's own database, so any number of workers can be started
+    python worker.py [--threads N]
+    python worker.py --drain
+--threads sets the size of the worker's thread pool, which defaults to JOBS_WORKERS in app/config.py
+--drain runs every available job once and then exits, which is useful from cron or after a bulk import
+"""
+
+import argparse
+import signal
+from app import create_app
+from app.jobs import Worker, run_pending
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs the background jobs of the cs2005 website')
+    parser.add_argument('--threads', type=int, default=None, help='number of jobs to run at once')
+    parser.add_argument('--drain', action='store_true', help='run the available jobs, then exit')
+    args = parser.parse_args()
+    # the worker serves no pages, so the views are left out
+    app = create_app(views=False)
+    if args.drain:
+        with app.app_context():
+            print('Ran {} job(s)'.format(run_pending()))
+    else:
+        with app.app_context():
+            worker = Worker(threads=args.threads)
+        # finish the jobs in progress before exiting
+        signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+        signal.signal(signal.SIGINT, lambda signum, frame: worker.stop())
+        worker.start()
+        print('Running jobs on {} thread(s)'.format(worker.threads))
+        worker.join()